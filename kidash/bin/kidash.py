@@ -21,11 +21,25 @@
 #
 
 import argparse
+import contextlib
 import logging
+import sys
 
 from requests import HTTPError
 
-from kidash.kidash import import_dashboard, export_dashboard, list_dashboards
+from kidash.kidash import (import_panel, export_dashboard, list_dashboards,
+                           export_changed_dashboards, backup_kibana, restore_kibana, convert_panel_files,
+                           IndexPatternFields)
+from kidash.panels import STDIN_NAME, create_bundle, read_panels
+
+# The rest of modules are imported by the actions and options which use them,
+# so the most common runs do not pay for the import of all of them
+
+ELASTICSEARCH_BACKEND = "elasticsearch"
+KIBANA_BACKEND = "kibana"
+
+# Formats of the metrics written by `kidash.stats`
+STATS_FORMATS = ["json", "prometheus"]
 
 
 def main():
@@ -34,16 +48,137 @@ def main():
 
     config_logging(args.debug)
 
+    if args.serve:
+        from kidash.daemon import serve
+        try:
+            serve(args.socket_file, run_request)
+        except RuntimeError as runtime_error:
+            logging.error(runtime_error)
+    else:
+        run(args)
+
+
+def run_request(argv):
+    """Run the command line of a client of the daemon and return its exit code"""
+
     try:
-        if args.import_file:
-            import_dashboard(args.elastic_url, args.kibana_url, args.import_file, args.kibana_index,
-                             args.data_sources, args.add_vis_studies, args.strict)
+        args = get_params(argv)
+        if args.import_files and STDIN_NAME in args.import_files:
+            logging.error("The standard input can not be read by the daemon")
+            return 1
+        if args.watch_dir or args.serve:
+            logging.error("--watch and --serve can not be run by the daemon")
+            return 1
+        run(args)
+    except SystemExit as system_exit:
+        if isinstance(system_exit.code, str):
+            logging.error(system_exit.code)
+            return 1
+        return system_exit.code or 0
+
+    return 0
+
+
+def run(args):
+
+    mirror = None
+    journal = None
+    contexts = contextlib.ExitStack()
+
+    try:
+        if args.record_file:
+            from kidash.cassette import record_requests
+            contexts.enter_context(record_requests(args.record_file, args.redact_fields))
+        elif args.replay_file:
+            from kidash.cassette import replay_requests
+            contexts.enter_context(replay_requests(args.replay_file, args.latency_scale))
+        if args.stats_file:
+            from kidash.stats import collect_stats
+            contexts.enter_context(collect_stats(args.stats_file, args.stats_format))
+        if args.profile_dir:
+            from kidash.profiling import profile_run
+            contexts.enter_context(profile_run(args.profile_dir, args.profile_function))
+
+        if args.mirror_file and not args.sync_mirror:
+            from kidash.mirror import KibanaMirror
+            mirror = KibanaMirror(args.mirror_file)
+
+        if args.manifest_file:
+            from kidash.manifest import run_manifest
+            if not run_manifest(args.manifest_file):
+                sys.exit(1)
+        elif args.sync_mirror:
+            from kidash.mirror import sync_mirror
+            sync_mirror(args.elastic_url, args.mirror_file, args.kibana_index)
+        elif args.backend == KIBANA_BACKEND:
+            run_kibana_backend(args)
+        elif args.import_files and args.targets:
+            from kidash.fanout import import_targets, parse_target
+            targets = [parse_target(target, args.kibana_index, args.kibana_url) for target in args.targets]
+            panels = []
+            for import_file in args.import_files:
+                panels.extend(read_panels(import_file, args.data_sources, args.add_vis_studies))
+            results = import_targets(targets, panels, args.data_sources, args.add_vis_studies,
+                                     args.strict, args.fields_file)
+            if any('error' in result for result in results):
+                sys.exit(1)
+        elif args.import_files:
+            index_fields = IndexPatternFields(args.elastic_url, args.fields_file)
+            if args.plan:
+                # Nothing is imported, so the journal is neither read nor started again
+                from kidash.plan import plan_import
+                plan_import(args.elastic_url, args.kibana_url, args.import_files, args.kibana_index,
+                            args.data_sources, args.add_vis_studies, index_fields)
+            else:
+                if args.journal_file:
+                    from kidash.journal import ImportJournal
+                    journal = ImportJournal(args.journal_file, args.resume)
+                for import_file in args.import_files:
+                    for panel_name, panel in read_panels(import_file, args.data_sources, args.add_vis_studies):
+                        import_panel(args.elastic_url, args.kibana_url, panel, panel_name, args.kibana_index,
+                                     args.data_sources, args.add_vis_studies, args.strict, index_fields, journal)
+            if args.fields_file:
+                index_fields.save()
+        elif args.watch_dir:
+            from kidash.watch import watch_panels
+            index_fields = IndexPatternFields(args.elastic_url, args.fields_file)
+            watch_panels(args.elastic_url, args.kibana_url, args.watch_dir, args.kibana_index,
+                         args.data_sources, args.add_vis_studies, index_fields)
+            if args.fields_file:
+                index_fields.save()
+        elif args.diff_files:
+            from kidash.diff import diff_panel_files
+            diff_panel_files(args.elastic_url, args.diff_files, args.kibana_index,
+                             args.data_sources, args.add_vis_studies)
         elif args.export_file:
             if args.dashboard:
                 export_dashboard(args.elastic_url, args.dashboard, args.export_file,
-                                 args.kibana_index, args.split_index_patterns)
+                                 args.kibana_index, args.split_index_patterns, mirror, args.strip_fields)
+        elif args.export_dir:
+            export_changed_dashboards(args.elastic_url, args.export_dir, args.kibana_index, args.state_file)
         elif args.list:
-            list_dashboards(args.elastic_url, args.kibana_index)
+            list_dashboards(args.elastic_url, args.kibana_index, mirror)
+        elif args.dependents:
+            from kidash.graph import list_dependents
+            list_dependents(args.elastic_url, args.dependents, args.kibana_index, mirror)
+        elif args.dependencies:
+            from kidash.graph import list_dependencies
+            list_dependencies(args.elastic_url, args.dependencies, args.kibana_index, mirror)
+        elif args.orphans:
+            from kidash.graph import list_orphans
+            list_orphans(args.elastic_url, args.kibana_index, mirror)
+        elif args.delete:
+            from kidash.graph import delete_dashboards
+            delete_dashboards(args.elastic_url, args.delete, args.kibana_index, args.dry_run)
+        elif args.backup_file:
+            backup_kibana(args.elastic_url, args.backup_file, args.kibana_index)
+        elif args.restore_file:
+            restore_kibana(args.elastic_url, args.kibana_url, args.restore_file, args.kibana_index)
+        elif args.bundle_files:
+            create_bundle(args.bundle_files, args.output_file)
+        elif args.convert_files:
+            convert_panel_files(args.convert_files, args.output_file, args.target_version,
+                                args.data_sources, args.add_vis_studies, args.fields_file)
 
     except HTTPError as http_error:
         res = http_error.response
@@ -56,6 +191,38 @@ def main():
     except RuntimeError as runtime_error:
         logging.error(runtime_error)
 
+    finally:
+        contexts.close()
+        if mirror:
+            mirror.close()
+        if journal:
+            journal.close()
+
+
+def run_kibana_backend(args):
+    """Run the actions supported by the saved objects API of Kibana"""
+
+    from kidash.savedobjects import (KibanaSavedObjects, backup_saved_objects, export_dashboard_saved_objects,
+                                     import_panel_saved_objects, restore_saved_objects)
+
+    saved_objects = KibanaSavedObjects(args.kibana_url)
+
+    if args.import_files:
+        index_fields = IndexPatternFields(args.elastic_url, args.fields_file)
+        for import_file in args.import_files:
+            for panel_name, panel in read_panels(import_file, args.data_sources, args.add_vis_studies):
+                import_panel_saved_objects(saved_objects, panel, panel_name, args.elastic_url, args.data_sources,
+                                           args.add_vis_studies, args.strict, index_fields)
+        if args.fields_file:
+            index_fields.save()
+    elif args.export_file:
+        export_dashboard_saved_objects(saved_objects, args.dashboard, args.export_file,
+                                       args.split_index_patterns, args.strip_fields)
+    elif args.backup_file:
+        backup_saved_objects(saved_objects, args.backup_file)
+    elif args.restore_file:
+        restore_saved_objects(saved_objects, args.restore_file)
+
 
 def get_params_parser_create_dash():
     """Parse command line arguments"""
@@ -70,30 +237,141 @@ def get_params_parser_create_dash():
     parser.add_argument("--split-index-patterns", action='store_true',
                         help="Kibana index patterns are exported in different files")
     parser.add_argument("--export", dest="export_file", help="file with the dashboard exported")
+    parser.add_argument("--no-fields", dest="strip_fields", action='store_true',
+                        help="export the index patterns without their fields, which are rebuilt when importing them")
+    parser.add_argument("--export-changed", dest="export_dir",
+                        help="directory in which to export the dashboards changed since the last run")
+    parser.add_argument("--state-file", dest="state_file",
+                        help="file with the state of the last incremental export (in the export directory by default)")
 
-    parser.add_argument("--import", dest="import_file", help="file with the dashboard/index pattern to be imported")
+    parser.add_argument("--import", dest="import_files", nargs='+', metavar="FILE",
+                        help="files with the dashboards/index patterns to be imported")
+    parser.add_argument("--plan", action='store_true',
+                        help="show the objects, bytes and requests the import would take without writing anything")
+    parser.add_argument("--watch", dest="watch_dir",
+                        help="directory with panel files to import each time they change, until interrupted")
+    parser.add_argument("--diff", dest="diff_files", nargs='+', metavar="FILE",
+                        help="files with dashboards/index patterns to compare with the ones in Kibana")
+    parser.add_argument("--fields-file", dest="fields_file",
+                        help="file with the fields of the index patterns, updated on import and read on --convert")
+    parser.add_argument("--targets", nargs='+', metavar="URL[,INDEX[,KIBANA_URL]]",
+                        help="Elasticsearch URLs (and Kibana indices and URLs) in which to import the panels at once")
+    parser.add_argument("--journal", dest="journal_file",
+                        help="file in which to record the items imported, to resume the import if it is interrupted")
+    parser.add_argument("--resume", action='store_true',
+                        help="skip the items already imported according to the journal")
     parser.add_argument("--strict", action="store_true", help="check release date and only import newer panels")
     parser.add_argument("--kibana", dest="kibana_index", default=".kibana", help="Kibana index name (.kibana default)")
     parser.add_argument("--list", action='store_true', help="list available dashboards")
+    parser.add_argument("--dependents", metavar="TYPE:ID",
+                        help="list the objects which use the given one (e.g. index-pattern:git)")
+    parser.add_argument("--dependencies", metavar="TYPE:ID",
+                        help="list the objects used by the given one (e.g. dashboard:Overview)")
+    parser.add_argument("--orphans", action='store_true',
+                        help="list the visualizations, searches and index patterns not used by any object")
+    parser.add_argument("--delete", nargs='+', metavar="DASHBOARD",
+                        help="ids or patterns of the dashboards to delete, together with the objects only used by them")
+    parser.add_argument("--dry-run", dest="dry_run", action='store_true',
+                        help="list the objects which would be deleted without deleting them")
+    parser.add_argument("--mirror", dest="mirror_file",
+                        help="local mirror of the Kibana index used to export and list dashboards")
+    parser.add_argument("--sync-mirror", dest="sync_mirror", action='store_true',
+                        help="synchronize the local mirror with the Kibana index")
+    parser.add_argument("--backup", dest="backup_file", help="file in which to store all the objects of the Kibana index")
+    parser.add_argument("--restore", dest="restore_file", help="file with a backup of the Kibana index to be restored")
+    parser.add_argument("--convert", dest="convert_files", nargs='+', metavar="FILE",
+                        help="files with dashboards/index patterns to convert to the documents to restore")
+    parser.add_argument("--bundle", dest="bundle_files", nargs='+', metavar="FILE",
+                        help="files with dashboards/index patterns to store in a bundle, which can be imported")
+    parser.add_argument("--target-version", dest="target_version",
+                        help="Elasticsearch version the panels are converted for (e.g. 6.8)")
+    parser.add_argument("--output", dest="output_file", help="file in which to store the converted documents")
+    parser.add_argument("--manifest", dest="manifest_file",
+                        help="JSON file with a list of jobs (import, export, list...) to run in a single process")
+    parser.add_argument("--record", dest="record_file",
+                        help="file in which to store the requests sent and their responses, to replay them")
+    parser.add_argument("--redact", dest="redact_fields", nargs='+', metavar="FIELD",
+                        help="JSON fields whose values are not stored by --record")
+    parser.add_argument("--replay", dest="replay_file",
+                        help="file with requests stored by --record, whose responses are returned instead of sending them")
+    parser.add_argument("--latency-scale", dest="latency_scale", type=float, metavar="FACTOR",
+                        help="factor applied to the recorded latencies by --replay (default 1, 0 to not wait)")
+    parser.add_argument("--stats", dest="stats_file",
+                        help="file in which to write the metrics of the run (time of each phase, requests and objects)")
+    parser.add_argument("--stats-format", dest="stats_format", choices=STATS_FORMATS,
+                        default=STATS_FORMATS[0], help="format of the --stats file (json, default, or prometheus)")
+    parser.add_argument("--profile", dest="profile_dir",
+                        help="directory in which to save the CPU profile and the memory allocations of the run")
+    parser.add_argument("--profile-function", dest="profile_function", metavar="FUNCTION",
+                        help="profile only the calls to this function (feed_dashboard or fetch_dashboard)")
+    parser.add_argument("--serve", action='store_true',
+                        help="run as a daemon which serves the requests of kidash-client on a Unix socket")
+    parser.add_argument("--socket", dest="socket_file", help="Unix socket of the daemon")
     parser.add_argument('-g', '--debug', dest='debug', action='store_true')
     parser.add_argument("--data-sources", nargs='+', dest="data_sources", help="Data sources to be included")
     parser.add_argument("--add-vis-studies", dest="add_vis_studies",
                         action='store_true', help="Include visualizations for studies")
+    parser.add_argument("--backend", choices=[ELASTICSEARCH_BACKEND, KIBANA_BACKEND], default=ELASTICSEARCH_BACKEND,
+                        help="write and read the saved objects in the Kibana index (elasticsearch, default) "
+                             "or using the saved objects API of Kibana (kibana)")
     parser.add_argument("--kibana-url", dest="kibana_url", default="http://localhost:5601",
                         help="Kibana URL (http://localhost:5601 by default)")
 
     return parser
 
 
-def get_params():
+def get_params(argv=None):
     parser = get_params_parser_create_dash()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    if not (args.export_file or args.import_file or args.list):
-        parser.error("--export or --import or --list needed")
+    if args.serve:
+        if not args.socket_file:
+            parser.error("--serve needs --socket")
+    elif not (args.export_file or args.export_dir or args.import_files or args.diff_files or args.list or
+              args.dependents or args.dependencies or args.orphans or args.delete or
+              args.backup_file or args.restore_file or args.convert_files or args.bundle_files or
+              args.sync_mirror or args.manifest_file or args.watch_dir):
+        parser.error("--export or --import or --list needed (see --help for the rest of actions)")
     else:
         if args.export_file and not args.dashboard:
             parser.error("--export needs --dashboard")
+        if args.sync_mirror and not args.mirror_file:
+            parser.error("--sync-mirror needs --mirror")
+        if args.plan and not args.import_files:
+            parser.error("--plan needs --import")
+        if args.convert_files and not (args.target_version and args.output_file):
+            parser.error("--convert needs --target-version and --output")
+        if args.targets and not args.import_files:
+            parser.error("--targets needs --import")
+        if args.targets and (args.plan or args.journal_file):
+            parser.error("--targets can not be used with --plan or --journal")
+        if args.backend == KIBANA_BACKEND and \
+                (not (args.import_files or args.export_file or args.backup_file or args.restore_file) or
+                 args.targets or args.plan or args.journal_file or args.mirror_file):
+            parser.error("--backend kibana only supports --import, --export, --backup and --restore")
+        if args.resume and not args.journal_file:
+            parser.error("--resume needs --journal")
+        if args.bundle_files and not args.output_file:
+            parser.error("--bundle needs --output")
+        if args.record_file and args.replay_file:
+            parser.error("--record can not be used with --replay")
+        if args.redact_fields and not args.record_file:
+            parser.error("--redact needs --record")
+        if args.latency_scale is not None and not args.replay_file:
+            parser.error("--latency-scale needs --replay")
+        if args.targets and (args.record_file or args.replay_file or args.stats_file):
+            parser.error("--targets can not be used with --record, --replay or --stats")
+        if args.profile_function and not args.profile_dir:
+            parser.error("--profile-function needs --profile")
+        if args.profile_dir and (args.manifest_file or args.targets):
+            # cProfile only profiles the thread it is enabled in, not the threads of the jobs or the targets
+            parser.error("--profile can not be used with --manifest or --targets")
+        if args.profile_function:
+            from kidash.profiling import PROFILED_FUNCTIONS
+            if args.profile_function not in PROFILED_FUNCTIONS:
+                parser.error("--profile-function must be one of %s" % ", ".join(PROFILED_FUNCTIONS))
+    if args.latency_scale is None:
+        args.latency_scale = 1.0
     return args
 
 
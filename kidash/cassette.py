@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import base64
+import collections
+import contextlib
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+from .kidash import mount_adapter, requests_ses
+
+logger = logging.getLogger(__name__)
+
+REDACTED = "<redacted>"
+# Headers which are never stored in the cassettes
+SECRET_HEADERS = ('authorization', 'proxy-authorization', 'cookie', 'set-cookie')
+
+
+def strip_credentials(url):
+    """Remove the user and the password of a URL"""
+
+    parts = urlsplit(url)
+    if '@' not in parts.netloc:
+        return url
+    return urlunsplit(parts._replace(netloc=parts.netloc.rsplit('@', 1)[1]))
+
+
+def redact_headers(headers):
+    return {name: REDACTED if name.lower() in SECRET_HEADERS else value for name, value in headers.items()}
+
+
+def redact_json(data, fields):
+    """Replace the values of some fields of a JSON document, at any level"""
+
+    if isinstance(data, dict):
+        return {key: REDACTED if key in fields else redact_json(value, fields) for key, value in data.items()}
+    if isinstance(data, list):
+        return [redact_json(value, fields) for value in data]
+    return data
+
+
+def redact_body(body, fields):
+    """Redact the fields of a JSON or NDJSON (e.g. bulk) body. Other bodies are not modified."""
+
+    if not body or not fields:
+        return body
+    try:
+        lines = [json.loads(line) if line.strip() else None for line in body.decode('utf-8').split('\n')]
+    except ValueError:
+        return body
+    return '\n'.join('' if line is None else json.dumps(redact_json(line, fields))
+                     for line in lines).encode('utf-8')
+
+
+def encode_body(body):
+    """Return a dict with the body as text, or as base64 when it is binary"""
+
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    body = body or b''
+    try:
+        return {"body": body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {"body": base64.b64encode(body).decode('ascii'), "encoding": "base64"}
+
+
+def decode_body(data):
+    if data.get('encoding') == "base64":
+        return base64.b64decode(data['body'])
+    return data['body'].encode('utf-8')
+
+
+class RecordingAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter which stores the requests and their responses in a cassette.
+
+    Requests are sent with the given adapter. Each request is stored,
+    with its response and the seconds it took, in a line of the
+    cassette file (NDJSON), so the file is valid even if the run is
+    interrupted. Credentials in URLs and headers are never stored.
+
+    :param adapter: adapter used to send the requests
+    :param cassette_file: file to store the requests in
+    :param redact_fields: names of the JSON fields whose values are
+        redacted in the bodies of the requests and responses
+    """
+    def __init__(self, adapter, cassette_file, redact_fields=None):
+        super().__init__()
+        self.adapter = adapter
+        self.redact_fields = set(redact_fields or [])
+        self.lock = threading.Lock()
+        self.interactions = 0
+        self.fd = open(cassette_file, 'w')
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        response = self.adapter.send(request, **kwargs)
+        # The body is read here to include the transfer in the latency
+        content = response.content
+        seconds = time.perf_counter() - start
+
+        body = request.body.encode('utf-8') if isinstance(request.body, str) else request.body
+        interaction = {
+            "request": dict({"method": request.method,
+                             "url": strip_credentials(request.url),
+                             "headers": redact_headers(request.headers)},
+                            **encode_body(redact_body(body, self.redact_fields))),
+            "response": dict({"status": response.status_code,
+                              "reason": response.reason,
+                              "url": strip_credentials(response.url),
+                              "headers": redact_headers(response.headers)},
+                             **encode_body(redact_body(content, self.redact_fields))),
+            "seconds": seconds
+        }
+        with self.lock:
+            self.fd.write(json.dumps(interaction, sort_keys=True) + "\n")
+            self.fd.flush()
+            self.interactions += 1
+
+        return response
+
+    def close(self):
+        self.fd.close()
+        self.adapter.close()
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter which answers the requests with the responses stored in a cassette.
+
+    Requests are matched by their method and URL (without credentials).
+    The responses of a request sent several times are returned in the
+    order they were recorded. Each response is delayed by the seconds
+    the original one took, multiplied by `latency_scale`.
+
+    :param cassette_file: file with the recorded requests
+    :param latency_scale: factor applied to the recorded latencies
+        (0 to answer without delays)
+    """
+    def __init__(self, cassette_file, latency_scale=1.0):
+        super().__init__()
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.responses = collections.defaultdict(collections.deque)
+        self.interactions = 0
+
+        try:
+            with open(cassette_file) as fd:
+                interactions = [json.loads(line) for line in fd if line.strip()]
+        except OSError as error:
+            raise RuntimeError("Can't read the cassette %s: %s" % (cassette_file, error))
+
+        for interaction in interactions:
+            request = interaction['request']
+            self.responses[(request['method'], request['url'])].append(interaction)
+
+    def send(self, request, **kwargs):
+        key = (request.method, strip_credentials(request.url))
+        with self.lock:
+            if not self.responses.get(key):
+                raise RuntimeError("No response recorded for %s %s" % key)
+            interaction = self.responses[key].popleft()
+            self.interactions += 1
+
+        if self.latency_scale:
+            time.sleep(interaction['seconds'] * self.latency_scale)
+
+        recorded = interaction['response']
+        response = requests.models.Response()
+        response.status_code = recorded['status']
+        response.reason = recorded['reason']
+        response.headers = requests.structures.CaseInsensitiveDict(recorded['headers'])
+        response._content = decode_body(recorded)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@contextlib.contextmanager
+def record_requests(cassette_file, redact_fields=None):
+    """Record the requests sent to Elasticsearch and Kibana in a cassette file
+
+    :param cassette_file: file to store the requests in
+    :param redact_fields: names of the JSON fields to redact in the bodies
+    """
+    adapter = RecordingAdapter(requests_ses.get_adapter('http://'), cassette_file, redact_fields)
+    try:
+        with mount_adapter(adapter):
+            yield adapter
+    finally:
+        adapter.fd.close()
+        logger.info("%s requests recorded in %s", adapter.interactions, cassette_file)
+
+
+@contextlib.contextmanager
+def replay_requests(cassette_file, latency_scale=1.0):
+    """Answer the requests sent to Elasticsearch and Kibana with the responses of a cassette file
+
+    :param cassette_file: file with the recorded requests
+    :param latency_scale: factor applied to the recorded latencies
+    """
+    adapter = ReplayAdapter(cassette_file, latency_scale)
+    try:
+        with mount_adapter(adapter):
+            yield adapter
+    finally:
+        pending = sum(len(responses) for responses in adapter.responses.values())
+        logger.info("%s requests replayed from %s, %s not sent", adapter.interactions, cassette_file, pending)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# The client only uses the standard library, so it starts fast
+import json
+import os
+import socket
+import sys
+
+# Environment variable with the Unix socket of the daemon
+DAEMON_SOCKET_ENV = "KIDASH_SOCKET"
+
+
+def send_message(wfile, message):
+    """Send a message (one JSON document per line) to the other side of a socket"""
+
+    wfile.write(json.dumps(message).encode('utf-8') + b"\n")
+    wfile.flush()
+
+
+def forward_request(socket_file, argv, stdout=None, stderr=None):
+    """
+    Run a kidash command line in the daemon listening on a Unix socket.
+
+    The request includes the arguments and the working directory of
+    the client. The output and the messages of the command are written
+    as they are received.
+
+    :param socket_file: Unix socket of the daemon
+    :param argv: list with the arguments of kidash
+    :param stdout: stream in which to write the output (standard output by default)
+    :param stderr: stream in which to write the messages (standard error by default)
+    :returns: the exit code of the command
+    """
+    streams = {"stdout": stdout or sys.stdout, "stderr": stderr or sys.stderr}
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_file)
+        with sock.makefile('rwb') as sock_file:
+            send_message(sock_file, {"argv": argv, "cwd": os.getcwd()})
+            for line in sock_file:
+                message = json.loads(line)
+                if 'exit' in message:
+                    return message['exit']
+                for name, stream in streams.items():
+                    if name in message:
+                        stream.write(message[name])
+                        stream.flush()
+
+    raise RuntimeError("Connection closed by the daemon before the end of the request")
+
+
+def main():
+    """Forward the command line to the daemon: kidash-client [--socket FILE] <kidash options>"""
+
+    argv = sys.argv[1:]
+    socket_file = os.environ.get(DAEMON_SOCKET_ENV)
+    if argv[:1] == ["--socket"] and len(argv) > 1:
+        socket_file = argv[1]
+        argv = argv[2:]
+
+    if not socket_file:
+        sys.stderr.write("usage: kidash-client [--socket FILE] [kidash options]. "
+                         "The socket can be set with %s too.\n" % DAEMON_SOCKET_ENV)
+        sys.exit(2)
+
+    try:
+        sys.exit(forward_request(socket_file, argv))
+    except (OSError, RuntimeError, ValueError) as error:
+        sys.stderr.write("Can not run the request in the kidash daemon at %s: %s\n" % (socket_file, error))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from .client import send_message
+from .kidash import clear_caches
+
+logger = logging.getLogger(__name__)
+
+# Seconds the versions of the clusters and the indices found are kept
+DAEMON_CACHE_TTL = 300
+
+
+class ClientStream(io.TextIOBase):
+    """Text stream which sends what is written to a client of the daemon"""
+
+    def __init__(self, wfile, stream_name):
+        super().__init__()
+        self.wfile = wfile
+        self.stream_name = stream_name
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            send_message(self.wfile, {self.stream_name: text})
+        return len(text)
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """Run the command line sent by a client (see `kidash.client`)"""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            argv, cwd = request['argv'], request['cwd']
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Wrong request received by the daemon")
+            send_message(self.wfile, {"exit": 2})
+            return
+
+        try:
+            exit_code = self.server.run_request(argv, cwd, self.wfile)
+            send_message(self.wfile, {"exit": exit_code})
+        except OSError as error:
+            logger.warning("Client disconnected before the end of the request: %s", error)
+
+
+class KidashDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Server which runs kidash command lines keeping the process warm.
+
+    The HTTP session (and its connections), the versions of the clusters
+    and the indices found are kept between requests. The versions and
+    indices are read again once they are older than `cache_ttl` seconds.
+    Requests are run one by one, as the standard output, the messages and
+    the working directory of the process are those of the client.
+
+    :param socket_file: Unix socket to listen on
+    :param run_argv: function which runs a list of kidash arguments and
+        returns the exit code
+    :param cache_ttl: seconds the versions and indices are kept
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_file, run_argv, cache_ttl=DAEMON_CACHE_TTL):
+        self.run_argv = run_argv
+        self.cache_ttl = cache_ttl
+        self.cache_time = time.time()
+        self.lock = threading.Lock()
+
+        # Only the user running the daemon can connect to it
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_file, DaemonRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def run_request(self, argv, cwd, wfile):
+        with self.lock:
+            if time.time() - self.cache_time > self.cache_ttl:
+                logger.debug("Cached versions and indices expired")
+                clear_caches()
+                self.cache_time = time.time()
+
+            client_stdout = ClientStream(wfile, "stdout")
+            client_stderr = ClientStream(wfile, "stderr")
+
+            daemon_cwd = os.getcwd()
+            try:
+                os.chdir(cwd)
+            except OSError as error:
+                # e.g. the directory of the client was removed or is not readable by the daemon
+                logger.warning("Request not run in %s: %s", cwd, error)
+                client_stderr.write("Can't run the request in %s: %s\n" % (cwd, error))
+                return 1
+
+            debug = '-g' in argv or '--debug' in argv
+            handler = logging.StreamHandler(client_stderr)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            handler.setLevel(logging.DEBUG if debug else logging.INFO)
+            root_logger = logging.getLogger()
+            root_level = root_logger.level
+            root_logger.setLevel(logging.DEBUG if debug else logging.INFO)
+            root_logger.addHandler(handler)
+
+            stdout, stderr = sys.stdout, sys.stderr
+            try:
+                sys.stdout, sys.stderr = client_stdout, client_stderr
+                logger.debug("Running request: %s", argv)
+                return self.run_argv(argv)
+            finally:
+                sys.stdout, sys.stderr = stdout, stderr
+                root_logger.removeHandler(handler)
+                root_logger.setLevel(root_level)
+                os.chdir(daemon_cwd)
+
+
+def is_daemon_listening(socket_file):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_file)
+        except OSError:
+            return False
+    return True
+
+
+def stop_daemon(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(socket_file, run_argv, cache_ttl=DAEMON_CACHE_TTL):
+    """
+    Serve the requests of `kidash-client` on a Unix socket until interrupted.
+
+    :param socket_file: Unix socket to listen on
+    :param run_argv: function which runs a list of kidash arguments and
+        returns the exit code
+    :param cache_ttl: seconds the versions and indices are kept
+    """
+    if os.path.exists(socket_file):
+        if is_daemon_listening(socket_file):
+            raise RuntimeError("A daemon is already listening on %s" % socket_file)
+        # Left by a daemon which was killed
+        os.remove(socket_file)
+
+    server = KidashDaemon(socket_file, run_argv, cache_ttl)
+    signal.signal(signal.SIGTERM, stop_daemon)
+    logger.info("Kidash daemon listening on %s", socket_file)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Kidash daemon stopped")
+    finally:
+        server.server_close()
+        os.remove(socket_file)
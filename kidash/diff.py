@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import logging
+
+from .kidash import (ElasticSearch,
+                     IndexPatternFields,
+                     exists_index,
+                     find_cluster_version,
+                     find_elasticsearch_version,
+                     get_item_doc_ref,
+                     mget_items,
+                     prepare_panel_items,
+                     read_panel_file)
+
+logger = logging.getLogger(__name__)
+
+# Maximum length of the values shown in the differences
+MAX_VALUE_LENGTH = 80
+# Fields Kibana adds or updates when storing the saved objects, which are not part of panels
+KIBANA_FIELDS = ["updated_at", "references", "migrationVersion"]
+
+
+class Missing:
+    """Value of the fields not found in one of the items"""
+
+    def __repr__(self):
+        return "<missing>"
+
+
+MISSING = Missing()
+
+
+def normalize_item_json(value):
+    """Parse the JSON strings nested in an item, so they are compared by value"""
+
+    if isinstance(value, dict):
+        return {key: normalize_item_json(val) for key, val in value.items()}
+    elif isinstance(value, list):
+        return [normalize_item_json(val) for val in value]
+    elif isinstance(value, str) and value[:1] in ('{', '['):
+        try:
+            return normalize_item_json(json.loads(value))
+        except ValueError:
+            return value
+    return value
+
+
+def normalize_saved_object(type_, source):
+    """Normalize a saved object (see `normalize_item_json`) removing the fields Kibana manages
+
+    The fields of index patterns are sorted by name, as their order
+    depends on the order in which they were read from the indices.
+    """
+    source = {key: value for key, value in normalize_item_json(source).items() if key not in KIBANA_FIELDS}
+
+    # Since Elasticsearch 6 the object is stored in a field named as its type
+    item_json = source.get(type_, source)
+    if type_ == 'index-pattern' and isinstance(item_json.get('fields'), list):
+        item_json['fields'] = sorted(item_json['fields'], key=lambda field: field.get('name', ''))
+
+    return source
+
+
+def compare_item_json(current, new, path=""):
+    """Return the differences between two normalized items
+
+    :param current: item stored in Elasticsearch
+    :param new: item to import
+    :param path: path of the items compared
+
+    :returns: a list of tuples with the path of each field
+        which differs, its current value and its new value
+    """
+    diffs = []
+
+    if isinstance(current, dict) and isinstance(new, dict):
+        for key in sorted(set(current) | set(new)):
+            field_path = path + "." + key if path else key
+            diffs.extend(compare_item_json(current.get(key, MISSING), new.get(key, MISSING), field_path))
+    elif isinstance(current, list) and isinstance(new, list):
+        for i in range(max(len(current), len(new))):
+            field_path = "%s[%s]" % (path, i)
+            current_value = current[i] if i < len(current) else MISSING
+            new_value = new[i] if i < len(new) else MISSING
+            diffs.extend(compare_item_json(current_value, new_value, field_path))
+    elif current != new:
+        diffs.append((path, current, new))
+
+    return diffs
+
+
+def diff_panel_file(elastic_url, panel_file, es_index=None, data_sources=None, add_vis_studies=False):
+    """
+    Compare the items of a panel file with the ones stored in Kibana.
+
+    The items of the panel are transformed as they would be imported and
+    compared with the ones stored in the Kibana index, which are retrieved
+    with a single multi-get request. JSON strings nested in the items
+    (e.g. `panelsJSON` or `visState`) are parsed before comparing them,
+    and the fields managed by Kibana and the order of the fields of
+    index patterns are ignored (see `normalize_saved_object`).
+
+    :param elastic_url: Elasticsearch URL
+    :param panel_file: file with the panel to compare
+    :param es_index: name of the Kibana index
+    :param data_sources: data sources to be included
+    :param add_vis_studies: include visualizations for studies
+    :returns: a dict with the items `added`, `changed` (with the list of
+        differences of each one) and `unchanged`
+    """
+    panel = read_panel_file(panel_file)
+    if panel is None:
+        raise RuntimeError("Can not find a valid JSON in: %s" % panel_file)
+
+    if not es_index:
+        es_index = ".kibana"
+
+    # The Kibana index is not created to compare the panel with it
+    elastic = None
+    if exists_index(elastic_url, es_index):
+        elastic = ElasticSearch(elastic_url, es_index)
+        es_version = find_elasticsearch_version(elastic)
+    else:
+        logger.info("Kibana index %s not found. All the items of %s are new.", es_index, panel_file)
+        es_version = find_cluster_version(elastic_url)
+
+    items = list(prepare_panel_items(panel, es_version, data_sources, add_vis_studies,
+                                     IndexPatternFields(elastic_url)))
+
+    currents = [{} for _ in items]
+    if elastic:
+        docs = []
+        for type_, item_id, _, _ in items:
+            doc_type, doc_id = get_item_doc_ref(elastic, type_, item_id)
+            docs.append({"_type": doc_type, "_id": doc_id})
+        currents = mget_items(elastic, docs)
+
+    result = {"added": [], "changed": {}, "unchanged": []}
+
+    for (type_, item_id, item_json, _), current in zip(items, currents):
+        if not item_id.startswith(type_ + ":"):
+            item_id = type_ + ":" + item_id
+
+        if not current.get('found'):
+            result['added'].append(item_id)
+            continue
+
+        diffs = compare_item_json(normalize_saved_object(type_, current['_source']),
+                                  normalize_saved_object(type_, item_json))
+        if diffs:
+            result['changed'][item_id] = diffs
+        else:
+            result['unchanged'].append(item_id)
+
+    return result
+
+
+def format_value(value):
+    value_str = repr(value) if value is MISSING else json.dumps(value, sort_keys=True)
+    if len(value_str) > MAX_VALUE_LENGTH:
+        value_str = value_str[:MAX_VALUE_LENGTH - 3] + "..."
+    return value_str
+
+
+def format_diff(panel_file, result):
+    """Return the lines describing the differences of a panel file"""
+
+    lines = ["%s: %s added, %s changed, %s unchanged" %
+             (panel_file, len(result['added']), len(result['changed']), len(result['unchanged']))]
+    for item_id in result['added']:
+        lines.append("  + %s" % item_id)
+    for item_id, diffs in result['changed'].items():
+        lines.append("  ~ %s" % item_id)
+        for path, current, new in diffs:
+            lines.append("      %s: %s -> %s" % (path, format_value(current), format_value(new)))
+
+    return lines
+
+
+def print_diff(panel_file, result):
+    for line in format_diff(panel_file, result):
+        print(line)
+
+
+def diff_panel_files(elastic_url, panel_files, es_index=None, data_sources=None, add_vis_studies=False):
+    """Compare several panel files with the items stored in Kibana and print the differences"""
+
+    results = {}
+    for panel_file in panel_files:
+        results[panel_file] = diff_panel_file(elastic_url, panel_file, es_index, data_sources, add_vis_studies)
+        print_diff(panel_file, results[panel_file])
+
+    return results
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+from .kidash import (ElasticSearch,
+                     IndexPatternFields,
+                     check_kibana_index,
+                     find_elasticsearch_version,
+                     grimoire_adapter,
+                     has_index_pattern_fields,
+                     is_new_dashboard_release,
+                     is_new_index_pattern_release,
+                     mount_adapter,
+                     prepare_panel_items,
+                     write_items)
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of targets imported at the same time
+MAX_TARGET_WORKERS = 8
+
+
+class ThreadAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter with a different connection pool in each thread"""
+
+    def __init__(self):
+        super().__init__()
+        self.local = threading.local()
+        self.adapters = []
+        self.lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        adapter = getattr(self.local, 'adapter', None)
+        if not adapter:
+            adapter = grimoire_adapter()
+            self.local.adapter = adapter
+            with self.lock:
+                self.adapters.append(adapter)
+        return adapter.send(request, **kwargs)
+
+    def close(self):
+        for adapter in self.adapters:
+            adapter.close()
+
+
+def parse_target(target, es_index=None, kibana_url=None):
+    """Parse a target with the format `URL[,INDEX[,KIBANA_URL]]`
+
+    :returns: a tuple with the Elasticsearch URL, the Kibana index and the Kibana URL
+    """
+    fields = target.split(",")
+    if len(fields) > 3 or not fields[0]:
+        raise ValueError("Wrong target %s. Use URL[,INDEX[,KIBANA_URL]]" % target)
+    fields += [None] * (3 - len(fields))
+
+    return fields[0], fields[1] or es_index or ".kibana", fields[2] or kibana_url
+
+
+def get_conversion_key(es_version):
+    """Return the Elasticsearch versions whose documents are the same (see `prepare_item_json`)"""
+
+    elastic_ver, elastic_ver_mid = es_version
+    return elastic_ver >= 6, elastic_ver >= 6 and elastic_ver_mid >= 8
+
+
+class PreparedPanels:
+    """Items of some panels prepared for each kind of Elasticsearch version.
+
+    The items are prepared only once for all the targets with compatible
+    versions. When the index patterns must be rebuilt (they were exported
+    without fields), they are prepared once per cluster instead.
+    """
+    def __init__(self, panels, data_sources=None, add_vis_studies=False, fields_file=None):
+        self.panels = panels
+        self.data_sources = data_sources
+        self.add_vis_studies = add_vis_studies
+        self.fields_file = fields_file
+        self.prepared = {}
+        self.lock = threading.Lock()
+
+        self.needs_fields = any(not has_index_pattern_fields(index_pattern['value'])
+                                for _, panel in panels for index_pattern in panel.get('index_patterns', []))
+
+    def get(self, es_version, elastic_url):
+        """Return a list with the prepared items of each panel"""
+
+        key = get_conversion_key(es_version)
+        if self.needs_fields:
+            key += (elastic_url,)
+
+        with self.lock:
+            if key not in self.prepared:
+                index_fields = IndexPatternFields(elastic_url, self.fields_file) if self.needs_fields else None
+                self.prepared[key] = [list(prepare_panel_items(panel, es_version, self.data_sources,
+                                                               self.add_vis_studies, index_fields))
+                                      for _, panel in self.panels]
+            return self.prepared[key]
+
+
+def get_new_items(elastic_url, es_index, panel, items):
+    """Return the items of a panel newer than the ones stored in Kibana"""
+
+    if 'dashboard' in panel:
+        return items if is_new_dashboard_release(elastic_url, panel['dashboard'], es_index) else []
+
+    old_ids = set()
+    for index_pattern in panel.get('index_patterns', []):
+        if not is_new_index_pattern_release(elastic_url, index_pattern, es_index):
+            old_ids.add(index_pattern['id'])
+
+    # Ids of documents include the type for Elasticsearch >= 6
+    old_ids.update(["index-pattern:" + ip_id for ip_id in old_ids])
+
+    return [item for item in items if item[0] != 'index-pattern' or item[1] not in old_ids]
+
+
+def import_target(target, prepared_panels, strict=False):
+    """Import prepared panels in a target
+
+    :returns: a dict with the number of items `written` and `skipped`
+        (not newer in strict mode) and the `seconds` taken
+    """
+    elastic_url, es_index, kibana_url = target
+    start = time.time()
+
+    # In Kibana >= 6.1 the index could not exists
+    if not check_kibana_index(elastic_url, kibana_url, es_index):
+        raise RuntimeError("Kibana checks have failed")
+
+    elastic = ElasticSearch(elastic_url, es_index)
+    es_version = find_elasticsearch_version(elastic)
+
+    items = []
+    nskipped = 0
+    for (_, panel), panel_items in zip(prepared_panels.panels, prepared_panels.get(es_version, elastic_url)):
+        new_items = get_new_items(elastic_url, es_index, panel, panel_items) if strict else panel_items
+        nskipped += len(panel_items) - len(new_items)
+        items.extend(new_items)
+
+    nwritten = write_items(elastic, items, es_version) if items else 0
+
+    return {"written": nwritten, "skipped": nskipped, "seconds": round(time.time() - start, 3)}
+
+
+def import_targets(targets, panels, data_sources=None, add_vis_studies=False, strict=False,
+                   fields_file=None, max_workers=MAX_TARGET_WORKERS):
+    """
+    Import some panels in several targets (Kibana indices of one or several clusters).
+
+    Panels are read and prepared once for all the targets with a compatible
+    Elasticsearch version. Targets are imported concurrently, each one in
+    its own thread with its own connection pool, checking the Kibana index
+    and the Elasticsearch version of each one. The items of a target are
+    written using bulk requests.
+
+    :param targets: list of tuples with the Elasticsearch URL, the Kibana
+        index and the Kibana URL of each target
+    :param panels: list of tuples with the name and the dict of each panel
+    :param data_sources: data sources to be included
+    :param add_vis_studies: include visualizations for studies
+    :param strict: only import the dashboards and index patterns newer
+        than the ones stored in each target
+    :param fields_file: file with the fields of the index patterns
+    :param max_workers: maximum number of targets imported at the same time
+    :returns: a list with the result of each target: a dict with the number
+        of items `written` and `skipped`, the `seconds` taken, or the `error`
+    """
+    prepared_panels = PreparedPanels(panels, data_sources, add_vis_studies, fields_file)
+
+    with mount_adapter(ThreadAdapter()) as adapter:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(targets)) or 1) as executor:
+            futures = [executor.submit(import_target, target, prepared_panels, strict) for target in targets]
+
+        results = []
+        for target, future in zip(targets, futures):
+            try:
+                result = future.result()
+            except Exception as error:
+                # Any error only fails its own target
+                result = {"error": str(error) or type(error).__name__}
+            results.append(result)
+        adapter.close()
+
+    for (elastic_url, es_index, _), result in zip(targets, results):
+        # Credentials are not shown
+        host = urlsplit(elastic_url).hostname
+        if 'error' in result:
+            logger.error("%s %s: import failed: %s", host, es_index, result['error'])
+        else:
+            logger.info("%s %s: %s items written, %s skipped in %ss", host, es_index,
+                        result['written'], result['skipped'], result['seconds'])
+
+    return results
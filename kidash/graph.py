@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import fnmatch
+import json
+import logging
+
+from .kidash import (ElasticSearch,
+                     BULK_CHUNK_SIZE,
+                     SIGILS_INDEX,
+                     bulk_items,
+                     exists_index,
+                     find_elasticsearch_version,
+                     get_bulk_meta,
+                     get_item_doc_ref,
+                     get_item_from_hit,
+                     requests_ses,
+                     scroll_items)
+
+logger = logging.getLogger(__name__)
+
+# Types of the saved objects which are orphans when no other object references them.
+# Visualizations are referenced by dashboards, while searches and index patterns are
+# referenced by visualizations (and index patterns by searches and the Kibana settings).
+ORPHAN_TYPES = ['visualization', 'search', 'index-pattern']
+
+
+def item_key(type_, item_id):
+    """Return the key of an item in the graph (e.g. `visualization:git_commits`)"""
+
+    return type_ + ":" + item_id
+
+
+def get_item_references(type_, item_json, references=None):
+    """Return the items referenced by a saved object
+
+    References are read from the panels of dashboards (`panelsJSON`),
+    the saved search of visualizations (`savedSearchId`) and the index
+    patterns of searches and visualizations (`searchSourceJSON`). When
+    the saved object includes a list of references (Kibana >= 7), they
+    are added too.
+
+    :param type_: type of the item
+    :param item_json: JSON definition of the item
+    :param references: list of references stored with the item
+    :returns: a set with the keys of the referenced items
+    """
+    refs = set()
+
+    if type_ == 'dashboard' and item_json.get('panelsJSON'):
+        for panel in json.loads(item_json['panelsJSON']):
+            if 'id' in panel and 'type' in panel:
+                refs.add(item_key(panel['type'], panel['id']))
+
+    if type_ == 'config' and item_json.get('defaultIndex'):
+        refs.add(item_key('index-pattern', item_json['defaultIndex']))
+
+    if item_json.get('savedSearchId'):
+        refs.add(item_key('search', item_json['savedSearchId']))
+
+    meta = item_json.get('kibanaSavedObjectMeta', {})
+    if meta.get('searchSourceJSON'):
+        search_source = json.loads(meta['searchSourceJSON'])
+        if isinstance(search_source.get('index'), str):
+            refs.add(item_key('index-pattern', search_source['index']))
+        for search_filter in search_source.get('filter', []):
+            index = search_filter.get('meta', {}).get('index')
+            if index:
+                refs.add(item_key('index-pattern', index))
+
+    for ref in references or []:
+        refs.add(item_key(ref['type'], ref['id']))
+
+    return refs
+
+
+class DependencyGraph:
+    """Forward and reverse references between saved objects.
+
+    Items are identified by their keys (see `item_key`). The forward
+    graph stores the items referenced by each item, while the reverse
+    graph stores the items referencing each one.
+    """
+    def __init__(self):
+        self.items = set()
+        self.forward = {}
+        self.reverse = {}
+
+    def add_item(self, type_, item_id, item_json, references=None):
+        key = item_key(type_, item_id)
+        self.items.add(key)
+
+        refs = get_item_references(type_, item_json, references)
+        self.forward[key] = refs
+        for ref in refs:
+            self.reverse.setdefault(ref, set()).add(key)
+
+    def _closure(self, key, edges):
+        done = set()
+        pending = [key]
+        while pending:
+            current = pending.pop()
+            for next_key in edges.get(current, []):
+                if next_key not in done:
+                    done.add(next_key)
+                    pending.append(next_key)
+        done.discard(key)
+        return done
+
+    def dependents(self, key):
+        """Return the items which use, directly or not, the given item"""
+
+        return self._closure(key, self.reverse)
+
+    def dependencies(self, key):
+        """Return the items used, directly or not, by the given item"""
+
+        return self._closure(key, self.forward)
+
+    def orphans(self):
+        """Return the visualizations, searches and index patterns not used by any item"""
+
+        return {key for key in self.items
+                if key.split(":", 1)[0] in ORPHAN_TYPES and not self.reverse.get(key)}
+
+    def removable(self, keys):
+        """Return the given items plus the items that only they use
+
+        The result includes the items used, directly or not, by
+        the given ones which are not used by any other item.
+        """
+        removed = set(keys)
+        candidates = set()
+        for key in keys:
+            candidates.update(self.dependencies(key))
+        candidates.intersection_update(self.items)
+
+        found = True
+        while found:
+            found = False
+            for key in candidates - removed:
+                if self.reverse.get(key, set()) <= removed:
+                    removed.add(key)
+                    found = True
+
+        return removed
+
+    def missing(self):
+        """Return the items referenced but not found"""
+
+        return set(self.reverse) - self.items
+
+
+def build_dependency_graph(hits):
+    """Build the dependency graph of the saved objects in a list of hits"""
+
+    graph = DependencyGraph()
+
+    for hit in hits:
+        type_, item_id, item_json = get_item_from_hit(hit)
+        if not isinstance(item_json, dict):
+            continue
+        try:
+            graph.add_item(type_, item_id, item_json, hit['_source'].get('references'))
+        except (ValueError, AttributeError, TypeError):
+            logger.warning("Can not read the references of %s", item_key(type_, item_id))
+
+    logger.debug("Dependency graph built with %s items", len(graph.items))
+
+    return graph
+
+
+def fetch_dependency_graph(elastic_url, es_index=None, mirror=None):
+    """
+    Build the dependency graph of all the saved objects of a Kibana index,
+    reading them with a single scroll or from a local mirror.
+
+    :param elastic_url: Elasticsearch URL
+    :param es_index: name of the Kibana index
+    :param mirror: local mirror of the Kibana index to read the items from
+    :returns: a DependencyGraph object
+    """
+    if mirror:
+        return build_dependency_graph(mirror.items())
+
+    if not es_index:
+        es_index = ".kibana"
+
+    if not exists_index(elastic_url, es_index):
+        logger.info("Kibana index %s not found. No saved objects to read.", es_index)
+        return build_dependency_graph([])
+
+    elastic = ElasticSearch(elastic_url, es_index)
+
+    return build_dependency_graph(scroll_items(elastic))
+
+
+def list_dependents(elastic_url, key, es_index=None, mirror=None):
+    graph = fetch_dependency_graph(elastic_url, es_index, mirror)
+    for dependent in sorted(graph.dependents(key)):
+        print(dependent)
+
+
+def list_dependencies(elastic_url, key, es_index=None, mirror=None):
+    graph = fetch_dependency_graph(elastic_url, es_index, mirror)
+    for dependency in sorted(graph.dependencies(key)):
+        if dependency in graph.items:
+            print(dependency)
+        else:
+            print("%s (not found)" % dependency)
+
+
+def list_orphans(elastic_url, es_index=None, mirror=None):
+    graph = fetch_dependency_graph(elastic_url, es_index, mirror)
+    for orphan in sorted(graph.orphans()):
+        print(orphan)
+
+
+def delete_dashboards(elastic_url, dash_patterns, es_index=None, dry_run=False):
+    """
+    Delete dashboards together with the objects only used by them.
+
+    Dashboards are selected using their ids or shell-style patterns
+    (e.g. `git__*`). The visualizations, searches and index patterns
+    which are not used by any other object once the dashboards are
+    removed are deleted too, using bulk requests. The release dates
+    of the deleted items stored in the Sigils index are removed too.
+
+    :param elastic_url: Elasticsearch URL
+    :param dash_patterns: list of ids or patterns of the dashboards
+    :param es_index: name of the Kibana index
+    :param dry_run: only list the objects which would be deleted
+    :returns: a sorted list with the keys of the deleted objects
+    """
+    if not es_index:
+        es_index = ".kibana"
+
+    elastic = ElasticSearch(elastic_url, es_index)
+    graph = build_dependency_graph(scroll_items(elastic))
+
+    dashboards = set()
+    for dash_key in graph.items:
+        type_, dash_id = dash_key.split(":", 1)
+        if type_ != 'dashboard':
+            continue
+        for pattern in dash_patterns:
+            if pattern.startswith("dashboard:"):
+                pattern = pattern[len("dashboard:"):]
+            if fnmatch.fnmatchcase(dash_id, pattern):
+                dashboards.add(dash_key)
+                break
+
+    if not dashboards:
+        logger.warning("No dashboards found for %s", dash_patterns)
+        return []
+
+    removed = sorted(graph.removable(dashboards))
+
+    if dry_run:
+        for key in removed:
+            print(key)
+        return removed
+
+    es_version = find_elasticsearch_version(elastic)
+    sigils_found = requests_ses.get(elastic.url + "/" + SIGILS_INDEX, verify=False).status_code == 200
+
+    for i in range(0, len(removed), BULK_CHUNK_SIZE):
+        actions = []
+        for key in removed[i:i + BULK_CHUNK_SIZE]:
+            type_, item_id = key.split(":", 1)
+            doc_type, doc_id = get_item_doc_ref(elastic, type_, item_id)
+            actions.append(({"delete": get_bulk_meta(es_version, doc_id, doc_type)}, None))
+            if sigils_found and type_ in ['dashboard', 'index-pattern']:
+                actions.append(({"delete": get_bulk_meta(es_version, doc_id, index=SIGILS_INDEX)}, None))
+        bulk_items(elastic, actions)
+
+    logger.info("%s dashboards and %s objects only used by them deleted",
+                len(dashboards), len(removed) - len(dashboards))
+
+    return removed
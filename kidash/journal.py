@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime as dt
+
+from .kidash import get_item_digest
+
+logger = logging.getLogger(__name__)
+
+
+def get_target_digest(elastic_url, es_index=None):
+    """Return a digest identifying a Kibana index, without storing the URL and its credentials"""
+
+    target = elastic_url.rstrip("/") + "/" + (es_index or ".kibana")
+    return hashlib.sha1(target.encode('utf-8')).hexdigest()
+
+
+class ImportCheckpoint:
+    """Items of a panel imported in a Kibana index, according to a journal"""
+
+    def __init__(self, journal, target, panel):
+        self.journal = journal
+        self.target = target
+        self.panel = panel
+
+    def started(self):
+        return (self.target, self.panel) in self.journal.panels
+
+    def is_done(self, item_id):
+        return (self.target, self.panel, item_id) in self.journal.items
+
+    def record(self, item_id):
+        self.journal.record(self.target, self.panel, item_id)
+
+
+class ImportJournal:
+    """Append-only journal of the items imported.
+
+    Each line of the journal stores an item confirmed by Elasticsearch,
+    identified by the digest of the target Kibana index, the digest of
+    the contents of its panel and its id. When resuming, the items of
+    the journal are skipped, so an interrupted import continues from
+    the first item not written, and the unfinished line it could have
+    left is removed. The journal is started again otherwise.
+
+    :param path: path to the journal file
+    :param resume: read the items of the journal to skip them
+    """
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.items = set()
+        self.panels = set()
+
+        if resume and os.path.isfile(path):
+            self.load()
+        self.file = open(path, 'a' if resume else 'w')
+
+    def load(self):
+        valid_lines = []
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line of an interrupted import
+                    logger.debug("Wrong line in journal %s: %s", self.path, line)
+                    continue
+                valid_lines.append(line if line.endswith("\n") else line + "\n")
+                self.items.add((entry['target'], entry['panel'], entry['item']))
+                self.panels.add((entry['target'], entry['panel']))
+
+        # The items recorded from now on must not be appended to a wrong or unfinished line
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, 'w') as f:
+            f.writelines(valid_lines)
+        os.replace(tmp_file, self.path)
+
+        logger.info("%s items already imported according to %s", len(self.items), self.path)
+
+    def checkpoint(self, elastic_url, es_index, panel):
+        """Return the checkpoint of a panel imported in a Kibana index"""
+
+        return ImportCheckpoint(self, get_target_digest(elastic_url, es_index), get_item_digest(panel))
+
+    def record(self, target, panel, item_id):
+        entry = {"target": target, "panel": panel, "item": item_id, "date": dt.utcnow().isoformat()}
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        self.items.add((target, panel, item_id))
+        self.panels.add((target, panel))
+
+    def close(self):
+        self.file.close()
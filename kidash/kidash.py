@@ -20,11 +20,16 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
+import contextlib
 import copy
+import functools
+import hashlib
 import json
 import logging
 import os
 import os.path
+import threading
+import time
 from datetime import datetime as dt
 
 import dateutil.parser
@@ -33,8 +38,16 @@ import urllib3
 
 logger = logging.getLogger(__name__)
 
-ES_VER = None
-ES_VER_MID = None
+# Versions of the clusters used, by URL
+ES_VERSIONS = {}
+# URLs of the indices found, which are not checked again
+KNOWN_INDICES = set()
+# Collectors of the metrics of the runs (see `kidash.stats`)
+STATS_COLLECTORS = []
+# Phases being measured in each thread
+RUN_PHASES = threading.local()
+# Profilers of the runs or of some functions, told when each phase ends (see `kidash.profiling`)
+PROFILERS = []
 ES6_HEADER = {"Content-Type": "application/json", "kbn-xsrf": "true"}
 HEADERS_JSON = {"Content-Type": "application/json"}
 RELEASE_DATE = 'release_date'
@@ -50,6 +63,30 @@ MAX_RETRIES_ON_READ = 8
 MAX_RETRIES_ON_CONNECT = 21
 STATUS_FORCE_LIST = [408, 409, 429, 502, 503, 504]
 
+# Number of items retrieved per page when scrolling the Kibana index
+SCROLL_SIZE = 500
+SCROLL_KEEP_ALIVE = "5m"
+# Limits for the items sent in a single bulk request
+BULK_CHUNK_SIZE = 500
+BULK_MAX_BYTES = 5 * 1024 * 1024
+# First line of the backup files, with the metadata needed to restore them
+BACKUP_HEADER = "_kidash"
+# File with the state of the incremental exports, stored in the export directory
+EXPORT_STATE_FILE = ".kidash-export-state.json"
+
+# Kibana type of the fields for each Elasticsearch type
+KIBANA_FIELD_TYPES = {
+    "text": "string", "keyword": "string", "string": "string",
+    "_id": "string", "_index": "string", "_type": "string",
+    "float": "number", "half_float": "number", "scaled_float": "number", "double": "number",
+    "integer": "number", "long": "number", "short": "number", "byte": "number", "token_count": "number",
+    "date": "date", "date_nanos": "date",
+    "boolean": "boolean", "ip": "ip", "geo_point": "geo_point", "geo_shape": "geo_shape",
+    "murmur3": "murmur3", "attachment": "attachment", "_source": "_source"
+}
+# Metadata fields included in the index patterns
+KIBANA_META_FIELDS = ['_source', '_id', '_type', '_index', '_score']
+
 # This mapping includes the types metadashboard and projectname, used by Kibiter. They must be
 # include in this way, since the mapping for .kibana is set to strict for versions >= 6.8
 KIBANA_MAPPING = {
@@ -449,12 +486,18 @@ KIBANA_MAPPING = {
 }
 
 
-def grimoire_con(insecure=True, conn_retries=MAX_RETRIES_ON_CONNECT, total=MAX_RETRIES):
-    conn = requests.Session()
+def grimoire_adapter(conn_retries=MAX_RETRIES_ON_CONNECT, total=MAX_RETRIES):
+    """Return a transport adapter, with its own connection pool, which retries the failed requests"""
+
     retries = urllib3.util.Retry(total=total, connect=conn_retries, read=MAX_RETRIES_ON_READ,
                                  redirect=MAX_RETRIES_ON_REDIRECT, backoff_factor=BACKOFF_FACTOR,
                                  allowed_methods=False, status_forcelist=STATUS_FORCE_LIST)
-    adapter = requests.adapters.HTTPAdapter(max_retries=retries)
+    return requests.adapters.HTTPAdapter(max_retries=retries)
+
+
+def grimoire_con(insecure=True, conn_retries=MAX_RETRIES_ON_CONNECT, total=MAX_RETRIES):
+    conn = requests.Session()
+    adapter = grimoire_adapter(conn_retries, total)
     conn.mount('http://', adapter)
     conn.mount('https://', adapter)
 
@@ -468,6 +511,92 @@ def grimoire_con(insecure=True, conn_retries=MAX_RETRIES_ON_CONNECT, total=MAX_R
 requests_ses = grimoire_con()
 
 
+@contextlib.contextmanager
+def mount_adapter(adapter):
+    """Send the requests of the Elasticsearch and Kibana connection through an adapter
+
+    The adapters of the connection are restored when leaving the context.
+
+    :param adapter: transport adapter (e.g. a `requests.adapters.HTTPAdapter`)
+    """
+    adapters = requests_ses.adapters.copy()
+    requests_ses.mount('http://', adapter)
+    requests_ses.mount('https://', adapter)
+    try:
+        yield adapter
+    finally:
+        requests_ses.adapters = adapters
+
+
+@contextlib.contextmanager
+def run_phase(name):
+    """Measure the wall time of a phase of the run for the stats collectors
+
+    Phases can be nested: the time of the inner phases is not added to
+    the outer one. Profilers are told when each phase ends.
+
+    :param name: name of the phase (preflight, read, transform, fetch, write or sigils)
+    """
+    if not STATS_COLLECTORS and not PROFILERS:
+        yield
+        return
+
+    if not hasattr(RUN_PHASES, 'stack'):
+        RUN_PHASES.stack = []
+    stack = RUN_PHASES.stack
+    # Seconds of the inner phases
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        inner_seconds = stack.pop()
+        if stack:
+            stack[-1] += seconds
+        for collector in STATS_COLLECTORS:
+            collector.add_phase(name, seconds - inner_seconds)
+        for profiler in PROFILERS:
+            profiler.end_phase(name)
+
+
+def count_objects(outcome, count=1):
+    """Count saved objects for the stats collectors
+
+    :param outcome: what was done with the objects (imported, planned, skipped, filtered or exported)
+    :param count: number of objects
+    """
+    for collector in STATS_COLLECTORS:
+        collector.count_objects(outcome, count)
+
+
+def profiled(function):
+    """Enable the profilers limited to a function while it runs"""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        profilers = [profiler for profiler in PROFILERS if profiler.function == function.__name__]
+        if not profilers:
+            return function(*args, **kwargs)
+
+        for profiler in profilers:
+            profiler.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            for profiler in profilers:
+                profiler.disable()
+
+    return wrapper
+
+
+def count_panel_objects(panel):
+    """Return the number of saved objects of a panel"""
+
+    return ('dashboard' in panel) + sum(len(panel.get(field, []))
+                                        for field in ('searches', 'index_patterns', 'visualizations'))
+
+
 class ElasticSearch:
 
     def __init__(self, url, index):
@@ -477,7 +606,10 @@ class ElasticSearch:
 
         self.index_url = self.url + "/" + self.index
 
-        self.requests = grimoire_con(True)
+        self.requests = requests_ses
+
+        if self.index_url in KNOWN_INDICES:
+            return
 
         res = self.requests.get(self.index_url)
 
@@ -490,23 +622,61 @@ class ElasticSearch:
                 raise Exception
             else:
                 logger.info("Created index {}".format(self.index))
+        else:
+            KNOWN_INDICES.add(self.index_url)
+
+
+def clear_caches():
+    """Forget the versions of the clusters and the indices found, so they are read again"""
+
+    ES_VERSIONS.clear()
+    KNOWN_INDICES.clear()
 
 
 def find_elasticsearch_version(elastic):
-    global ES_VER
-    global ES_VER_MID
-    if not ES_VER:
-        res = requests_ses.get(elastic.url)
+    """Return the main and mid versions of an Elasticsearch cluster, read once per URL
+
+    No module state other than the cache of versions by URL is modified,
+    so threads importing in clusters of different versions at the same
+    time get the version of their own cluster.
+    """
+    return find_cluster_version(elastic.url)
+
+
+def find_cluster_version(elastic_url):
+    """Return the main and mid versions of the Elasticsearch cluster of a URL, without using any index"""
+
+    if elastic_url not in ES_VERSIONS:
+        res = requests_ses.get(elastic_url)
         version = res.json()['version']['number'].split(".")
         main_ver = version[0]
         mid_ver = version[1]
-        ES_VER = int(main_ver)
-        ES_VER_MID = int(mid_ver)
-    return ES_VER, ES_VER_MID
+        ES_VERSIONS[elastic_url] = (int(main_ver), int(mid_ver))
+    return ES_VERSIONS[elastic_url]
+
+
+def exists_index(elastic_url, es_index):
+    """Check whether an index exists, without creating it as `ElasticSearch` does"""
+
+    index_url = elastic_url + "/" + es_index
+    if index_url in KNOWN_INDICES:
+        return True
+
+    res = requests_ses.get(index_url, verify=False)
+    if res.status_code == 404:
+        return False
+    res.raise_for_status()
+
+    KNOWN_INDICES.add(index_url)
+    return True
 
 
 def find_item_json(elastic, type_, item_id):
     """ Find and item (dashboard, vis, search, index pattern) using its id """
+    if hasattr(elastic, 'find_item_json'):
+        # Local mirrors of the Kibana index (see kidash.mirror)
+        return elastic.find_item_json(type_, item_id)
+
     elastic_ver, elastic_mid_ver = find_elasticsearch_version(elastic)
 
     if elastic_ver < 6:
@@ -527,12 +697,217 @@ def find_item_json(elastic, type_, item_id):
     if "_source" not in item_json:
         logger.debug("Can not find type %s item %s", type_, item_id)
         item_json = {}
+    elif elastic_ver < 6:
+        # Before 6.0 the type of the item is the type of the document
+        item_json = item_json["_source"]
     else:
         item_json = item_json["_source"][type_]
 
     return item_json
 
 
+def scroll_items(elastic, query=None, size=SCROLL_SIZE, source=True, seq_no=False):
+    """Iterate over the documents of an index using the scroll API
+
+    Only one page of results is kept in memory at any time, so
+    the whole index can be traversed regardless of its size.
+
+    :param elastic: ElasticSearch object of the index
+    :param query: query to filter the documents (all of them by default)
+    :param size: number of documents retrieved per request
+    :param source: include the source of the documents in the hits
+    :param seq_no: include the sequence number, primary term and version
+        of the documents in the hits
+
+    :returns: a generator of hits
+    """
+    search_url = elastic.index_url + "/_search?scroll=" + SCROLL_KEEP_ALIVE
+    query_json = {
+        "size": size,
+        "query": query if query else {"match_all": {}},
+        "sort": ["_doc"]
+    }
+    if not source:
+        query_json["_source"] = False
+    if seq_no:
+        query_json["version"] = True
+        elastic_ver, elastic_ver_mid = find_elasticsearch_version(elastic)
+        if (elastic_ver, elastic_ver_mid) >= (6, 7):
+            query_json["seq_no_primary_term"] = True
+    res = requests_ses.post(search_url, data=json.dumps(query_json),
+                            verify=False, headers=HEADERS_JSON)
+    res.raise_for_status()
+    page = res.json()
+    scroll_id = page.get('_scroll_id')
+
+    try:
+        while True:
+            hits = page['hits']['hits']
+            for hit in hits:
+                yield hit
+
+            if len(hits) < size:
+                break
+
+            scroll_json = {"scroll": SCROLL_KEEP_ALIVE, "scroll_id": scroll_id}
+            res = requests_ses.post(elastic.url + "/_search/scroll", data=json.dumps(scroll_json),
+                                    verify=False, headers=HEADERS_JSON)
+            res.raise_for_status()
+            page = res.json()
+            scroll_id = page.get('_scroll_id', scroll_id)
+    finally:
+        if scroll_id:
+            clear_json = {"scroll_id": [scroll_id]}
+            res = requests_ses.delete(elastic.url + "/_search/scroll", data=json.dumps(clear_json),
+                                      verify=False, headers=HEADERS_JSON)
+            if res.status_code != 200:
+                logger.debug("Can not clear scroll context (%s)", res.status_code)
+
+
+def get_item_doc_ref(elastic, type_, item_id):
+    """Return the Elasticsearch type and id of the document storing an item
+
+    :param elastic: ElasticSearch object of the Kibana index
+    :param type_: type of the item
+    :param item_id: id of the item, with or without the type prefix
+    :returns: a tuple with the type and the id of the document
+    """
+    elastic_ver, _ = find_elasticsearch_version(elastic)
+
+    if elastic_ver < 6:
+        return type_, item_id
+
+    if not item_id.startswith(type_ + ":"):
+        item_id = type_ + ":" + item_id
+
+    return "doc", item_id
+
+
+def get_item_from_hit(hit):
+    """Return the type, id and definition of the saved object stored in a hit
+
+    :param hit: document of the Kibana index
+    :returns: a tuple with the type, the id (without the type prefix) and
+        the JSON definition of the item
+    """
+    source = hit['_source']
+
+    if source.get('type') in source:
+        # In Elasticsearch >= 6 the type is included in the source and in the id
+        type_ = source['type']
+        item_id = hit['_id']
+        if item_id.startswith(type_ + ":"):
+            item_id = item_id[len(type_) + 1:]
+        return type_, item_id, source[type_]
+
+    return hit['_type'], hit['_id'], source
+
+
+def mget_items(elastic, docs):
+    """Retrieve a list of documents in a single multi-get request
+
+    :param elastic: ElasticSearch object of the index
+    :param docs: list of dicts with the `_id` (and `_type` if needed)
+        of the documents to retrieve
+
+    :returns: the list of documents of the response, in the same order
+    """
+    if not docs:
+        return []
+
+    res = requests_ses.post(elastic.index_url + "/_mget", data=json.dumps({"docs": docs}),
+                            verify=False, headers=HEADERS_JSON)
+    res.raise_for_status()
+
+    return res.json()['docs']
+
+
+def find_items_json(elastic, refs):
+    """Find several items (dashboards, vis, searches, index patterns) using multi-get requests
+
+    :param elastic: ElasticSearch object of the Kibana index, or a local mirror of it
+    :param refs: list of tuples with the type and the id of each item
+    :returns: a dict with the JSON of each item by its type and id,
+        which is empty for the items not found
+    """
+    refs = list(dict.fromkeys(refs))
+
+    if hasattr(elastic, 'find_item_json'):
+        # Local mirrors of the Kibana index (see kidash.mirror)
+        return {ref: elastic.find_item_json(*ref) for ref in refs}
+
+    items = {}
+    for i in range(0, len(refs), BULK_CHUNK_SIZE):
+        chunk = refs[i:i + BULK_CHUNK_SIZE]
+        docs = []
+        for type_, item_id in chunk:
+            doc_type, doc_id = get_item_doc_ref(elastic, type_, item_id)
+            docs.append({"_type": doc_type, "_id": doc_id})
+        for (type_, item_id), doc in zip(chunk, mget_items(elastic, docs)):
+            if doc.get('found'):
+                items[(type_, item_id)] = get_item_from_hit(doc)[2]
+            else:
+                logger.debug("Can not find type %s item %s", type_, item_id)
+                items[(type_, item_id)] = {}
+
+    return items
+
+
+def get_bulk_meta(es_version, doc_id, doc_type=None, index=None):
+    """Return the metadata of a bulk action on a document
+
+    Indices have no types since Elasticsearch 7, so the type of the
+    document is only included for older versions.
+
+    :param es_version: tuple with the main and mid versions of the cluster
+    :param doc_id: id of the document
+    :param doc_type: type of the document ("doc" by default)
+    :param index: index of the document, when it is not the one of the request
+    :returns: a dict with the metadata (e.g. `{"_type": "doc", "_id": "..."}`)
+    """
+    meta = {}
+    if index:
+        meta["_index"] = index
+    if es_version[0] < 7:
+        meta["_type"] = doc_type or "doc"
+    meta["_id"] = doc_id
+    return meta
+
+
+def bulk_items(elastic, actions, raise_on_error=True):
+    """Send a list of actions to Elasticsearch in a single bulk request
+
+    :param elastic: ElasticSearch object of the target index
+    :param actions: list of tuples with the action metadata (e.g.
+        `{"index": {"_id": "..."}}`) and the document for the action,
+        which is None for deletions
+    :param raise_on_error: raise an error when some action fails,
+        instead of returning its result
+
+    :returns: the list of items of the bulk response
+    """
+    lines = []
+    for action, doc in actions:
+        lines.append(json.dumps(action))
+        if doc is not None:
+            lines.append(json.dumps(doc))
+    data = "\n".join(lines) + "\n"
+
+    res = requests_ses.post(elastic.index_url + "/_bulk", data=data.encode('utf-8'),
+                            verify=False, headers={"Content-Type": "application/x-ndjson"})
+    res.raise_for_status()
+    res_json = res.json()
+
+    if res_json.get('errors') and raise_on_error:
+        for item in res_json['items']:
+            result = list(item.values())[0]
+            if 'error' in result:
+                logger.error("Bulk action failed for %s: %s", result.get('_id'), result['error'])
+        raise RuntimeError("Bulk request to %s failed for some items" % elastic.index_url)
+
+    return res_json['items']
+
+
 def clean_dashboard(dash_json, data_sources=None, add_vis_studies=False, viz_titles=None):
     """ Remove all items that are not from the data sources or that are studies"""
 
@@ -632,10 +1007,152 @@ def add_vis_style(item_json):
     return item_json
 
 
-def import_item_json(elastic, type_, item_id, item_json, data_sources=None,
-                     add_vis_studies=False, viz_titles=None):
-    """ Import an item in Elasticsearch  """
-    elastic_ver, elastic_ver_mid = find_elasticsearch_version(elastic)
+def has_index_pattern_fields(item_json):
+    """Check whether an index pattern includes the fields of its indices, not only scripted ones"""
+
+    fields = json.loads(item_json.get('fields') or '[]')
+    return any(not field.get('scripted') for field in fields)
+
+
+def strip_index_pattern_fields(item_json):
+    """Return a copy of an index pattern without the fields read from its indices
+
+    Scripted fields are kept, since they are not part of the mappings.
+    """
+    fields = json.loads(item_json.get('fields') or '[]')
+
+    item_json = copy.copy(item_json)
+    item_json['fields'] = json.dumps([field for field in fields if field.get('scripted')])
+
+    return item_json
+
+
+def get_index_pattern_fields(field_caps):
+    """Convert the field capabilities of some indices to the fields of an index pattern
+
+    :param field_caps: `fields` of a response of the field capabilities API
+    :returns: a list with the fields, sorted by name
+    """
+    fields = []
+
+    for name, caps in sorted(field_caps.items()):
+        if name.startswith('_') and name not in KIBANA_META_FIELDS:
+            continue
+        es_types = [es_type for es_type in caps if es_type not in ('object', 'nested')]
+        if not es_types:
+            continue
+
+        kibana_types = {KIBANA_FIELD_TYPES.get(es_type, 'unknown') for es_type in es_types}
+        kibana_type = kibana_types.pop() if len(kibana_types) == 1 else 'conflict'
+        searchable = any(caps[es_type].get('searchable', False) for es_type in es_types)
+        aggregatable = any(caps[es_type].get('aggregatable', False) for es_type in es_types)
+
+        fields.append({
+            "name": name,
+            "type": kibana_type,
+            "count": 0,
+            "scripted": False,
+            "searchable": searchable,
+            "aggregatable": aggregatable,
+            "readFromDocValues": aggregatable and 'text' not in es_types and not es_types[0].startswith('_')
+        })
+
+    names = {field['name'] for field in fields}
+    for name, kibana_type in (('_source', '_source'), ('_score', 'number')):
+        if name not in names:
+            fields.append({"name": name, "type": kibana_type, "count": 0, "scripted": False,
+                           "searchable": False, "aggregatable": False, "readFromDocValues": False})
+
+    return fields
+
+
+class IndexPatternFields:
+    """Fields of the index patterns, rebuilt from the mappings of their indices.
+
+    The field capabilities of the indices of each index pattern are read
+    with a single request to Elasticsearch, done once per title. They can
+    be stored in a file and read from it when working offline (without
+    an Elasticsearch URL).
+
+    :param elastic_url: Elasticsearch URL with the indices
+    :param fields_file: file with the field capabilities of each title
+    """
+    def __init__(self, elastic_url=None, fields_file=None):
+        self.elastic_url = elastic_url
+        self.fields_file = fields_file
+        self.field_caps = {}
+        self.fetched = set()
+
+        if fields_file and os.path.isfile(fields_file):
+            with open(fields_file) as f:
+                self.field_caps = json.load(f)
+
+    def get_field_caps(self, title):
+        if self.elastic_url and title not in self.fetched:
+            self.fetched.add(title)
+            with run_phase("fetch"):
+                res = requests_ses.get(self.elastic_url + "/" + title + "/_field_caps",
+                                       params={"fields": "*"}, verify=False)
+                if res.status_code == 404:
+                    logger.debug("Indices of %s not found", title)
+                else:
+                    res.raise_for_status()
+                    self.field_caps[title] = res.json()['fields']
+
+        return self.field_caps.get(title)
+
+    def rebuild(self, item_json):
+        """Return a copy of an index pattern with the fields of its indices and its scripted fields"""
+
+        field_caps = self.get_field_caps(item_json.get('title'))
+        if field_caps is None:
+            logger.warning("Fields of index pattern %s not found. They will be refreshed by Kibana.",
+                           item_json.get('title'))
+            return item_json
+
+        scripted = json.loads(strip_index_pattern_fields(item_json)['fields'])
+
+        item_json = copy.copy(item_json)
+        item_json['fields'] = json.dumps(get_index_pattern_fields(field_caps) + scripted)
+
+        return item_json
+
+    def save(self):
+        """Store the field capabilities read in the fields file"""
+
+        tmp_file = self.fields_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.field_caps, f, sort_keys=True)
+        os.replace(tmp_file, self.fields_file)
+
+
+def prepare_item_json(type_, item_id, item_json, es_version, data_sources=None,
+                      add_vis_studies=False, viz_titles=None):
+    """Apply to an item the transformations done before importing it
+
+    Items which are not from the data sources are discarded. For
+    Elasticsearch >= 6, the type is added to the id and the item is
+    wrapped in a document with its type, the dashboards heights and the
+    metric vis styles are fixed, and the release date is removed from
+    the item (>= 6.8) to be stored in the Sigils index.
+
+    :param type_: type of the item
+    :param item_id: id of the item
+    :param item_json: JSON definition of the item
+    :param es_version: tuple with the main and mid Elasticsearch versions
+    :param data_sources: data sources to be included
+    :param add_vis_studies: include visualizations for studies
+    :param viz_titles: titles of the visualizations of a dashboard
+
+    :returns: a tuple with the id of the document, the document and the
+        release date to store in the Sigils index; None when the item
+        must not be imported
+    """
+    elastic_ver, elastic_ver_mid = es_version
+    release_date = None
+
+    # Transformations must not modify the item to import
+    item_json = copy.copy(item_json)
 
     if not add_vis_studies:
         if type_ == 'dashboard':
@@ -649,25 +1166,22 @@ def import_item_json(elastic, type_, item_id, item_json, data_sources=None,
             if not is_search_from_data_sources(item_json, data_sources):
                 logger.debug("Search %s not for %s. Not included.",
                              item_id, data_sources)
-                return
+                return None
         elif type_ == 'index_pattern':
             if not is_index_pattern_from_data_sources(item_json, data_sources):
                 logger.debug("Index pattern %s not for %s. Not included.",
                              item_id, data_sources)
-                return
+                return None
         elif type_ == 'visualization':
             if not is_vis_from_data_sources(item_json, data_sources):
                 logger.debug("Vis %s not for %s. Not included.",
                              item_id, data_sources)
-                return
+                return None
 
-    if elastic_ver < 6:
-        item_json_url = elastic.index_url + "/" + type_ + "/" + item_id
-    else:
+    if elastic_ver >= 6:
         if not item_id.startswith(type_ + ":"):
             # Inside a json dashboard ids don't include type_
             item_id = type_ + ":" + item_id
-        item_json_url = elastic.index_url + "/doc/" + item_id
 
         if type_ == 'dashboard':
             # Vis height of 1 is too small for kibana6
@@ -680,13 +1194,89 @@ def import_item_json(elastic, type_, item_id, item_json, data_sources=None,
         if elastic_ver_mid >= 8:
             release_date = item_json.pop(RELEASE_DATE, None)
 
-            if release_date:
-                logger.debug("Removing `%s` from item %s since not allowed, and adding it to Sigils index"
-                             % (RELEASE_DATE, item_id))
-                add_release_item_to_sigils_index(elastic.url, item_id, type_, release_date)
-
         item_json = {"type": type_, type_: item_json}
 
+    return item_id, item_json, release_date
+
+
+def prepare_panel_items(panel, es_version, data_sources=None, add_vis_studies=False, index_fields=None):
+    """Apply to the items of a panel the transformations done before importing them
+
+    Items are returned in the same order they are imported. Those which
+    are not from the data sources, or are studies not to be included,
+    are discarded.
+
+    :param panel: dict with the panel (dashboard, vis, searches and index patterns)
+    :param es_version: tuple with the main and mid Elasticsearch versions
+    :param data_sources: data sources to be included
+    :param add_vis_studies: include visualizations for studies
+    :param index_fields: `IndexPatternFields` to rebuild the fields of the
+        index patterns exported without them
+
+    :returns: a generator of tuples with the type, the id of the document,
+        the document and the release date of each item to import
+    """
+    if 'dashboard' in panel:
+        # Get viz titles because the are needed to check what items must be
+        # excluded by data source name in case that option is enabled
+        viz_titles = {}
+        if 'visualizations' in panel:
+            for visualization in panel['visualizations']:
+                viz_id = visualization['id']
+                viz_title = visualization['value']['title']
+                viz_titles[viz_id] = viz_title
+
+        prepared = prepare_item_json("dashboard", panel['dashboard']['id'], panel['dashboard']['value'],
+                                     es_version, data_sources, add_vis_studies, viz_titles=viz_titles)
+        if prepared:
+            yield ("dashboard",) + prepared
+
+    if 'searches' in panel:
+        for search in panel['searches']:
+            prepared = prepare_item_json("search", search['id'], search['value'], es_version, data_sources)
+            if prepared:
+                yield ("search",) + prepared
+
+    if 'index_patterns' in panel:
+        for index in panel['index_patterns']:
+            if not data_sources or \
+                    is_index_pattern_from_data_sources(index, data_sources):
+                index_json = index['value']
+                if index_fields and not has_index_pattern_fields(index_json):
+                    index_json = index_fields.rebuild(index_json)
+                yield ("index-pattern",) + prepare_item_json("index-pattern", index['id'], index_json,
+                                                             es_version)
+            else:
+                logger.debug("Index pattern %s not for %s. Not included.",
+                             index['id'], data_sources)
+
+    if 'visualizations' in panel:
+        for vis in panel['visualizations']:
+            if not add_vis_studies and is_vis_study(vis):
+                logger.debug("Vis %s is for an study. Not included.", vis['id'])
+            elif not data_sources or is_vis_from_data_sources(vis, data_sources):
+                yield ("visualization",) + prepare_item_json("visualization", vis['id'], vis['value'],
+                                                             es_version)
+            else:
+                logger.debug("Vis %s not for %s. Not included.",
+                             vis['id'], data_sources)
+
+
+def write_item_json(elastic, type_, item_id, item_json, release_date=None):
+    """Write in Elasticsearch an item already prepared with `prepare_item_json`"""
+
+    elastic_ver, _ = find_elasticsearch_version(elastic)
+
+    if elastic_ver < 6:
+        item_json_url = elastic.index_url + "/" + type_ + "/" + item_id
+    else:
+        item_json_url = elastic.index_url + "/doc/" + item_id
+
+    if release_date:
+        logger.debug("Removing `%s` from item %s since not allowed, and adding it to Sigils index"
+                     % (RELEASE_DATE, item_id))
+        add_release_item_to_sigils_index(elastic.url, item_id, type_, release_date)
+
     headers = HEADERS_JSON
     res = requests_ses.post(item_json_url, data=json.dumps(item_json),
                             verify=False, headers=headers)
@@ -714,6 +1304,74 @@ def import_item_json(elastic, type_, item_id, item_json, data_sources=None,
     return item_json
 
 
+def write_items(elastic, items, es_version=None):
+    """Write in Elasticsearch items already prepared with `prepare_item_json`, using bulk requests
+
+    Release dates are written in the Sigils index within the same
+    requests. When the mapping of the Kibana index does not include
+    the release dates, it is updated and the failed items are sent again.
+
+    :param elastic: ElasticSearch object of the Kibana index
+    :param items: list of tuples with the type, the id of the document,
+        the document and the release date of each item
+    :param es_version: tuple with the main and mid versions of the cluster
+        the items were prepared for (read from the cluster by default)
+    :returns: number of items written
+    """
+    es_version = es_version or find_elasticsearch_version(elastic)
+    elastic_ver, _ = es_version
+
+    actions = []
+    for type_, item_id, item_json, release_date in items:
+        if release_date:
+            actions.append(({"index": get_bulk_meta(es_version, item_id, index=SIGILS_INDEX)},
+                            get_sigils_doc(item_id, type_, release_date)))
+        doc_type = type_ if elastic_ver < 6 else "doc"
+        actions.append(({"index": get_bulk_meta(es_version, item_id, doc_type)}, item_json))
+
+    chunk = []
+    chunk_bytes = 0
+    for i, action in enumerate(actions):
+        chunk.append(action)
+        chunk_bytes += len(json.dumps(action[1]))
+        if len(chunk) >= BULK_CHUNK_SIZE or chunk_bytes >= BULK_MAX_BYTES or i == len(actions) - 1:
+            failed = []
+            for action_sent, result in zip(chunk, bulk_items(elastic, chunk, raise_on_error=False)):
+                error = result['index'].get('error')
+                if not error:
+                    continue
+                if error['type'] == "strict_dynamic_mapping_exception" and RELEASE_DATE in error['reason']:
+                    failed.append(action_sent)
+                else:
+                    logger.error("Bulk action failed for %s: %s", result['index'].get('_id'), error)
+                    raise RuntimeError("Bulk request to %s failed for some items" % elastic.index_url)
+
+            if failed:
+                logger.debug("Field `%s` not present in `%s` mapping.", RELEASE_DATE, elastic.index)
+                put_release_date_mapping(elastic).raise_for_status()
+                bulk_items(elastic, failed)
+
+            chunk = []
+            chunk_bytes = 0
+
+    return len(items)
+
+
+def import_item_json(elastic, type_, item_id, item_json, data_sources=None,
+                     add_vis_studies=False, viz_titles=None):
+    """ Import an item in Elasticsearch  """
+    es_version = find_elasticsearch_version(elastic)
+
+    prepared = prepare_item_json(type_, item_id, item_json, es_version, data_sources,
+                                 add_vis_studies, viz_titles)
+    if not prepared:
+        return None
+
+    item_id, item_json, release_date = prepared
+
+    return write_item_json(elastic, type_, item_id, item_json, release_date)
+
+
 def put_release_date_mapping(elastic):
     """Adds mapping for `release_date` field to .kibana index in Kibana 6"""
     mapping = """
@@ -1035,7 +1693,10 @@ def create_dashboard(elastic_url, dashboard, enrich_index, kibana_host,
     return dash_url
 
 
-def search_dashboards(elastic_url, es_index=None):
+def search_dashboards(elastic_url, es_index=None, mirror=None):
+    if mirror:
+        return mirror.search_dashboards()
+
     dashboards = []
 
     if not es_index:
@@ -1069,8 +1730,8 @@ def search_dashboards(elastic_url, es_index=None):
     return dashboards
 
 
-def list_dashboards(elastic_url, es_index=None):
-    dashboards = search_dashboards(elastic_url, es_index)
+def list_dashboards(elastic_url, es_index=None, mirror=None):
+    dashboards = search_dashboards(elastic_url, es_index, mirror)
     for dash in dashboards:
         print("_id:%s title:%s" % (dash["_id"], dash["title"]))
 
@@ -1083,20 +1744,21 @@ def read_panel_file(panel_file):
                 None if not found or wrong format
     """
 
-    try:
-        logger.debug("Reading panel from directory: %s", panel_file)
-        with open(panel_file, 'r') as f:
-            kibana_str = f.read()
-    except FileNotFoundError:
-        logger.error("Panel not found (not in directory, no panels module): %s",
-                     panel_file)
-        return None
+    with run_phase("read"):
+        try:
+            logger.debug("Reading panel from directory: %s", panel_file)
+            with open(panel_file, 'r') as f:
+                kibana_str = f.read()
+        except FileNotFoundError:
+            logger.error("Panel not found (not in directory, no panels module): %s",
+                         panel_file)
+            return None
 
-    try:
-        kibana_dict = json.loads(kibana_str)
-    except ValueError:
-        logger.error("Wrong file format (not JSON): %s", panel_file)
-        return None
+        try:
+            kibana_dict = json.loads(kibana_str)
+        except ValueError:
+            logger.error("Wrong file format (not JSON): %s", panel_file)
+            return None
     return kibana_dict
 
 
@@ -1183,6 +1845,18 @@ def is_index_pattern_from_data_sources(index, data_sources):
     return found
 
 
+def get_sigils_doc(item_uuid, item_type, release_date):
+    """Return the document with the release information of an item stored in the Sigils index"""
+
+    item_id = item_uuid.split(':')[1] if ':' in item_uuid else item_uuid
+
+    return {
+        "item_id": item_id,
+        "item_type": item_type,
+        "release_date": release_date
+    }
+
+
 def add_release_item_to_sigils_index(elastic_url, item_uuid, item_type, release_date):
     """Add release information for a given item to the Sigils index
 
@@ -1193,14 +1867,9 @@ def add_release_item_to_sigils_index(elastic_url, item_uuid, item_type, release_
     """
     sigils_index_url = elastic_url + '/' + SIGILS_INDEX + '/doc/' + item_uuid
 
-    item_id = item_uuid.split(':')[1] if ':' in item_uuid else item_uuid
-
-    item_json = {
-        "item_id": item_id,
-        "item_type": item_type,
-        "release_date": release_date
-    }
-    res = requests_ses.post(sigils_index_url, data=json.dumps(item_json), verify=False, headers=HEADERS_JSON)
+    item_json = get_sigils_doc(item_uuid, item_type, release_date)
+    with run_phase("sigils"):
+        res = requests_ses.post(sigils_index_url, data=json.dumps(item_json), verify=False, headers=HEADERS_JSON)
     res.raise_for_status()
     logger.debug("Release info added to Sigils index for %s" % item_uuid)
 
@@ -1218,7 +1887,8 @@ def get_release_from_sigils_index(elastic_url, item_id, item_type):
     sigils_index_url = elastic_url + '/' + SIGILS_INDEX
 
     try:
-        res = requests_ses.get(sigils_index_url, verify=False)
+        with run_phase("sigils"):
+            res = requests_ses.get(sigils_index_url, verify=False)
         res.raise_for_status()
 
         query = {
@@ -1241,13 +1911,16 @@ def get_release_from_sigils_index(elastic_url, item_id, item_type):
         }
 
         search_url = sigils_index_url + '/_search'
-        res = requests_ses.get(search_url, data=json.dumps(query), headers=HEADERS_JSON)
+        with run_phase("sigils"):
+            res = requests_ses.get(search_url, data=json.dumps(query), headers=HEADERS_JSON)
         r_json = res.json()
         hits = r_json['hits']
+        # Elasticsearch >= 7 returns an object with the total
+        total = hits['total']['value'] if isinstance(hits['total'], dict) else hits['total']
 
-        if hits['total'] == 0:
+        if total == 0:
             logger.warning("Item %s %s not found in Sigils index" % (item_type, item_id))
-        elif hits['total'] > 1:
+        elif total > 1:
             logger.warning("Too many hits for %s %s in Sigils index" % (item_type, item_id))
         else:
             release_date = hits['hits'][0]['_source']['release_date']
@@ -1257,9 +1930,45 @@ def get_release_from_sigils_index(elastic_url, item_id, item_type):
     return release_date
 
 
+def is_new_dashboard_release(elastic_url, dashboard, es_index=None):
+    """Check whether a dashboard is newer than the one stored in Kibana
+
+    :param elastic_url: Elasticsearch URL
+    :param dashboard: dict with the id and the value of the dashboard to import
+    :param es_index: name of the Kibana index
+    """
+    dash_id = dashboard['id']
+
+    logger.debug("Retrieving dashboard %s to check release date.", dash_id)
+    elastic = ElasticSearch(elastic_url, es_index or ".kibana")
+    with run_phase("fetch"):
+        current_dashboard = {"id": dash_id, "value": get_dashboard_json(elastic, dash_id)}
+
+    stored_release_date = get_release_from_sigils_index(elastic_url, dash_id, item_type='dashboard')
+    # If there is no current release, that means current dashboard was created before adding release_date field
+    # or panel is new in this ElasticSearch server, then import dashboard
+    return new_release(current_dashboard, dashboard, stored_release_date)
+
+
+def is_new_index_pattern_release(elastic_url, index_pattern, es_index=None):
+    """Check whether an index pattern is newer than the one stored in Kibana"""
+
+    ip_id = index_pattern['id']
+
+    logger.debug("Retrieving index pattern %s to check release date.", ip_id)
+    with run_phase("fetch"):
+        current_ip = fetch_index_pattern(elastic_url, ip_id, es_index)
+
+    stored_release_date = get_release_from_sigils_index(elastic_url, ip_id, item_type='index-pattern')
+    # If there is no current release, that means current index pattern was created before adding
+    # release_date field or index pattern is new in this ElasticSearch server, then import it
+    return new_release(current_ip, index_pattern, stored_release_date)
+
+
 def import_dashboard(elastic_url, kibana_url, import_file, es_index=None,
-                     data_sources=None, add_vis_studies=False, strict=False):
-    """ Import a dashboard from a file
+                     data_sources=None, add_vis_studies=False, strict=False, index_fields=None):
+    """ Import a dashboard from a file. The fields of the index patterns exported
+        without them are rebuilt using `index_fields` (read from Elasticsearch by default).
     """
 
     logger.debug("Reading panels JSON file: %s", import_file)
@@ -1269,11 +1978,29 @@ def import_dashboard(elastic_url, kibana_url, import_file, es_index=None,
         logger.error("Can not find a valid JSON in: %s", import_file)
         raise RuntimeError("Can not find a valid JSON in: %s" % import_file)
 
+    import_panel(elastic_url, kibana_url, json_to_import, import_file, es_index,
+                 data_sources, add_vis_studies, strict, index_fields)
+
+
+def import_panel(elastic_url, kibana_url, json_to_import, panel_name, es_index=None,
+                 data_sources=None, add_vis_studies=False, strict=False, index_fields=None,
+                 journal=None):
+    """ Import a panel (dashboard or index patterns) already read
+
+    :param json_to_import: dict with the panel
+    :param panel_name: name of the panel (e.g. its file) used in the messages
+    :param journal: `ImportJournal` with the items already imported, which are skipped
+    """
+    if not index_fields:
+        index_fields = IndexPatternFields(elastic_url)
+
+    checkpoint = journal.checkpoint(elastic_url, es_index, json_to_import) if journal else None
+
     if 'dashboard' not in json_to_import and 'index_patterns' not in json_to_import:
         logger.error("Wrong file format (can't find dashboard or index_patterns fields): %s",
-                     import_file)
+                     panel_name)
         raise RuntimeError("Wrong file format (can't find dashboard or index_patterns fields): %s" %
-                           import_file)
+                           panel_name)
 
     if 'dashboard' in json_to_import:
         logger.debug("Panel detected.")
@@ -1281,53 +2008,52 @@ def import_dashboard(elastic_url, kibana_url, import_file, es_index=None,
         dash_id = json_to_import['dashboard'].get('id')
 
         if not dash_id:
-            raise ValueError("'id' field not found in ", + import_file)
+            raise ValueError("'id' field not found in %s" % panel_name)
 
         import_json = True
-        if strict:
-            logger.debug("Retrieving dashboard %s to check release date.", dash_id)
-            current_panel = fetch_dashboard(elastic_url, dash_id, es_index)
-
-            stored_release_date = get_release_from_sigils_index(elastic_url, dash_id, item_type='dashboard')
-            # If there is no current release, that means current dashboard was created before adding release_date field
-            # or panel is new in this ElasticSearch server, then import dashboard
-            import_json = new_release(current_panel['dashboard'], json_to_import['dashboard'], stored_release_date)
+        if checkpoint and checkpoint.started():
+            # The release date was checked before writing the dashboard, the first item
+            logger.info("Resuming the import of dashboard %s from %s", dash_id, panel_name)
+        elif strict:
+            import_json = is_new_dashboard_release(elastic_url, json_to_import['dashboard'], es_index)
 
         if import_json:
-            feed_dashboard(json_to_import, elastic_url, kibana_url, es_index, data_sources, add_vis_studies)
-            logger.info("Dashboard %s imported", get_dashboard_name(import_file))
+            feed_dashboard(json_to_import, elastic_url, kibana_url, es_index, data_sources, add_vis_studies,
+                           index_fields, checkpoint)
+            logger.info("Dashboard %s imported", dash_id)
 
         else:
             logger.warning("Dashboard %s not imported from %s. Newer or equal version found in Kibana.",
-                           dash_id, import_file)
+                           dash_id, panel_name)
+            count_objects("skipped", count_panel_objects(json_to_import))
 
     elif 'index_patterns' in json_to_import:
         logger.debug("Index-Pattern detected.")
 
+        to_import = []
         for index_pattern in json_to_import['index_patterns']:
             ip_id = index_pattern.get('id')
 
             if not ip_id:
-                raise ValueError("'id' field not found in ", + import_file)
+                raise ValueError("'id' field not found in %s" % panel_name)
 
             import_json = True
             if strict:
-                logger.debug("Retrieving index pattern %s to check release date.", ip_id)
-                current_ip = fetch_index_pattern(elastic_url, ip_id, es_index)
-
-                stored_release_date = get_release_from_sigils_index(elastic_url, ip_id, item_type='index-pattern')
-                # If there is no current release, that means current index pattern was created before adding
-                # release_date field or index pattern is new in this ElasticSearch server, then import it
-                import_json = new_release(current_ip, index_pattern, stored_release_date)
+                import_json = is_new_index_pattern_release(elastic_url, index_pattern, es_index)
 
             if import_json:
-                feed_dashboard({"index_patterns": [index_pattern]}, elastic_url, kibana_url,
-                               es_index, data_sources, add_vis_studies)
-                logger.info("Index pattern %s from %s imported", ip_id, get_index_patterns_name(import_file))
-
+                to_import.append(index_pattern)
             else:
                 logger.warning("Index Pattern %s not imported from %s. Newer or equal version found in Kibana.",
-                               ip_id, import_file)
+                               ip_id, panel_name)
+                count_objects("skipped")
+
+        # All the index patterns are written together
+        if to_import:
+            feed_dashboard({"index_patterns": to_import}, elastic_url, kibana_url,
+                           es_index, data_sources, add_vis_studies, index_fields, checkpoint)
+            for index_pattern in to_import:
+                logger.info("Index pattern %s from %s imported", index_pattern['id'], panel_name)
 
     else:
         logger.warning("Strict mode supported only for panels and index patterns.")
@@ -1417,10 +2143,14 @@ def check_kibana_index(es_url, kibana_url, kibana_index=".kibana"):
     kibana_index_ok = False
     kibana_index_url = es_url + "/" + kibana_index
 
+    if kibana_index_url in KNOWN_INDICES:
+        return True
+
     try:
         res = requests_ses.get(kibana_index_url, verify=False)
         res.raise_for_status()
         kibana_index_ok = True
+        KNOWN_INDICES.add(kibana_index_url)
     except Exception:
         logging.info("%s does not exist. Creating it." % kibana_index_url)
         if create_kibana_index(kibana_url, kibana_index_url):
@@ -1429,60 +2159,49 @@ def check_kibana_index(es_url, kibana_url, kibana_index=".kibana"):
     return kibana_index_ok
 
 
+@profiled
 def feed_dashboard(dashboard, elastic_url, kibana_url, es_index=None, data_sources=None,
-                   add_vis_studies=False):
+                   add_vis_studies=False, index_fields=None, checkpoint=None, outcome="imported"):
     """ Import a dashboard. If data_sources are defined, just include items
-        for this data source.
+        for this data source. Items already written according to the
+        `checkpoint` of the panel (see `kidash.journal`) are skipped.
+        Written items are counted as `outcome` (see `count_objects`).
     """
+    if not index_fields:
+        index_fields = IndexPatternFields(elastic_url)
 
     if not es_index:
         es_index = ".kibana"
 
-    # In Kibana >= 6.1 the index could not exists
-    if not check_kibana_index(elastic_url, kibana_url, es_index):
-        raise RuntimeError("Kibana checks have failed")
-
-    elastic = ElasticSearch(elastic_url, es_index)
-
-    if 'dashboard' in dashboard:
-        # Get viz titles because the are needed to check what items must be
-        # excluded by data source name in case that option is enabled
-        viz_titles = {}
-        if 'visualizations' in dashboard:
-            for visualization in dashboard['visualizations']:
-                viz_id = visualization['id']
-                viz_title = visualization['value']['title']
-                viz_titles[viz_id] = viz_title
-
-        import_item_json(elastic, "dashboard", dashboard['dashboard']['id'],
-                         dashboard['dashboard']['value'], data_sources, add_vis_studies,
-                         viz_titles=viz_titles)
-
-    if 'searches' in dashboard:
-        for search in dashboard['searches']:
-            import_item_json(elastic, "search", search['id'], search['value'],
-                             data_sources)
-
-    if 'index_patterns' in dashboard:
-        for index in dashboard['index_patterns']:
-            if not data_sources or \
-                    is_index_pattern_from_data_sources(index, data_sources):
-                import_item_json(elastic, "index-pattern",
-                                 index['id'], index['value'])
-            else:
-                logger.debug("Index pattern %s not for %s. Not included.",
-                             index['id'], data_sources)
-
-    if 'visualizations' in dashboard:
-        for vis in dashboard['visualizations']:
-            if not add_vis_studies and is_vis_study(vis):
-                logger.debug("Vis %s is for an study. Not included.", vis['id'])
-            elif not data_sources or is_vis_from_data_sources(vis, data_sources):
-                import_item_json(elastic, "visualization",
-                                 vis['id'], vis['value'])
-            else:
-                logger.debug("Vis %s not for %s. Not included.",
-                             vis['id'], data_sources)
+    with run_phase("preflight"):
+        # In Kibana >= 6.1 the index could not exists
+        if not check_kibana_index(elastic_url, kibana_url, es_index):
+            raise RuntimeError("Kibana checks have failed")
+
+        elastic = ElasticSearch(elastic_url, es_index)
+        es_version = find_elasticsearch_version(elastic)
+
+    items = []
+    nskipped = 0
+    with run_phase("transform"):
+        for item in prepare_panel_items(dashboard, es_version, data_sources, add_vis_studies, index_fields):
+            if checkpoint and checkpoint.is_done(item[1]):
+                logger.debug("%s already imported. Skipping it.", item[1])
+                nskipped += 1
+                continue
+            items.append(item)
+    count_objects("skipped", nskipped)
+    count_objects("filtered", count_panel_objects(dashboard) - nskipped - len(items))
+
+    # Items are recorded in the checkpoint once each bulk request is confirmed
+    for i in range(0, len(items), BULK_CHUNK_SIZE):
+        chunk = items[i:i + BULK_CHUNK_SIZE]
+        with run_phase("write"):
+            write_items(elastic, chunk, es_version)
+        count_objects(outcome, len(chunk))
+        if checkpoint:
+            for item in chunk:
+                checkpoint.record(item[1])
 
 
 def fetch_index_pattern(elastic_url, ip_id, es_index=None):
@@ -1509,13 +2228,15 @@ def fetch_index_pattern(elastic_url, ip_id, es_index=None):
     return index_pattern
 
 
-def fetch_dashboard(elastic_url, dash_id, es_index=None):
+@profiled
+def fetch_dashboard(elastic_url, dash_id, es_index=None, mirror=None):
     """
     Fetch a dashboard JSON definition from Kibana and return it.
 
     :param elastic_url: Elasticsearch URL
     :param dash_id: dashboard identifier
     :param es_index: kibana index
+    :param mirror: local mirror of the kibana index to read the items from
     :return: a dict with the dashboard data (vis, searches and index patterns)
     """
 
@@ -1533,53 +2254,71 @@ def fetch_dashboard(elastic_url, dash_id, es_index=None):
     if not es_index:
         es_index = ".kibana"
 
-    elastic = ElasticSearch(elastic_url, es_index)
+    if mirror:
+        elastic = mirror
+    else:
+        elastic = ElasticSearch(elastic_url, es_index)
 
-    kibana["dashboard"] = {"id": dash_id,
-                           "value": get_dashboard_json(elastic, dash_id)}
+    with run_phase("fetch"):
+        kibana["dashboard"] = {"id": dash_id,
+                               "value": get_dashboard_json(elastic, dash_id)}
 
     if "panelsJSON" not in kibana["dashboard"]["value"]:
         # The dashboard is empty. No visualizations included.
         return kibana
 
+    panels = [panel for panel in json.loads(kibana["dashboard"]["value"]["panelsJSON"])
+              if panel['type'] in ['visualization', 'search']]
+
+    # Items are read in a few multi-get requests: first the ones of the panels,
+    # then the searches of the visualizations and last their index patterns
+    with run_phase("fetch"):
+        items = find_items_json(elastic, [(panel['type'], panel['id']) for panel in panels])
+        vis_searches = [items[('visualization', panel['id'])].get("savedSearchId")
+                        for panel in panels if panel['type'] == 'visualization']
+        items.update(find_items_json(elastic, [("search", search_id) for search_id in vis_searches
+                                               if search_id and ("search", search_id) not in items]))
+
+    def get_index_pattern(item_json):
+        if "savedSearchId" in item_json:
+            item_json = items.get(("search", item_json["savedSearchId"]), {})
+        if "kibanaSavedObjectMeta" in item_json:
+            return get_index_pattern_from_meta(item_json["kibanaSavedObjectMeta"])
+        return None
+
+    index_patterns = {(panel['type'], panel['id']): get_index_pattern(items[(panel['type'], panel['id'])])
+                      for panel in panels}
+    with run_phase("fetch"):
+        items.update(find_items_json(elastic, [("index-pattern", index_pattern_id)
+                                               for index_pattern_id in index_patterns.values() if index_pattern_id]))
+
     # Export all visualizations and the index patterns and searches in them
-    for panel in json.loads(kibana["dashboard"]["value"]["panelsJSON"]):
+    for panel in panels:
         logger.debug("Analyzing panel %s (%s)", panel['id'], panel['type'])
+        item_json = items[(panel['type'], panel['id'])]
         if panel['type'] in ['visualization']:
             vis_id = panel['id']
-            vis_json = get_vis_json(elastic, vis_id)
-            kibana["visualizations"].append({"id": vis_id, "value": vis_json})
-            search_id = get_search_from_vis(elastic, vis_id)
+            kibana["visualizations"].append({"id": vis_id, "value": item_json})
+            search_id = item_json.get("savedSearchId")
             if search_id and search_id not in search_ids_done:
                 search_ids_done.append(search_id)
                 kibana["searches"].append(
                     {"id": search_id,
-                     "value": get_search_json(elastic, search_id)}
-                )
-            index_pattern_id = get_index_pattern_from_vis(elastic, vis_id)
-            if index_pattern_id and index_pattern_id not in index_ids_done:
-                index_ids_done.append(index_pattern_id)
-                kibana["index_patterns"].append(
-                    {"id": index_pattern_id,
-                     "value": get_index_pattern_json(elastic,
-                                                     index_pattern_id)}
+                     "value": items[("search", search_id)]}
                 )
         elif panel['type'] in ['search']:
             # A search could be directly visualized inside a panel
-            search_id = panel['id']
             kibana["searches"].append(
-                {"id": search_id,
-                 "value": get_search_json(elastic, search_id)}
+                {"id": panel['id'],
+                 "value": item_json}
+            )
+        index_pattern_id = index_patterns[(panel['type'], panel['id'])]
+        if index_pattern_id and index_pattern_id not in index_ids_done:
+            index_ids_done.append(index_pattern_id)
+            kibana["index_patterns"].append(
+                {"id": index_pattern_id,
+                 "value": items[("index-pattern", index_pattern_id)]}
             )
-            index_pattern_id = get_index_pattern_from_search(elastic,
-                                                             search_id)
-            if index_pattern_id and index_pattern_id not in index_ids_done:
-                index_ids_done.append(index_pattern_id)
-                kibana["index_patterns"].append(
-                    {"id": index_pattern_id,
-                     "value": get_index_pattern_json(elastic,
-                                                     index_pattern_id)}
-                )
 
     return kibana
 
@@ -1613,7 +2352,8 @@ def export_dashboard_files(dash_json, export_file, split_index_patterns=False):
                     fb.write(json.dumps(index_pattern_importable, indent=4, sort_keys=True))
 
 
-def export_dashboard(elastic_url, dash_id, export_file, es_index=None, split_index_patterns=False):
+def export_dashboard(elastic_url, dash_id, export_file, es_index=None, split_index_patterns=False,
+                     mirror=None, strip_fields=False):
     """
     Export a dashboard from Kibana to a file in JSON format. If split_index_patterns is defined it will
     store the index patterns in separate files.
@@ -1623,15 +2363,448 @@ def export_dashboard(elastic_url, dash_id, export_file, es_index=None, split_ind
     :param export_file: name of the file in which to export the dashboard
     :param es_index: name of the Kibana index
     :param split_index_patterns: store the index patterns in separate files
+    :param mirror: local mirror of the Kibana index to read the dashboard from
+    :param strip_fields: export the index patterns without the fields of their indices,
+        which are rebuilt when importing them
     """
 
     logger.debug("Exporting dashboard %s to %s", dash_id, export_file)
 
-    kibana = fetch_dashboard(elastic_url, dash_id, es_index)
+    kibana = fetch_dashboard(elastic_url, dash_id, es_index, mirror)
+
+    with run_phase("transform"):
+        if strip_fields:
+            for index_pattern in kibana.get('index_patterns', []):
+                index_pattern['value'] = strip_index_pattern_fields(index_pattern['value'])
 
-    # Add release date to identify this particular version of the panel
-    kibana['dashboard']['value'][RELEASE_DATE] = dt.utcnow().isoformat()
+        # Add release date to identify this particular version of the panel
+        kibana['dashboard']['value'][RELEASE_DATE] = dt.utcnow().isoformat()
 
-    export_dashboard_files(kibana, export_file, split_index_patterns)
+    nobjects = count_panel_objects(kibana)
+    with run_phase("write"):
+        export_dashboard_files(kibana, export_file, split_index_patterns)
+    count_objects("exported", nobjects)
 
     logger.debug("Done")
+
+
+def get_item_digest(item_json):
+    """Return a digest of the contents of an item"""
+
+    item_str = json.dumps(item_json, sort_keys=True)
+    return hashlib.sha1(item_str.encode('utf-8')).hexdigest()
+
+
+def read_export_state(state_file):
+    """Read the state of the previous incremental export"""
+
+    state = {"watermark": None, "digests": {}, "dashboards": {}}
+
+    if os.path.isfile(state_file):
+        with open(state_file, 'r') as f:
+            state.update(json.load(f))
+
+    return state
+
+
+def write_export_state(state, state_file):
+    """Store the state of an incremental export, replacing the previous one"""
+
+    state_file_tmp = state_file + ".tmp"
+    with open(state_file_tmp, 'w') as f:
+        f.write(json.dumps(state, indent=4, sort_keys=True))
+    os.replace(state_file_tmp, state_file)
+
+
+def export_changed_dashboards(elastic_url, export_dir, es_index=None, state_file=None):
+    """
+    Export to a directory the dashboards that changed since the last run.
+
+    The state of the last run (a watermark with the last `updated_at` date,
+    the digests of the items and the items included in each dashboard) is
+    stored in a local file. Only the objects updated after the watermark,
+    or those without update date, are read from Elasticsearch. Those whose
+    digest did not change are discarded, and only the dashboards which
+    include any of the remaining objects are exported. The files of the
+    rest of dashboards are left untouched, except for those of the
+    dashboards deleted since the last run, which are removed.
+
+    :param elastic_url: Elasticsearch URL
+    :param export_dir: directory in which to export the dashboards
+    :param es_index: name of the Kibana index
+    :param state_file: file with the state of the last export
+    :returns: list of dashboards exported
+    """
+    if not es_index:
+        es_index = ".kibana"
+    if not state_file:
+        state_file = os.path.join(export_dir, EXPORT_STATE_FILE)
+
+    if not os.path.isdir(export_dir):
+        os.makedirs(export_dir)
+
+    state = read_export_state(state_file)
+    watermark = state['watermark']
+
+    query = None
+    if watermark:
+        query = {
+            "bool": {
+                "should": [
+                    {"range": {"updated_at": {"gte": watermark}}},
+                    {"bool": {"must_not": {"exists": {"field": "updated_at"}}}}
+                ]
+            }
+        }
+
+    if not exists_index(elastic_url, es_index):
+        raise RuntimeError("Kibana index %s not found. Nothing to export." % es_index)
+
+    elastic = ElasticSearch(elastic_url, es_index)
+
+    changed = set()
+    for hit in scroll_items(elastic, query):
+        type_, item_id, item_json = get_item_from_hit(hit)
+        if type_ not in ['dashboard', 'visualization', 'search', 'index-pattern']:
+            continue
+
+        updated_at = hit['_source'].get('updated_at')
+        if updated_at and (not watermark or updated_at > watermark):
+            watermark = updated_at
+
+        item_key = type_ + ":" + item_id
+        digest = get_item_digest(item_json)
+        if state['digests'].get(item_key) != digest:
+            state['digests'][item_key] = digest
+            changed.add(item_key)
+
+    logger.debug("%s items changed since %s", len(changed), state['watermark'])
+
+    dash_ids = set()
+    for item_key in changed:
+        if item_key.startswith("dashboard:"):
+            dash_ids.add(item_key[len("dashboard:"):])
+    for dash_id, dash_items in state['dashboards'].items():
+        if changed.intersection(dash_items):
+            dash_ids.add(dash_id)
+
+    # Deleted dashboards are not returned by the query, so the rest of exported ones are checked
+    unchanged = [("dashboard", dash_id) for dash_id in state['dashboards'] if dash_id not in dash_ids]
+    for (_, dash_id), dash_json in find_items_json(elastic, unchanged).items():
+        if not dash_json:
+            remove_exported_dashboard(state, dash_id, export_dir)
+
+    for dash_id in sorted(dash_ids):
+        kibana = fetch_dashboard(elastic_url, dash_id, es_index)
+
+        if not kibana['dashboard']['value']:
+            remove_exported_dashboard(state, dash_id, export_dir)
+            continue
+
+        kibana['dashboard']['value'][RELEASE_DATE] = dt.utcnow().isoformat()
+
+        export_file = os.path.join(export_dir, dash_id + ".json")
+        with open(export_file, 'w') as f:
+            f.write(json.dumps(kibana, indent=4, sort_keys=True))
+
+        dash_items = []
+        for type_, field in [("visualization", "visualizations"), ("search", "searches"),
+                             ("index-pattern", "index_patterns")]:
+            dash_items.extend([type_ + ":" + item['id'] for item in kibana[field]])
+        state['dashboards'][dash_id] = sorted(dash_items)
+
+        logger.info("Dashboard %s exported to %s", dash_id, export_file)
+
+    state['watermark'] = watermark
+    write_export_state(state, state_file)
+
+    return sorted(dash_id for dash_id in dash_ids if dash_id in state['dashboards'])
+
+
+def remove_exported_dashboard(state, dash_id, export_dir):
+    """Remove a dashboard not found in Kibana from the state of the incremental export and its file"""
+
+    logger.info("Dashboard %s not found. Removing it from %s.", dash_id, export_dir)
+
+    state['dashboards'].pop(dash_id, None)
+    state['digests'].pop("dashboard:" + dash_id, None)
+
+    export_file = os.path.join(export_dir, dash_id + ".json")
+    if os.path.isfile(export_file):
+        os.remove(export_file)
+
+
+def get_index_mappings(elastic):
+    """Return the mappings of an index, resolving it if it is an alias"""
+
+    res = requests_ses.get(elastic.index_url + "/_mapping", verify=False)
+    res.raise_for_status()
+
+    # The response is keyed by the concrete index name
+    for index_mapping in res.json().values():
+        return index_mapping['mappings']
+
+    return None
+
+
+def backup_kibana(elastic_url, backup_file, es_index=None):
+    """
+    Backup all the saved objects of the Kibana index to a file in NDJSON format.
+
+    The first line of the file contains the metadata of the backup
+    (index name, Elasticsearch version and mappings) while the rest
+    of lines store each document of the index. Documents are
+    retrieved using the scroll API and written in chunks, so the
+    memory needed does not depend on the size of the index.
+
+    :param elastic_url: Elasticsearch URL
+    :param backup_file: name of the file in which to store the backup
+    :param es_index: name of the Kibana index
+    :returns: number of documents stored
+    """
+    if os.path.isfile(backup_file):
+        logger.info("%s exists. Remove it before running.", backup_file)
+        raise RuntimeError("%s exists. Remove it before running." % backup_file)
+
+    if not es_index:
+        es_index = ".kibana"
+
+    if not exists_index(elastic_url, es_index):
+        raise RuntimeError("Kibana index %s not found. Nothing to back up." % es_index)
+
+    elastic = ElasticSearch(elastic_url, es_index)
+    elastic_ver, elastic_ver_mid = find_elasticsearch_version(elastic)
+
+    header = {
+        BACKUP_HEADER: {
+            "index": es_index,
+            "version": "%s.%s" % (elastic_ver, elastic_ver_mid),
+            "date": dt.utcnow().isoformat(),
+            "mappings": get_index_mappings(elastic)
+        }
+    }
+
+    ndocs = 0
+    with open(backup_file, 'w') as f:
+        f.write(json.dumps(header) + "\n")
+
+        chunk = []
+        for hit in scroll_items(elastic):
+            doc = {"_id": hit["_id"], "_source": hit["_source"]}
+            if "_type" in hit:
+                doc["_type"] = hit["_type"]
+            chunk.append(json.dumps(doc))
+            ndocs += 1
+
+            if len(chunk) == SCROLL_SIZE:
+                f.write("\n".join(chunk) + "\n")
+                chunk = []
+        if chunk:
+            f.write("\n".join(chunk) + "\n")
+
+    logger.info("%s documents from %s stored in %s", ndocs, es_index, backup_file)
+
+    return ndocs
+
+
+def restore_kibana(elastic_url, kibana_url, backup_file, es_index=None):
+    """
+    Restore the saved objects stored in a backup file in NDJSON format.
+
+    The file is read line by line and its documents are sent to
+    Elasticsearch using bulk requests of a limited size, so the
+    memory needed does not depend on the size of the file. When the
+    Kibana index does not exist, it is created using the mappings
+    stored in the backup. Files created with `convert_panel_files`
+    are restored the same way, once checked that they were converted
+    for the version of the cluster.
+
+    :param elastic_url: Elasticsearch URL
+    :param kibana_url: Kibana URL
+    :param backup_file: name of the file with the backup
+    :param es_index: name of the Kibana index
+    :returns: number of documents restored
+    """
+    if not es_index:
+        es_index = ".kibana"
+
+    kibana_index_url = elastic_url + "/" + es_index
+    index_checked = False
+    elastic = None
+    es_version = None
+    header = {}
+
+    ndocs = 0
+    actions = []
+    actions_bytes = 0
+
+    with open(backup_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            doc = json.loads(line)
+
+            if BACKUP_HEADER in doc:
+                header = doc[BACKUP_HEADER]
+                logger.debug("Restoring backup of %s created on %s", header.get('index'), header.get('date'))
+
+                # Check the version before any change is done in the cluster
+                es_version = find_cluster_version(elastic_url)
+                if header.get('converted'):
+                    check_converted_version(header['version'], es_version)
+                else:
+                    check_backup_version(header['version'], es_version)
+
+                res = requests_ses.get(kibana_index_url, verify=False)
+                if res.status_code == 404 and header.get('mappings'):
+                    logger.info("%s does not exist. Creating it from the backup mappings.", kibana_index_url)
+                    res = requests_ses.put(kibana_index_url, data=json.dumps({"mappings": header['mappings']}),
+                                           verify=False, headers=HEADERS_JSON)
+                    res.raise_for_status()
+                    index_checked = True
+                continue
+
+            if not elastic:
+                if not index_checked and not check_kibana_index(elastic_url, kibana_url, es_index):
+                    raise RuntimeError("Kibana checks have failed")
+                elastic = ElasticSearch(elastic_url, es_index)
+                if header.get('release_date_mapping'):
+                    put_release_date_mapping(elastic).raise_for_status()
+
+            if not es_version:
+                es_version = find_cluster_version(elastic_url)
+            action = get_bulk_meta(es_version, doc["_id"], doc.get("_type"), doc.get("_index"))
+            actions.append(({"index": action}, doc["_source"]))
+            # The limit is in bytes, so non-ASCII titles and descriptions count as they are sent
+            actions_bytes += len(line.encode('utf-8'))
+
+            if len(actions) >= BULK_CHUNK_SIZE or actions_bytes >= BULK_MAX_BYTES:
+                bulk_items(elastic, actions)
+                ndocs += len(actions)
+                actions = []
+                actions_bytes = 0
+
+    if actions:
+        bulk_items(elastic, actions)
+        ndocs += len(actions)
+
+    logger.info("%s documents from %s restored in %s", ndocs, backup_file, es_index)
+
+    return ndocs
+
+
+def parse_es_version(version):
+    """Return a tuple with the main and mid versions of a version string (e.g. `6.8.6`)"""
+
+    try:
+        main_ver, mid_ver = version.split(".")[:2]
+        return int(main_ver), int(mid_ver)
+    except (AttributeError, ValueError):
+        raise ValueError("Wrong Elasticsearch version: %s" % version)
+
+
+def check_converted_version(converted_version, es_version):
+    """Check whether documents converted for a version can be imported in another one
+
+    :param converted_version: version string the documents were converted for
+    :param es_version: tuple with the main and mid versions of the cluster
+    """
+    conv_ver, conv_ver_mid = parse_es_version(converted_version)
+    elastic_ver, elastic_ver_mid = es_version
+
+    # Documents only change depending on these checks (see `prepare_item_json`)
+    if (conv_ver >= 6) != (elastic_ver >= 6) or \
+            (elastic_ver >= 6 and (conv_ver_mid >= 8) != (elastic_ver_mid >= 8)):
+        raise RuntimeError("Documents converted for Elasticsearch %s can not be imported in %s.%s" %
+                           (converted_version, elastic_ver, elastic_ver_mid))
+
+
+def check_backup_version(backup_version, es_version):
+    """Check whether a backup of the Kibana index can be restored in a cluster
+
+    Documents of the Kibana index have a type of their own before 6.0
+    and the `doc` type, with the type in their ids, in 6.x, while
+    indices have no types since 7.0. Backups are only restored in
+    clusters with the same layout of documents.
+
+    :param backup_version: version string of the cluster the backup was created in
+    :param es_version: tuple with the main and mid versions of the cluster
+    """
+    backup_ver, _ = parse_es_version(backup_version)
+    elastic_ver, elastic_ver_mid = es_version
+
+    if min(max(backup_ver, 5), 7) != min(max(elastic_ver, 5), 7):
+        raise RuntimeError("Backups of Elasticsearch %s can not be restored in %s.%s" %
+                           (backup_version, elastic_ver, elastic_ver_mid))
+
+
+def convert_panel_files(panel_files, output_file, target_version, data_sources=None, add_vis_studies=False,
+                        fields_file=None):
+    """
+    Convert panel files to the documents imported in a given Elasticsearch version.
+
+    All the transformations done when importing the panels are applied
+    offline, without connecting to Elasticsearch. The documents are
+    stored in a NDJSON file with the same format as the backups, so
+    they can be uploaded with `restore_kibana` without transforming
+    them again. Release dates removed from the items are stored as
+    documents of the Sigils index. The fields of the index patterns
+    exported without them are rebuilt from a fields file.
+
+    :param panel_files: files with the dashboards/index patterns to convert
+    :param output_file: name of the file in which to store the documents
+    :param target_version: version of Elasticsearch (e.g. `6.8`)
+    :param data_sources: data sources to be included
+    :param add_vis_studies: include visualizations for studies
+    :param fields_file: file with the fields of the indices of the index patterns
+    :returns: number of documents stored
+    """
+    if os.path.isfile(output_file):
+        logger.info("%s exists. Remove it before running.", output_file)
+        raise RuntimeError("%s exists. Remove it before running." % output_file)
+
+    es_version = parse_es_version(target_version)
+    elastic_ver, elastic_ver_mid = es_version
+    index_fields = IndexPatternFields(fields_file=fields_file)
+
+    panels = []
+    for panel_file in panel_files:
+        panel = read_panel_file(panel_file)
+        if panel is None:
+            raise RuntimeError("Can not find a valid JSON in: %s" % panel_file)
+        if 'dashboard' not in panel and 'index_patterns' not in panel:
+            raise RuntimeError("Wrong file format (can't find dashboard or index_patterns fields): %s" %
+                               panel_file)
+        panels.append(panel)
+
+    header = {
+        BACKUP_HEADER: {
+            "version": "%s.%s" % es_version,
+            "date": dt.utcnow().isoformat(),
+            "converted": [os.path.basename(panel_file) for panel_file in panel_files],
+            # Release dates are kept in the items, so they must be in the mappings
+            "release_date_mapping": elastic_ver >= 6 and elastic_ver_mid < 8
+        }
+    }
+
+    ndocs = 0
+    with open(output_file, 'w') as f:
+        f.write(json.dumps(header) + "\n")
+
+        for panel in panels:
+            for type_, item_id, item_json, release_date in prepare_panel_items(panel, es_version, data_sources,
+                                                                               add_vis_studies, index_fields):
+                doc_type = type_ if elastic_ver < 6 else "doc"
+                if release_date:
+                    sigils_doc = get_sigils_doc(item_id, type_, release_date)
+                    f.write(json.dumps(dict(get_bulk_meta(es_version, item_id, index=SIGILS_INDEX),
+                                            _source=sigils_doc)) + "\n")
+                    ndocs += 1
+                f.write(json.dumps(dict(get_bulk_meta(es_version, item_id, doc_type), _source=item_json)) + "\n")
+                ndocs += 1
+
+    logger.info("%s documents for Elasticsearch %s.%s stored in %s", ndocs, elastic_ver, elastic_ver_mid, output_file)
+
+    return ndocs
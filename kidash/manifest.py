@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .diff import diff_panel_file, format_diff
+from .kidash import (IndexPatternFields,
+                     backup_kibana,
+                     export_changed_dashboards,
+                     export_dashboard,
+                     import_panel,
+                     restore_kibana,
+                     search_dashboards)
+from .panels import read_panels
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of jobs run at the same time
+MAX_JOB_WORKERS = 4
+
+JOB_DEFAULTS = {
+    "elastic_url": "http://127.0.0.1:9200",
+    "kibana_url": "http://localhost:5601",
+    "kibana_index": ".kibana",
+    "data_sources": None,
+    "add_vis_studies": False,
+    "strict": False,
+    "fields_file": None,
+    "split_index_patterns": False,
+    "no_fields": False,
+    "state_file": None,
+    "after": []
+}
+
+JOB_OK = "ok"
+JOB_FAILED = "failed"
+JOB_SKIPPED = "skipped"
+
+
+def run_import(job):
+    index_fields = IndexPatternFields(job['elastic_url'], job['fields_file'])
+    for import_file in job['files']:
+        for panel_name, panel in read_panels(import_file, job['data_sources'], job['add_vis_studies']):
+            import_panel(job['elastic_url'], job['kibana_url'], panel, panel_name, job['kibana_index'],
+                         job['data_sources'], job['add_vis_studies'], job['strict'], index_fields)
+    if job['fields_file']:
+        index_fields.save()
+
+
+def run_export(job):
+    export_dashboard(job['elastic_url'], job['dashboard'], job['output'], job['kibana_index'],
+                     job['split_index_patterns'], strip_fields=job['no_fields'])
+
+
+def run_export_changed(job):
+    export_changed_dashboards(job['elastic_url'], job['output'], job['kibana_index'], job['state_file'])
+
+
+def run_list(job):
+    dashboards = search_dashboards(job['elastic_url'], job['kibana_index'])
+    return ["_id:%s title:%s" % (dash["_id"], dash["title"]) for dash in dashboards]
+
+
+def run_diff(job):
+    lines = []
+    for panel_file in job['files']:
+        result = diff_panel_file(job['elastic_url'], panel_file, job['kibana_index'],
+                                 job['data_sources'], job['add_vis_studies'])
+        lines.extend(format_diff(panel_file, result))
+    return lines
+
+
+def run_backup(job):
+    backup_kibana(job['elastic_url'], job['output'], job['kibana_index'])
+
+
+def run_restore(job):
+    restore_kibana(job['elastic_url'], job['kibana_url'], job['file'], job['kibana_index'])
+
+
+# Function, required parameters and whether the Kibana index is modified by each action
+JOB_ACTIONS = {
+    "import": (run_import, ["files"], True),
+    "export": (run_export, ["dashboard", "output"], False),
+    "export-changed": (run_export_changed, ["output"], False),
+    "list": (run_list, [], False),
+    "diff": (run_diff, ["files"], False),
+    "backup": (run_backup, ["output"], False),
+    "restore": (run_restore, ["file"], True)
+}
+
+
+def read_manifest(manifest_file):
+    """Read the jobs of a manifest and check them
+
+    The manifest is a JSON file with a list of jobs or a dict with
+    the list of `jobs` and the `defaults` shared by all of them.
+    Each job has an `action` (see `JOB_ACTIONS`), an optional `name`
+    and the parameters of the action, such as `elastic_url`,
+    `kibana_index`, `files`, `dashboard` or `output`. The names of the
+    jobs which must finish before a job starts are listed in `after`.
+
+    :returns: a list with the jobs, including their defaults
+    """
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as error:
+        raise ValueError("Can not read manifest %s: %s" % (manifest_file, error))
+
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+    if not isinstance(manifest, dict):
+        raise ValueError("Manifest %s is not a list of jobs nor a dict with them" % manifest_file)
+
+    defaults = manifest.get('defaults', {})
+    jobs_params = manifest.get('jobs', [])
+    if not isinstance(defaults, dict) or not isinstance(jobs_params, list) or \
+            not all(isinstance(job_params, dict) for job_params in jobs_params):
+        raise ValueError("Wrong defaults or jobs in manifest %s" % manifest_file)
+    defaults = dict(JOB_DEFAULTS, **defaults)
+
+    jobs = []
+    names = set()
+    for i, job_params in enumerate(jobs_params):
+        job = dict(defaults)
+        job.update(job_params)
+        job.setdefault('name', "%s-%s" % (job.get('action'), i + 1))
+
+        if job.get('action') not in JOB_ACTIONS:
+            raise ValueError("Unknown action %s in job %s" % (job.get('action'), job['name']))
+        if job['name'] in names:
+            raise ValueError("Duplicated job %s" % job['name'])
+        _, required, _ = JOB_ACTIONS[job['action']]
+        for param in required:
+            if not job.get(param):
+                raise ValueError("Job %s needs %s" % (job['name'], param))
+        for name in job['after']:
+            if name not in names:
+                raise ValueError("Job %s must be after %s, which is not defined before it" % (job['name'], name))
+
+        names.add(job['name'])
+        jobs.append(job)
+
+    return jobs
+
+
+def get_job_dependencies(jobs):
+    """Return the names of the jobs each job must wait for
+
+    Besides the jobs listed in `after`, a job waits for the jobs
+    defined before it which use the same Kibana index, when any of
+    them modifies it. The rest of the jobs are independent.
+    """
+    dependencies = {}
+    for i, job in enumerate(jobs):
+        _, _, writes = JOB_ACTIONS[job['action']]
+        target = (job['elastic_url'].rstrip("/"), job['kibana_index'])
+        dependencies[job['name']] = set(job['after'])
+        for previous in jobs[:i]:
+            _, _, previous_writes = JOB_ACTIONS[previous['action']]
+            if (writes or previous_writes) and target == (previous['elastic_url'].rstrip("/"), previous['kibana_index']):
+                dependencies[job['name']].add(previous['name'])
+
+    return dependencies
+
+
+def run_job(job):
+    run_action, _, _ = JOB_ACTIONS[job['action']]
+    start = time.time()
+
+    result = {"name": job['name'], "action": job['action']}
+    try:
+        output = run_action(job)
+        result['status'] = JOB_OK
+        if output:
+            result['output'] = output
+    except Exception as error:
+        # Any error only fails its own job, so the rest of jobs and the report go on
+        result['status'] = JOB_FAILED
+        result['error'] = str(error) or type(error).__name__
+        logger.error("Job %s failed: %s", job['name'], result['error'])
+    result['seconds'] = round(time.time() - start, 3)
+
+    return result
+
+
+def run_jobs(jobs, max_workers=MAX_JOB_WORKERS):
+    """
+    Run the jobs of a manifest in a single process.
+
+    All the jobs share the same HTTP session, so the connections to
+    each cluster are reused, and the Elasticsearch version of each
+    cluster is read only once. Independent jobs run concurrently,
+    while the ones depending on a failed job are skipped.
+
+    :param jobs: list of jobs (see `read_manifest`)
+    :param max_workers: maximum number of jobs run at the same time
+    :returns: a list with the result of each job, a dict with its
+        `name`, `action`, `status`, `seconds` and, when available,
+        its `output` lines and `error`
+    """
+    dependencies = get_job_dependencies(jobs)
+    results = {}
+    pending = list(jobs)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for job in list(pending):
+                deps = dependencies[job['name']]
+                if any(results.get(name, {}).get('status') in (JOB_FAILED, JOB_SKIPPED) for name in deps):
+                    logger.warning("Job %s skipped: a job it depends on failed", job['name'])
+                    results[job['name']] = {"name": job['name'], "action": job['action'],
+                                            "status": JOB_SKIPPED, "seconds": 0}
+                    pending.remove(job)
+                elif all(name in results for name in deps):
+                    running[executor.submit(run_job, job)] = job
+                    pending.remove(job)
+
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    results[job['name']] = future.result()
+
+    return [results[job['name']] for job in jobs]
+
+
+def print_job_report(results, seconds):
+    for result in results:
+        for line in result.get('output', []):
+            print(line)
+
+    print("%-30s %-15s %-8s %s" % ("Job", "Action", "Status", "Seconds"))
+    for result in results:
+        print("%-30s %-15s %-8s %s" % (result['name'], result['action'], result['status'], result['seconds']))
+        if 'error' in result:
+            print("  error: %s" % result['error'])
+
+    statuses = [result['status'] for result in results]
+    print("Total: %s jobs, %s ok, %s failed, %s skipped in %ss" %
+          (len(results), statuses.count(JOB_OK), statuses.count(JOB_FAILED), statuses.count(JOB_SKIPPED),
+           round(seconds, 3)))
+
+
+def run_manifest(manifest_file, max_workers=MAX_JOB_WORKERS):
+    """Run the jobs of a manifest and print the output of each one and a report
+
+    :returns: True when all the jobs succeeded
+    """
+    start = time.time()
+
+    jobs = read_manifest(manifest_file)
+    results = run_jobs(jobs, max_workers)
+
+    print_job_report(results, time.time() - start)
+
+    return all(result['status'] == JOB_OK for result in results)
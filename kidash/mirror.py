@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import logging
+import os.path
+import sqlite3
+from datetime import datetime as dt
+
+from .kidash import (ElasticSearch,
+                     exists_index,
+                     find_elasticsearch_version,
+                     get_item_from_hit,
+                     mget_items,
+                     scroll_items,
+                     SCROLL_SIZE)
+
+logger = logging.getLogger(__name__)
+
+MIRROR_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    es_id TEXT PRIMARY KEY,
+    es_type TEXT,
+    type TEXT,
+    item_id TEXT,
+    seq_no INTEGER,
+    primary_term INTEGER,
+    version INTEGER,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS objects_type_id ON objects (type, item_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class KibanaMirror:
+    """Local copy of the saved objects of a Kibana index.
+
+    The objects are stored in a SQLite database together with their
+    sequence number, primary term and version, which are used to
+    update the mirror incrementally. The mirror can be used instead
+    of an `ElasticSearch` object to read items with `find_item_json`,
+    so dashboards can be exported and listed without querying the
+    Elasticsearch cluster.
+
+    :param path: path to the SQLite database
+    :param create: create the database when it does not exist
+    """
+    def __init__(self, path, create=False):
+        if not create and not os.path.isfile(path):
+            raise RuntimeError("Mirror %s not found. Sync it before using it." % path)
+
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(MIRROR_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def find_item_json(self, type_, item_id):
+        """Find an item (dashboard, vis, search, index pattern) using its id"""
+
+        if item_id.startswith(type_ + ":"):
+            item_id = item_id[len(type_) + 1:]
+
+        row = self.conn.execute("SELECT es_id, es_type, source FROM objects WHERE type = ? AND item_id = ?",
+                                (type_, item_id)).fetchone()
+        if not row:
+            logger.debug("Can not find type %s item %s in mirror", type_, item_id)
+            return {}
+
+        _, _, item_json = get_item_from_hit(self._to_hit(row))
+        return item_json
+
+    def items(self, type_=None):
+        """Iterate over the documents of the mirror, returned as hits"""
+
+        if type_:
+            cursor = self.conn.execute("SELECT es_id, es_type, source FROM objects WHERE type = ?", (type_,))
+        else:
+            cursor = self.conn.execute("SELECT es_id, es_type, source FROM objects")
+
+        for row in cursor:
+            yield self._to_hit(row)
+
+    def search_dashboards(self):
+        dashboards = []
+
+        for hit in self.items("dashboard"):
+            _, _, dash_json = get_item_from_hit(hit)
+            dashboards.append({"_id": hit["_id"], "title": dash_json["title"]})
+
+        return dashboards
+
+    def versions(self):
+        """Return the sequence number, primary term and version of each document"""
+
+        cursor = self.conn.execute("SELECT es_id, seq_no, primary_term, version FROM objects")
+        return {row[0]: tuple(row[1:]) for row in cursor}
+
+    def store(self, hit, seq_no=None, primary_term=None, version=None):
+        type_, item_id, _ = get_item_from_hit(hit)
+        self.conn.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          (hit["_id"], hit.get("_type"), type_, item_id,
+                           hit.get("_seq_no", seq_no), hit.get("_primary_term", primary_term),
+                           hit.get("_version", version), json.dumps(hit["_source"])))
+
+    def delete(self, es_id):
+        self.conn.execute("DELETE FROM objects WHERE es_id = ?", (es_id,))
+
+    def commit(self):
+        self.conn.commit()
+
+    @staticmethod
+    def _to_hit(row):
+        return {"_id": row[0], "_type": row[1], "_source": json.loads(row[2])}
+
+
+def sync_mirror(elastic_url, mirror_file, es_index=None):
+    """
+    Synchronize a local mirror with the saved objects of a Kibana index.
+
+    The first synchronization reads the whole index using the scroll API.
+    The next ones only read the metadata of the documents (sequence number,
+    primary term and version) and retrieve with multi-get requests those
+    which changed since the last run. Documents removed from the index are
+    removed from the mirror too.
+
+    :param elastic_url: Elasticsearch URL
+    :param mirror_file: path to the SQLite database of the mirror
+    :param es_index: name of the Kibana index
+    :returns: a tuple with the number of documents updated and deleted
+    """
+    if not es_index:
+        es_index = ".kibana"
+
+    if not exists_index(elastic_url, es_index):
+        raise RuntimeError("Kibana index %s not found. Nothing to mirror." % es_index)
+
+    elastic = ElasticSearch(elastic_url, es_index)
+    elastic_ver, elastic_ver_mid = find_elasticsearch_version(elastic)
+
+    mirror = KibanaMirror(mirror_file, create=True)
+
+    try:
+        mirror_index = mirror.get_meta('index')
+        if mirror_index and mirror_index != es_index:
+            raise RuntimeError("Mirror %s belongs to index %s, not to %s" % (mirror_file, mirror_index, es_index))
+
+        local_versions = mirror.versions()
+        nupdated = 0
+
+        if not local_versions:
+            logger.debug("Mirror %s is empty. Reading the whole %s index.", mirror_file, es_index)
+            for hit in scroll_items(elastic, seq_no=True):
+                mirror.store(hit)
+                nupdated += 1
+            ndeleted = 0
+        else:
+            changed = []
+            remote_ids = set()
+            for hit in scroll_items(elastic, source=False, seq_no=True):
+                remote_ids.add(hit["_id"])
+                remote_version = (hit.get("_seq_no"), hit.get("_primary_term"), hit.get("_version"))
+                if local_versions.get(hit["_id"]) != remote_version:
+                    changed.append(hit)
+
+            for i in range(0, len(changed), SCROLL_SIZE):
+                chunk = changed[i:i + SCROLL_SIZE]
+                docs = [{"_id": hit["_id"], "_type": hit["_type"]} if "_type" in hit else {"_id": hit["_id"]}
+                        for hit in chunk]
+                for hit, doc in zip(chunk, mget_items(elastic, docs)):
+                    if not doc.get("found"):
+                        # Removed after reading the metadata
+                        continue
+                    mirror.store(doc, hit.get("_seq_no"), hit.get("_primary_term"), hit.get("_version"))
+                    nupdated += 1
+
+            deleted = set(local_versions) - remote_ids
+            for es_id in deleted:
+                mirror.delete(es_id)
+            ndeleted = len(deleted)
+
+        mirror.set_meta('index', es_index)
+        mirror.set_meta('version', "%s.%s" % (elastic_ver, elastic_ver_mid))
+        mirror.set_meta('synced_at', dt.utcnow().isoformat())
+        mirror.commit()
+    finally:
+        mirror.close()
+
+    logger.info("Mirror %s synced with %s: %s updated, %s deleted", mirror_file, es_index, nupdated, ndeleted)
+
+    return nupdated, ndeleted
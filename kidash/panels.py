@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import json
+import logging
+import mmap
+import os.path
+import struct
+import sys
+import tarfile
+import zipfile
+import zlib
+
+from .kidash import (STUDY_PATTERN,
+                     get_index_pattern_from_meta,
+                     read_panel_file,
+                     run_phase)
+
+logger = logging.getLogger(__name__)
+
+# First bytes of the bundle files, followed by the length of the header
+BUNDLE_MAGIC = b"KIDASHB\x01"
+BUNDLE_HEADER_LENGTH = struct.Struct(">Q")
+BUNDLE_VERSION = 1
+
+# Path used to read the panels from the standard input
+STDIN_NAME = "-"
+STDIN_PEEK_SIZE = 512
+
+# Fields of the panels with the saved objects, in import order
+PANEL_FIELDS = ['dashboard', 'searches', 'index_patterns', 'visualizations']
+
+
+def get_data_source(field, item):
+    """Return the data source of a saved object of a panel, used to filter it
+
+    :param field: field of the panel with the object (e.g. `visualizations`)
+    :param item: dict with the id and the value of the object
+    :returns: the data source (e.g. `github` for `github_issues`) or None
+        when the object is not filtered by data source
+    """
+    try:
+        if field == 'searches':
+            name = get_index_pattern_from_meta(item['value']['kibanaSavedObjectMeta'])
+        elif field in ('index_patterns', 'visualizations'):
+            name = item['value']['title']
+        else:
+            return None
+        return name.split("_")[0]
+    except (KeyError, AttributeError, TypeError, ValueError):
+        return None
+
+
+def create_bundle(panel_files, bundle_file):
+    """
+    Store several panel files in a bundle file.
+
+    Each saved object of the panels is compressed on its own. The header
+    of the bundle indexes the objects with their type, id, data source,
+    whether they are studies and their position, so they can be filtered
+    and read without decompressing the rest of objects.
+
+    :param panel_files: files with the dashboards/index patterns to store
+    :param bundle_file: name of the bundle file
+    :returns: number of objects stored
+    """
+    if os.path.isfile(bundle_file):
+        logger.info("%s exists. Remove it before running.", bundle_file)
+        raise RuntimeError("%s exists. Remove it before running." % bundle_file)
+
+    panels = []
+    blocks = []
+    offset = 0
+
+    for panel_file in panel_files:
+        panel = read_panel_file(panel_file)
+        if panel is None:
+            raise RuntimeError("Can not find a valid JSON in: %s" % panel_file)
+        if 'dashboard' not in panel and 'index_patterns' not in panel:
+            raise RuntimeError("Wrong file format (can't find dashboard or index_patterns fields): %s" %
+                               panel_file)
+
+        objects = []
+        for field in PANEL_FIELDS:
+            items = [panel[field]] if field == 'dashboard' and field in panel else panel.get(field, [])
+            for item in items:
+                block = zlib.compress(json.dumps(item).encode('utf-8'))
+                objects.append({
+                    "field": field,
+                    "id": item['id'],
+                    "title": item['value'].get('title'),
+                    "data_source": get_data_source(field, item),
+                    "study": STUDY_PATTERN in item['id'],
+                    "offset": offset,
+                    "length": len(block)
+                })
+                blocks.append(block)
+                offset += len(block)
+
+        fields = [field for field in PANEL_FIELDS if field in panel]
+        panels.append({"name": os.path.basename(panel_file), "fields": fields, "objects": objects})
+
+    header = json.dumps({"version": BUNDLE_VERSION, "panels": panels}).encode('utf-8')
+
+    with open(bundle_file, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(BUNDLE_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        for block in blocks:
+            f.write(block)
+
+    nobjects = len(blocks)
+    logger.info("%s objects from %s panels stored in %s", nobjects, len(panels), bundle_file)
+
+    return nobjects
+
+
+def is_bundle(path):
+    """Check whether a file is a bundle of panels"""
+
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(BUNDLE_MAGIC)) == BUNDLE_MAGIC
+    except OSError:
+        return False
+
+
+def is_object_needed(entry, data_sources=None, add_vis_studies=False):
+    """Check whether an object of a bundle is imported, using only its index entry"""
+
+    if entry['field'] == 'visualizations' and entry['study'] and not add_vis_studies:
+        return False
+    if data_sources and entry['data_source'] and entry['data_source'] not in data_sources:
+        return False
+    return True
+
+
+def read_bundle(bundle_file, data_sources=None, add_vis_studies=False):
+    """
+    Read the panels of a bundle file.
+
+    The file is memory-mapped and only the objects imported for the
+    given data sources (and studies) are decompressed. Visualizations
+    which are not imported are kept with just their id and title,
+    needed to clean the dashboards, and are discarded by the import.
+
+    :param bundle_file: name of the bundle file
+    :param data_sources: data sources to be included
+    :param add_vis_studies: include visualizations for studies
+    :returns: a generator of tuples with the name and the dict of each panel
+    """
+    with open(bundle_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+                raise RuntimeError("Wrong bundle format: %s" % bundle_file)
+
+            start = len(BUNDLE_MAGIC) + BUNDLE_HEADER_LENGTH.size
+            header_length, = BUNDLE_HEADER_LENGTH.unpack(data[len(BUNDLE_MAGIC):start])
+            header = json.loads(data[start:start + header_length].decode('utf-8'))
+            if header.get('version') != BUNDLE_VERSION:
+                raise RuntimeError("Bundle version %s not supported: %s" % (header.get('version'), bundle_file))
+            start += header_length
+
+            for panel_index in header['panels']:
+                panel = {field: [] for field in panel_index['fields'] if field != 'dashboard'}
+                nread = 0
+                with run_phase("read"):
+                    for entry in panel_index['objects']:
+                        if is_object_needed(entry, data_sources, add_vis_studies):
+                            offset = start + entry['offset']
+                            item = json.loads(zlib.decompress(data[offset:offset + entry['length']]))
+                            nread += 1
+                        elif entry['field'] == 'visualizations':
+                            item = {"id": entry['id'], "value": {"title": entry['title']}}
+                        else:
+                            continue
+
+                        if entry['field'] == 'dashboard':
+                            panel['dashboard'] = item
+                        else:
+                            panel[entry['field']].append(item)
+
+                logger.debug("%s of %s objects read from %s in %s", nread, len(panel_index['objects']),
+                             panel_index['name'], bundle_file)
+
+                yield panel_index['name'], panel
+
+
+def read_panel_member(archive_name, member_name, member_file):
+    """Read a panel in JSON format from a member of an archive"""
+
+    try:
+        with run_phase("read"):
+            return json.loads(member_file.read())
+    except ValueError:
+        raise RuntimeError("Wrong file format (not JSON): %s in %s" % (member_name, archive_name))
+
+
+def read_tar_panels(archive_name, fileobj=None):
+    """Read the panels of a tar archive (optionally compressed) as a stream
+
+    Members are read one by one, without seeking or extracting them,
+    so the archive can be read from a pipe.
+
+    :param archive_name: name of the archive file
+    :param fileobj: file object with the archive, instead of its name
+    :returns: a generator of tuples with the name and the dict of each panel
+    """
+    try:
+        with tarfile.open(name=None if fileobj else archive_name, fileobj=fileobj, mode='r|*') as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith('.json'):
+                    logger.debug("%s in %s is not a panel file. Skipping it.", member.name, archive_name)
+                    continue
+                panel = read_panel_member(archive_name, member.name, tar.extractfile(member))
+                yield archive_name + ":" + member.name, panel
+    except tarfile.TarError as error:
+        raise RuntimeError("Can not read the tar archive %s: %s" % (archive_name, error))
+
+
+def read_zip_panels(archive_name):
+    """Read the panels of a zip archive, one member at a time"""
+
+    with zipfile.ZipFile(archive_name) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or not member.filename.endswith('.json'):
+                logger.debug("%s in %s is not a panel file. Skipping it.", member.filename, archive_name)
+                continue
+            with archive.open(member) as member_file:
+                panel = read_panel_member(archive_name, member.filename, member_file)
+            yield archive_name + ":" + member.filename, panel
+
+
+def read_stdin_panels(stdin=None):
+    """Read a panel file or a tar archive of panels from the standard input"""
+
+    stdin = stdin or sys.stdin.buffer
+
+    # Only the buffered bytes are checked, nothing is consumed
+    start = stdin.peek(STDIN_PEEK_SIZE)
+    if start.lstrip().startswith(b'{'):
+        yield STDIN_NAME, read_panel_member(STDIN_NAME, STDIN_NAME, stdin)
+    elif start.startswith(b'PK'):
+        raise RuntimeError("Zip archives can not be read from the standard input. Use a tar archive.")
+    elif start.startswith(BUNDLE_MAGIC):
+        raise RuntimeError("Bundles can not be read from the standard input.")
+    else:
+        yield from read_tar_panels(STDIN_NAME, stdin)
+
+
+def read_panels(path, data_sources=None, add_vis_studies=False):
+    """Read the panels of a panel file, a bundle, an archive or the standard input
+
+    Archives (tar, optionally compressed, and zip) are read member by
+    member, so the memory needed depends on the size of the largest
+    panel file, not on the size of the archive. A path `-` reads a
+    panel file or a tar archive from the standard input.
+
+    :param path: path to a panel file in JSON format, a bundle, an archive or `-`
+    :param data_sources: data sources to be included, used to skip the
+        objects of bundles which are not needed
+    :param add_vis_studies: include visualizations for studies
+    :returns: a generator of tuples with the name and the dict of each panel
+    """
+    if path == STDIN_NAME:
+        yield from read_stdin_panels()
+        return
+
+    if is_bundle(path):
+        yield from read_bundle(path, data_sources, add_vis_studies)
+        return
+
+    if os.path.isfile(path) and zipfile.is_zipfile(path):
+        yield from read_zip_panels(path)
+        return
+
+    if os.path.isfile(path) and tarfile.is_tarfile(path):
+        yield from read_tar_panels(path)
+        return
+
+    panel = read_panel_file(path)
+    if panel is None:
+        raise RuntimeError("Can not find a valid JSON in: %s" % path)
+
+    yield path, panel
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import json
+import logging
+from urllib.parse import urlsplit
+
+import requests
+
+from .kidash import (IndexPatternFields,
+                     feed_dashboard,
+                     find_cluster_version,
+                     mount_adapter,
+                     prepare_panel_items,
+                     requests_ses)
+from .panels import read_panels
+
+logger = logging.getLogger(__name__)
+
+# Endpoints which read data even when they are called with POST
+READ_ENDPOINTS = ('_search', 'scroll', '_mget', '_field_caps', '_count')
+
+
+class DryRunAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter which only sends read requests.
+
+    Read requests are sent with the given adapter, while write
+    requests (PUT, DELETE and POST to endpoints which are not
+    searches or multi-gets) are recorded and answered with a
+    successful response, so nothing is modified.
+
+    :param adapter: adapter used to send the read requests
+    """
+    def __init__(self, adapter):
+        super().__init__()
+        self.adapter = adapter
+        self.reads = 0
+        self.writes = 0
+        self.bytes_sent = 0
+
+    def is_write(self, request):
+        if request.method in ('GET', 'HEAD'):
+            return False
+        endpoint = urlsplit(request.url).path.rstrip('/').rsplit('/', 1)[-1]
+        if endpoint in READ_ENDPOINTS:
+            # Clearing a scroll does not modify the data either
+            return False
+        return True
+
+    def send(self, request, **kwargs):
+        if not self.is_write(request):
+            self.reads += 1
+            return self.adapter.send(request, **kwargs)
+
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.writes += 1
+        self.bytes_sent += len(body)
+        logger.debug("Dry run: %s %s not sent (%s bytes)", request.method, request.url, len(body))
+
+        if request.url.split('?')[0].endswith('/_bulk'):
+            # Actions are followed by their source, except deletions
+            lines = [line for line in body.decode('utf-8').splitlines() if line.strip()]
+            items = []
+            i = 0
+            while i < len(lines):
+                (op, meta), = json.loads(lines[i]).items()
+                items.append({op: {"_id": meta.get('_id'), "status": 200, "result": "noop"}})
+                i += 1 if op == 'delete' else 2
+            content = {"took": 0, "errors": False, "items": items}
+        else:
+            content = {"acknowledged": True, "result": "noop"}
+
+        response = requests.models.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers['Content-Type'] = "application/json"
+        response._content = json.dumps(content).encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def plan_panel(elastic_url, kibana_url, panel, panel_name, es_index=None,
+               data_sources=None, add_vis_studies=False, index_fields=None):
+    """
+    Compute the cost of importing a panel without writing anything.
+
+    The panel is imported as `import_panel` would do it (without
+    strict checks), but the requests which write data are not sent. All
+    the local transformations are applied to the items, so the number of
+    objects and the bytes reported are the ones of a real import.
+
+    :param elastic_url: Elasticsearch URL
+    :param kibana_url: Kibana URL
+    :param panel: dict with the dashboard/index patterns to plan
+    :param panel_name: name of the panel (e.g. its file)
+    :param es_index: name of the Kibana index
+    :param data_sources: data sources to be included
+    :param add_vis_studies: include visualizations for studies
+    :param index_fields: `IndexPatternFields` to rebuild the fields of the index patterns
+    :returns: a dict with the number of `objects`, the `bytes` to send,
+        the `largest` object (id and bytes) and the number of `requests`,
+        `reads` and `writes`
+    """
+    if 'dashboard' not in panel and 'index_patterns' not in panel:
+        raise RuntimeError("Wrong file format (can't find dashboard or index_patterns fields): %s" % panel_name)
+
+    if not es_index:
+        es_index = ".kibana"
+    if not index_fields:
+        index_fields = IndexPatternFields(elastic_url)
+
+    # Objects are counted as planned, not as imported, by the stats collectors
+    with mount_adapter(DryRunAdapter(requests_ses.get_adapter(elastic_url))) as adapter:
+        if 'dashboard' in panel:
+            feed_dashboard(panel, elastic_url, kibana_url, es_index, data_sources, add_vis_studies, index_fields,
+                           outcome="planned")
+        else:
+            feed_dashboard({"index_patterns": panel['index_patterns']}, elastic_url, kibana_url,
+                           es_index, data_sources, add_vis_studies, index_fields, outcome="planned")
+
+        plan = {
+            "objects": 0,
+            "bytes": adapter.bytes_sent,
+            "largest": None,
+            "requests": adapter.reads + adapter.writes,
+            "reads": adapter.reads,
+            "writes": adapter.writes
+        }
+
+    # The Kibana index may not exist out of the dry run
+    es_version = find_cluster_version(elastic_url)
+    largest_size = 0
+    for _, item_id, item_json, _ in prepare_panel_items(panel, es_version, data_sources,
+                                                        add_vis_studies, index_fields):
+        plan['objects'] += 1
+        size = len(json.dumps(item_json))
+        if size > largest_size:
+            largest_size = size
+            plan['largest'] = {"id": item_id, "bytes": size}
+
+    return plan
+
+
+def plan_import(elastic_url, kibana_url, panel_files, es_index=None,
+                data_sources=None, add_vis_studies=False, index_fields=None):
+    """Print the objects, bytes and HTTP requests the import of some panel files (or bundles) would take"""
+
+    if not index_fields:
+        index_fields = IndexPatternFields(elastic_url)
+
+    plans = {}
+    for panel_file in panel_files:
+        for panel_name, panel in read_panels(panel_file, data_sources, add_vis_studies):
+            plan = plan_panel(elastic_url, kibana_url, panel, panel_name, es_index, data_sources, add_vis_studies,
+                              index_fields)
+            plans[panel_name] = plan
+            print("%s: %s objects, %s bytes, %s requests (%s writes)" %
+                  (panel_name, plan['objects'], plan['bytes'], plan['requests'], plan['writes']))
+            if plan['largest']:
+                print("  largest object: %s (%s bytes)" % (plan['largest']['id'], plan['largest']['bytes']))
+
+    print("Total: %s objects, %s bytes, %s requests (%s writes)" %
+          (sum(plan['objects'] for plan in plans.values()),
+           sum(plan['bytes'] for plan in plans.values()),
+           sum(plan['requests'] for plan in plans.values()),
+           sum(plan['writes'] for plan in plans.values())))
+
+    return plans
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import contextlib
+import cProfile
+import linecache
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from .kidash import PROFILERS
+
+logger = logging.getLogger(__name__)
+
+# Functions the profiles can be limited to
+PROFILED_FUNCTIONS = ["feed_dashboard", "fetch_dashboard"]
+
+CPU_PROFILE_FILE = "kidash.prof"
+MEMORY_SNAPSHOT_FILE = "kidash.tracemalloc"
+SUMMARY_FILE = "kidash-profile.txt"
+
+# Frames stored by tracemalloc for each allocation
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 20
+TOP_FUNCTIONS = 40
+
+
+class RunProfiler:
+    """CPU and memory profiler of a run, or of the calls to a function.
+
+    CPU time is measured with cProfile and memory with tracemalloc.
+    Besides the peak of memory, a snapshot of the memory allocated is
+    taken at the end of each phase of the run (see `run_phase`) when
+    more memory is in use than in the previous snapshots, so the
+    allocation sites of the largest snapshot are the ones which use
+    most memory.
+
+    :param function: name of the function to limit the profile to,
+        or None to profile from `enable` to `disable`
+    """
+    def __init__(self, function=None):
+        self.function = function
+        self.profiler = cProfile.Profile()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.calls = 0
+        self.seconds = 0.0
+        self.start = None
+        self.peak = 0
+        self.snapshot = None
+        self.snapshot_size = 0
+        self.snapshot_phase = None
+        self.tracing = False
+
+    def enable(self):
+        with self.lock:
+            self.active += 1
+            if self.active > 1:
+                # Called again from another thread or recursively
+                return
+            self.calls += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self.tracing = True
+            tracemalloc.reset_peak()
+            self.start = time.perf_counter()
+            self.profiler.enable()
+
+    def disable(self):
+        with self.lock:
+            self.active -= 1
+            if self.active > 0:
+                return
+            self.profiler.disable()
+            self.seconds += time.perf_counter() - self.start
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            self.take_snapshot("end of %s" % (self.function or "the run"))
+            if self.tracing:
+                tracemalloc.stop()
+                self.tracing = False
+
+    def take_snapshot(self, phase):
+        """Take a snapshot of the memory allocated when it is more than in the last one"""
+
+        size, _ = tracemalloc.get_traced_memory()
+        if size > self.snapshot_size:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_size = size
+            self.snapshot_phase = phase
+
+    def end_phase(self, name):
+        with self.lock:
+            if self.active:
+                self.take_snapshot("end of phase %s" % name)
+
+    def get_allocations(self, limit=TOP_ALLOCATIONS):
+        """Return the statistics of the lines which allocated most memory in the largest snapshot"""
+
+        if not self.snapshot:
+            return []
+        snapshot = self.snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+                                                tracemalloc.Filter(False, "<unknown>")])
+        return snapshot.statistics('lineno')[:limit]
+
+    def write_summary(self, summary_file):
+        with open(summary_file, 'w') as f:
+            f.write("Profile of %s: %s calls in %.3f seconds\n" % (self.function or "the run", self.calls, self.seconds))
+            f.write("Peak of memory allocated: %s bytes\n" % self.peak)
+            f.write("Memory allocated in the largest snapshot: %s bytes (%s)\n\n" %
+                    (self.snapshot_size, self.snapshot_phase))
+
+            f.write("Top allocation sites:\n")
+            for i, stat in enumerate(self.get_allocations(), 1):
+                frame = stat.traceback[0]
+                f.write("#%s: %s:%s: %.1f KiB in %s blocks\n" %
+                        (i, frame.filename, frame.lineno, stat.size / 1024, stat.count))
+                line = linecache.getline(frame.filename, frame.lineno).strip()
+                if line:
+                    f.write("    %s\n" % line)
+
+            f.write("\nTop functions by cumulative time:\n")
+            stats = pstats.Stats(self.profiler, stream=f)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+
+    def save(self, profile_dir):
+        """Write the CPU profile, the largest memory snapshot and a summary of both to a directory
+
+        The CPU profile can be read with `pstats` and the snapshot with
+        `tracemalloc.Snapshot.load`.
+        """
+        os.makedirs(profile_dir, exist_ok=True)
+        self.profiler.create_stats()
+        self.profiler.dump_stats(os.path.join(profile_dir, CPU_PROFILE_FILE))
+        if self.snapshot:
+            self.snapshot.dump(os.path.join(profile_dir, MEMORY_SNAPSHOT_FILE))
+        self.write_summary(os.path.join(profile_dir, SUMMARY_FILE))
+
+
+@contextlib.contextmanager
+def profile_run(profile_dir, function=None):
+    """Profile the run of the context, or the calls to a function within it, and save the profile in a directory
+
+    :param profile_dir: directory to save the profile in
+    :param function: name of the function to limit the profile to (see `PROFILED_FUNCTIONS`)
+    """
+    if function and function not in PROFILED_FUNCTIONS:
+        raise ValueError("%s can not be profiled. Use one of %s" % (function, ", ".join(PROFILED_FUNCTIONS)))
+
+    profiler = RunProfiler(function)
+    PROFILERS.append(profiler)
+    if not function:
+        profiler.enable()
+    try:
+        yield profiler
+    finally:
+        if not function:
+            profiler.disable()
+        PROFILERS.remove(profiler)
+        profiler.save(profile_dir)
+        logger.info("Profile of %s (%s calls, %.3f seconds, %s bytes of peak memory) saved in %s",
+                    function or "the run", profiler.calls, profiler.seconds, profiler.peak, profile_dir)
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import logging
+import os.path
+from datetime import datetime as dt
+
+from .kidash import (ES6_HEADER,
+                     RELEASE_DATE,
+                     SIGILS_INDEX,
+                     ElasticSearch,
+                     bulk_items,
+                     export_dashboard_files,
+                     find_cluster_version,
+                     get_bulk_meta,
+                     get_release_from_sigils_index,
+                     get_sigils_doc,
+                     new_release,
+                     prepare_panel_items,
+                     requests_ses,
+                     strip_index_pattern_fields)
+
+logger = logging.getLogger(__name__)
+
+SAVED_OBJECTS_API = "/api/saved_objects"
+
+# Items are prepared as for the Elasticsearch versions whose Kibana has the
+# saved objects API: release dates are stored in the Sigils index
+SAVED_OBJECTS_ES_VERSION = (7, 10)
+
+# Types of the saved objects stored in backups
+BACKUP_TYPES = ['config', 'index-pattern', 'search', 'visualization', 'dashboard']
+
+# Field of the panels in which the saved objects of each type are stored
+PANEL_TYPE_FIELDS = {
+    "visualization": "visualizations",
+    "search": "searches",
+    "index-pattern": "index_patterns"
+}
+
+
+class KibanaSavedObjects:
+    """Backend which reads and writes saved objects using the Kibana API.
+
+    Instead of writing the documents of the Kibana index, the saved
+    objects endpoints of Kibana are used, so Kibana takes care of the
+    format of the documents in each version. A whole panel is written
+    or read with a single request. The backend can be used as a mirror
+    to read items with `find_item_json`.
+
+    :param kibana_url: Kibana URL
+    """
+    def __init__(self, kibana_url):
+        self.url = kibana_url.rstrip("/") + SAVED_OBJECTS_API
+
+    def _post(self, endpoint, params=None, **kwargs):
+        res = requests_ses.post(self.url + endpoint, params=params, verify=False, **kwargs)
+        res.raise_for_status()
+        return res
+
+    def bulk_create(self, objects, overwrite=True):
+        """Create or overwrite some saved objects with a single request"""
+
+        res = self._post("/_bulk_create", params={"overwrite": str(overwrite).lower()},
+                         data=json.dumps(objects), headers=ES6_HEADER)
+
+        errors = [saved_object for saved_object in res.json()['saved_objects'] if 'error' in saved_object]
+        for saved_object in errors:
+            logger.error("Can not create %s %s: %s", saved_object['type'], saved_object['id'],
+                         saved_object['error'].get('message'))
+        if errors:
+            raise RuntimeError("%s saved objects not created in %s" % (len(errors), self.url))
+
+        return len(objects)
+
+    def bulk_get(self, refs):
+        """Read some saved objects, given their types and ids, with a single request
+
+        :returns: a list with the saved objects, those not found including an `error`
+        """
+        res = self._post("/_bulk_get", data=json.dumps(refs), headers=ES6_HEADER)
+        return res.json()['saved_objects']
+
+    def find_item_json(self, type_, item_id):
+        """Find an item (dashboard, vis, search, index pattern) using its id"""
+
+        if item_id.startswith(type_ + ":"):
+            item_id = item_id[len(type_) + 1:]
+
+        saved_object = self.bulk_get([{"type": type_, "id": item_id}])[0]
+        if 'error' in saved_object:
+            logger.debug("Can not find type %s item %s in Kibana", type_, item_id)
+            return {}
+
+        return inject_references(type_, saved_object['attributes'], saved_object.get('references', []))
+
+    def export(self, objects=None, types=None, include_references=True):
+        """Export saved objects, given their types and ids or just their types
+
+        :param objects: list of dicts with the type and the id of the objects
+        :param types: list of the types of the objects
+        :param include_references: include the objects referenced, recursively
+        :returns: the contents of the export, in NDJSON format
+        """
+        params = {"includeReferencesDeep": include_references}
+        if objects:
+            params["objects"] = objects
+        else:
+            params["type"] = types
+
+        return self._post("/_export", data=json.dumps(params), headers=ES6_HEADER).content
+
+    def import_objects(self, ndjson, overwrite=True):
+        """Import saved objects exported in NDJSON format with a single request
+
+        :returns: the number of objects imported
+        """
+        headers = {"kbn-xsrf": ES6_HEADER["kbn-xsrf"]}
+        res = self._post("/_import", params={"overwrite": str(overwrite).lower()}, headers=headers,
+                         files={"file": ("export.ndjson", ndjson, "application/ndjson")})
+
+        result = res.json()
+        for error in result.get('errors', []):
+            logger.error("Can not import %s %s: %s", error.get('type'), error.get('id'), error.get('error'))
+        if not result.get('success'):
+            raise RuntimeError("Some saved objects not imported in %s" % self.url)
+
+        return result.get('successCount', 0)
+
+
+def read_ndjson_objects(ndjson):
+    """Return the saved objects of an export, skipping its summary"""
+
+    objects = []
+    for line in ndjson.splitlines():
+        if not line.strip():
+            continue
+        saved_object = json.loads(line)
+        if 'type' in saved_object and 'id' in saved_object:
+            objects.append(saved_object)
+
+    return objects
+
+
+def inject_references(type_, attributes, references):
+    """Return the attributes of a saved object with its references inside them
+
+    Kibana >= 7 stores the ids of the objects used by a saved object in
+    a list of references, named in its attributes. They are moved back
+    to the attributes, so the item has the format of the panel files.
+    """
+    if not references:
+        return attributes
+
+    refs = {ref['name']: ref for ref in references}
+    attributes = dict(attributes)
+
+    if type_ == 'dashboard' and attributes.get('panelsJSON'):
+        panels = json.loads(attributes['panelsJSON'])
+        for panel in panels:
+            ref = refs.get(panel.pop('panelRefName', None))
+            if ref:
+                panel['id'] = ref['id']
+                panel['type'] = ref['type']
+        attributes['panelsJSON'] = json.dumps(panels)
+
+    ref = refs.get(attributes.pop('savedSearchRefName', None))
+    if ref:
+        attributes['savedSearchId'] = ref['id']
+
+    meta = attributes.get('kibanaSavedObjectMeta', {})
+    if meta.get('searchSourceJSON'):
+        search_source = json.loads(meta['searchSourceJSON'])
+        ref = refs.get(search_source.pop('indexRefName', None))
+        if ref:
+            search_source['index'] = ref['id']
+        for search_filter in search_source.get('filter', []):
+            filter_meta = search_filter.get('meta', {})
+            ref = refs.get(filter_meta.pop('indexRefName', None))
+            if ref:
+                filter_meta['index'] = ref['id']
+        attributes['kibanaSavedObjectMeta'] = dict(meta, searchSourceJSON=json.dumps(search_source))
+
+    return attributes
+
+
+def get_panel_saved_objects(panel, data_sources=None, add_vis_studies=False, index_fields=None):
+    """Return the saved objects of a panel, transformed as they would be imported
+
+    :returns: a list of tuples with each saved object and its release date
+    """
+    saved_objects = []
+    for type_, item_id, item_json, release_date in prepare_panel_items(panel, SAVED_OBJECTS_ES_VERSION,
+                                                                       data_sources, add_vis_studies,
+                                                                       index_fields):
+        saved_object = {"type": type_, "id": item_id[len(type_) + 1:], "attributes": item_json[type_]}
+        saved_objects.append((saved_object, release_date))
+
+    return saved_objects
+
+
+def saved_objects_to_panel(saved_objects, dash_id):
+    """Build a panel, with the format of the panel files, from the saved objects of a dashboard export"""
+
+    panel = {"dashboard": None,
+             "visualizations": [],
+             "index_patterns": [],
+             "searches": []}
+
+    for saved_object in saved_objects:
+        type_ = saved_object['type']
+        item = {"id": saved_object['id'],
+                "value": inject_references(type_, saved_object['attributes'], saved_object.get('references', []))}
+        if type_ == 'dashboard' and saved_object['id'] == dash_id:
+            panel['dashboard'] = item
+        elif type_ in PANEL_TYPE_FIELDS:
+            panel[PANEL_TYPE_FIELDS[type_]].append(item)
+        else:
+            logger.debug("%s %s not included in the panel", type_, saved_object['id'])
+
+    if not panel['dashboard']:
+        raise RuntimeError("Dashboard %s not found" % dash_id)
+
+    return panel
+
+
+def is_new_release_saved_object(saved_objects, elastic_url, type_, item):
+    """Check whether an item is newer than the saved object stored in Kibana"""
+
+    current = saved_objects.bulk_get([{"type": type_, "id": item['id']}])[0]
+    if 'error' in current:
+        return True
+
+    # The ids in the Sigils index do not include the type (see `get_sigils_doc`)
+    stored_release_date = get_release_from_sigils_index(elastic_url, item['id'], item_type=type_) \
+        if elastic_url else None
+    return new_release({"id": item['id'], "value": current['attributes']}, item, stored_release_date)
+
+
+def import_panel_saved_objects(saved_objects, panel, panel_name, elastic_url=None, data_sources=None,
+                               add_vis_studies=False, strict=False, index_fields=None):
+    """
+    Import a panel (dashboard or index patterns) using the saved objects API of Kibana.
+
+    All the objects of the panel are created with a single request.
+    The release dates of dashboards and index patterns are stored in
+    the Sigils index when the Elasticsearch URL is given.
+
+    :param saved_objects: `KibanaSavedObjects` backend
+    :param panel: dict with the panel
+    :param panel_name: name of the panel (e.g. its file) used in the messages
+    :param elastic_url: Elasticsearch URL, to store the release dates
+    :param data_sources: data sources to be included
+    :param add_vis_studies: include visualizations for studies
+    :param strict: only import the dashboard and index patterns newer than the stored ones
+    :param index_fields: `IndexPatternFields` used to rebuild the fields of index patterns
+    :returns: the number of saved objects created
+    """
+    if 'dashboard' not in panel and 'index_patterns' not in panel:
+        logger.error("Wrong file format (can't find dashboard or index_patterns fields): %s", panel_name)
+        raise RuntimeError("Wrong file format (can't find dashboard or index_patterns fields): %s" % panel_name)
+
+    if strict:
+        if 'dashboard' in panel:
+            if not is_new_release_saved_object(saved_objects, elastic_url, 'dashboard', panel['dashboard']):
+                logger.warning("Dashboard %s not imported from %s. Newer or equal version found in Kibana.",
+                               panel['dashboard']['id'], panel_name)
+                return 0
+        else:
+            index_patterns = [index_pattern for index_pattern in panel['index_patterns']
+                              if is_new_release_saved_object(saved_objects, elastic_url, 'index-pattern', index_pattern)]
+            panel = dict(panel, index_patterns=index_patterns)
+
+    objects = get_panel_saved_objects(panel, data_sources, add_vis_studies, index_fields)
+    if not objects:
+        return 0
+
+    saved_objects.bulk_create([saved_object for saved_object, _ in objects])
+
+    releases = [(saved_object['type'] + ":" + saved_object['id'], saved_object['type'], release_date)
+                for saved_object, release_date in objects if release_date]
+    if releases and elastic_url:
+        es_version = find_cluster_version(elastic_url)
+        actions = [({"index": get_bulk_meta(es_version, item_id)}, get_sigils_doc(item_id, type_, release_date))
+                   for item_id, type_, release_date in releases]
+        bulk_items(ElasticSearch(elastic_url, SIGILS_INDEX), actions)
+    elif releases:
+        logger.warning("Release dates of %s not stored. The Elasticsearch URL is needed.", panel_name)
+
+    logger.info("%s saved objects imported from %s", len(objects), panel_name)
+
+    return len(objects)
+
+
+def export_dashboard_saved_objects(saved_objects, dash_id, export_file, split_index_patterns=False,
+                                   strip_fields=False):
+    """Export a dashboard and the objects it uses, read with a single request, to a panel file"""
+
+    ndjson = saved_objects.export(objects=[{"type": "dashboard", "id": dash_id}])
+    panel = saved_objects_to_panel(read_ndjson_objects(ndjson), dash_id)
+
+    if strip_fields:
+        for index_pattern in panel['index_patterns']:
+            index_pattern['value'] = strip_index_pattern_fields(index_pattern['value'])
+
+    panel['dashboard']['value'][RELEASE_DATE] = dt.utcnow().isoformat()
+
+    export_dashboard_files(panel, export_file, split_index_patterns)
+
+
+def backup_saved_objects(saved_objects, backup_file):
+    """Export all the saved objects of Kibana to a file (NDJSON), with a single request"""
+
+    if os.path.isfile(backup_file):
+        raise RuntimeError("%s exists. Remove it before running." % backup_file)
+
+    ndjson = saved_objects.export(types=BACKUP_TYPES, include_references=False)
+    with open(backup_file, 'wb') as f:
+        f.write(ndjson)
+
+    logger.info("%s saved objects stored in %s", len(read_ndjson_objects(ndjson)), backup_file)
+
+
+def restore_saved_objects(saved_objects, backup_file):
+    """Import, overwriting them, the saved objects of a file exported by Kibana (NDJSON)"""
+
+    with open(backup_file, 'rb') as f:
+        ndjson = f.read()
+
+    nimported = saved_objects.import_objects(ndjson)
+    logger.info("%s saved objects restored from %s", nimported, backup_file)
+
+    return nimported
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from .kidash import STATS_COLLECTORS, mount_adapter, requests_ses
+
+logger = logging.getLogger(__name__)
+
+JSON_FORMAT = "json"
+PROMETHEUS_FORMAT = "prometheus"
+
+PHASES = ["preflight", "read", "transform", "fetch", "write", "sigils"]
+OBJECT_OUTCOMES = ["imported", "planned", "skipped", "filtered", "exported"]
+# Upper bounds, in seconds, of the buckets of the latency histograms
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+def get_endpoint_type(url):
+    """Return the type of endpoint of a request to Elasticsearch or Kibana
+
+    :returns: the API (e.g. `_bulk`, `_mget`, `_search`, `_scroll`),
+        `info` for the root, `index` and `doc` for the requests to an
+        index or a document, or `kibana` for the Kibana API
+    """
+    segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+    if not segments:
+        return "info"
+    if segments[0] == 'api':
+        return "kibana"
+    if 'scroll' in segments:
+        return "_scroll"
+    for segment in segments:
+        if segment.startswith('_') and segment != '_doc':
+            return segment
+    return "index" if len(segments) == 1 else "doc"
+
+
+class RequestStats:
+    """Number of requests to an endpoint and histogram of their latencies"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, seconds):
+        self.count += 1
+        self.seconds += seconds
+        for i, upper_bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper_bound:
+                self.buckets[i] += 1
+
+    def to_dict(self):
+        buckets = {str(upper_bound): count for upper_bound, count in zip(LATENCY_BUCKETS, self.buckets)}
+        buckets["+Inf"] = self.count
+        return {"count": self.count, "seconds": self.seconds, "latency_buckets": buckets}
+
+
+class RunStats:
+    """Metrics of a run: wall time of its phases, requests sent and objects processed.
+
+    The time of the phases is added up across threads, so it can be
+    longer than the wall time of the run when jobs run concurrently.
+    """
+    def __init__(self):
+        self.start = time.time()
+        self.end = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.requests = collections.defaultdict(RequestStats)
+        self.statuses = collections.Counter()
+        self.retries = collections.Counter()
+        self.errors = collections.Counter()
+        self.objects = dict.fromkeys(OBJECT_OUTCOMES, 0)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+
+    def add_phase(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count_objects(self, outcome, count=1):
+        with self.lock:
+            self.objects[outcome] = self.objects.get(outcome, 0) + count
+
+    def add_request(self, endpoint, seconds, bytes_sent, bytes_received=0, status=None, retries=None, error=None):
+        """Add a request to an endpoint type
+
+        :param retries: statuses (or names of the errors) of the failed attempts retried
+        :param error: name of the error of a request which got no response
+        """
+        with self.lock:
+            self.requests[endpoint].add(seconds)
+            self.bytes_sent += bytes_sent
+            self.bytes_received += bytes_received
+            if status:
+                self.statuses[str(status)] += 1
+            if error:
+                self.errors[error] += 1
+            self.retries.update(str(retry) for retry in retries or [])
+
+    def finish(self):
+        self.end = time.time()
+
+    def to_dict(self):
+        end = self.end or time.time()
+        return {
+            "start": self.start,
+            "seconds": end - self.start,
+            "phases": dict(self.phases),
+            "requests": {endpoint: stats.to_dict() for endpoint, stats in sorted(self.requests.items())},
+            "statuses": dict(self.statuses),
+            "retries": dict(self.retries),
+            "errors": dict(self.errors),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "objects": dict(self.objects)
+        }
+
+    def to_prometheus(self):
+        """Return the metrics in the text format of Prometheus, read by the textfile collector of node exporter"""
+
+        stats = self.to_dict()
+        lines = []
+
+        def add_metric(name, metric_type, help_text, samples):
+            lines.append("# HELP kidash_%s %s" % (name, help_text))
+            lines.append("# TYPE kidash_%s %s" % (name, metric_type))
+            for labels, value in samples:
+                label_text = ",".join('%s="%s"' % label for label in labels)
+                lines.append("kidash_%s%s %s" % (name, "{%s}" % label_text if label_text else "", value))
+
+        add_metric("last_run_timestamp_seconds", "gauge", "Time when the last run started.",
+                   [((), stats['start'])])
+        add_metric("run_seconds", "gauge", "Wall time of the last run.", [((), stats['seconds'])])
+        add_metric("phase_seconds", "gauge", "Wall time of each phase of the last run.",
+                   [((("phase", phase),), seconds) for phase, seconds in sorted(stats['phases'].items())])
+
+        lines.append("# HELP kidash_request_duration_seconds Latency of the requests of the last run.")
+        lines.append("# TYPE kidash_request_duration_seconds histogram")
+        for endpoint, request_stats in stats['requests'].items():
+            for upper_bound, count in request_stats['latency_buckets'].items():
+                lines.append('kidash_request_duration_seconds_bucket{endpoint="%s",le="%s"} %s' %
+                             (endpoint, upper_bound, count))
+            lines.append('kidash_request_duration_seconds_sum{endpoint="%s"} %s' % (endpoint, request_stats['seconds']))
+            lines.append('kidash_request_duration_seconds_count{endpoint="%s"} %s' % (endpoint, request_stats['count']))
+
+        add_metric("responses", "gauge", "Responses of the last run by status code.",
+                   [((("status", status),), count) for status, count in sorted(stats['statuses'].items())])
+        add_metric("retries", "gauge", "Requests retried in the last run by status code or error.",
+                   [((("status", status),), count) for status, count in sorted(stats['retries'].items())])
+        add_metric("request_errors", "gauge", "Requests of the last run which got no response, by error.",
+                   [((("error", error),), count) for error, count in sorted(stats['errors'].items())])
+        add_metric("sent_bytes", "gauge", "Bytes sent in the bodies of the requests of the last run.",
+                   [((), stats['bytes_sent'])])
+        add_metric("received_bytes", "gauge", "Bytes received in the bodies of the responses of the last run.",
+                   [((), stats['bytes_received'])])
+        add_metric("objects", "gauge", "Saved objects of the last run by outcome.",
+                   [((("outcome", outcome),), count) for outcome, count in sorted(stats['objects'].items())])
+
+        return "\n".join(lines) + "\n"
+
+    def save(self, stats_file, stats_format=JSON_FORMAT):
+        """Write the metrics to a file, replacing it atomically"""
+
+        if stats_format == PROMETHEUS_FORMAT:
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2, sort_keys=True) + "\n"
+
+        tmp_file = stats_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(content)
+        os.replace(tmp_file, stats_file)
+
+
+class StatsAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter which measures the requests sent with another adapter.
+
+    The retries done by the adapter (see `grimoire_adapter`) are read
+    from the history of the response.
+
+    :param adapter: adapter used to send the requests
+    :param stats: `RunStats` to add the requests to
+    """
+    def __init__(self, adapter, stats):
+        super().__init__()
+        self.adapter = adapter
+        self.stats = stats
+
+    def send(self, request, **kwargs):
+        body = request.body or b''
+        bytes_sent = len(body.encode('utf-8') if isinstance(body, str) else body)
+        endpoint = get_endpoint_type(request.url)
+
+        start = time.perf_counter()
+        try:
+            response = self.adapter.send(request, **kwargs)
+            bytes_received = len(response.content)
+        except Exception as error:
+            self.stats.add_request(endpoint, time.perf_counter() - start, bytes_sent, error=type(error).__name__)
+            raise
+        seconds = time.perf_counter() - start
+
+        retry = getattr(response.raw, 'retries', None)
+        history = retry.history if retry else ()
+        retries = [attempt.status or type(attempt.error).__name__ for attempt in history]
+        self.stats.add_request(endpoint, seconds, bytes_sent, bytes_received, response.status_code, retries)
+
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+@contextlib.contextmanager
+def collect_stats(stats_file, stats_format=JSON_FORMAT):
+    """Collect the metrics of the run of the context and write them to a file when it ends
+
+    :param stats_file: file to write the metrics to
+    :param stats_format: format of the file, `json` or `prometheus` (text format)
+    """
+    stats = RunStats()
+    STATS_COLLECTORS.append(stats)
+    try:
+        with mount_adapter(StatsAdapter(requests_ses.get_adapter('http://'), stats)):
+            yield stats
+    finally:
+        STATS_COLLECTORS.remove(stats)
+        stats.finish()
+        stats.save(stats_file, stats_format)
+        logger.debug("Stats of the run written in %s", stats_file)
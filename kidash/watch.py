@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import logging
+import os
+import time
+
+import requests
+
+from .kidash import (ElasticSearch,
+                     IndexPatternFields,
+                     check_kibana_index,
+                     find_elasticsearch_version,
+                     get_item_digest,
+                     prepare_panel_items,
+                     read_panel_file,
+                     write_items)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two scans of the directory
+WATCH_INTERVAL = 0.25
+# Seconds a file must not change before importing it, so it is not read while it is being saved
+WATCH_DEBOUNCE = 0.25
+# Seconds before importing again a file which failed, doubled after each failure up to the maximum
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 300
+
+
+def scan_panel_files(watch_dir):
+    """Return the modification time and the size of the panel files (JSON) of a directory and its subdirectories"""
+
+    stats = {}
+    for dir_path, _, file_names in os.walk(watch_dir):
+        for file_name in file_names:
+            if not file_name.endswith(".json"):
+                continue
+            panel_file = os.path.join(dir_path, file_name)
+            try:
+                stat = os.stat(panel_file)
+            except FileNotFoundError:
+                # Removed while scanning
+                continue
+            stats[panel_file] = (stat.st_mtime_ns, stat.st_size)
+
+    return stats
+
+
+def get_prepared_item_digest(item):
+    _, _, item_json, release_date = item
+    return get_item_digest([item_json, release_date])
+
+
+class PanelWatcher:
+    """Changes of the panel files of a directory.
+
+    Files are compared by their modification time and size. A file
+    is reported once it has not changed for `debounce` seconds. The
+    digests of the items last imported from each file are kept, so
+    only the items which changed since then are imported again. Files
+    whose import failed are reported again when they change, or once
+    a delay which doubles after each failure has passed.
+
+    :param watch_dir: directory with the panel files
+    :param debounce: seconds a file must not change before reporting it
+    """
+    def __init__(self, watch_dir, debounce=WATCH_DEBOUNCE):
+        self.watch_dir = watch_dir
+        self.debounce = debounce
+        self.stats = {}
+        self.pending = {}
+        self.digests = {}
+        self.failures = {}
+
+    def changed_files(self, now=None):
+        """Return the files changed since they were last reported, once they are stable"""
+
+        now = now if now is not None else time.time()
+        changed = []
+
+        stats = scan_panel_files(self.watch_dir)
+        for panel_file in set(self.stats) - set(stats):
+            logger.info("%s removed. Its objects are kept in Kibana.", panel_file)
+            self.forget(panel_file)
+
+        for panel_file, stat in sorted(stats.items()):
+            if self.stats.get(panel_file) == stat:
+                self.pending.pop(panel_file, None)
+                attempts, retry_at = self.failures.get(panel_file, (0, None))
+                if retry_at is not None and now >= retry_at:
+                    # Reported once per failure (see `record_failure`)
+                    self.failures[panel_file] = (attempts, None)
+                    changed.append(panel_file)
+                continue
+            # A new version of a failed file is imported as soon as it is stable
+            self.failures.pop(panel_file, None)
+            pending_stat, since = self.pending.get(panel_file, (None, None))
+            if pending_stat != stat:
+                self.pending[panel_file] = (stat, now)
+                since = now
+            if now - since >= self.debounce:
+                self.stats[panel_file] = stat
+                del self.pending[panel_file]
+                changed.append(panel_file)
+
+        return changed
+
+    def changed_items(self, panel_file, items):
+        """Return the prepared items of a file which changed since they were recorded"""
+
+        digests = self.digests.get(panel_file, {})
+        return [item for item in items if digests.get(item[1]) != get_prepared_item_digest(item)]
+
+    def record_items(self, panel_file, items):
+        """Record the prepared items of a file once they are imported"""
+
+        self.digests[panel_file] = {item[1]: get_prepared_item_digest(item) for item in items}
+        self.failures.pop(panel_file, None)
+
+    def record_failure(self, panel_file, now=None):
+        """Record a failed import of a file and return the seconds until it is reported again"""
+
+        now = now if now is not None else time.time()
+        attempts, _ = self.failures.get(panel_file, (0, None))
+        delay = min(RETRY_DELAY * 2 ** attempts, MAX_RETRY_DELAY)
+        self.failures[panel_file] = (attempts + 1, now + delay)
+
+        return delay
+
+    def forget(self, panel_file):
+        """Forget a file, so it is reported again in the next scan"""
+
+        self.stats.pop(panel_file, None)
+        self.pending.pop(panel_file, None)
+        self.digests.pop(panel_file, None)
+        self.failures.pop(panel_file, None)
+
+
+def import_changed_items(elastic, watcher, panel_file, es_version, data_sources=None,
+                         add_vis_studies=False, index_fields=None):
+    """Import the items of a panel file changed since its last import
+
+    :returns: a tuple with the number of items imported and the number of items of the file
+    """
+    panel = read_panel_file(panel_file)
+    if panel is None:
+        # Probably being edited. It is read again when it changes.
+        return 0, 0
+
+    if 'dashboard' not in panel and 'index_patterns' not in panel:
+        logger.warning("Wrong file format (can't find dashboard or index_patterns fields): %s", panel_file)
+        return 0, 0
+
+    items = list(prepare_panel_items(panel, es_version, data_sources, add_vis_studies, index_fields))
+    changed = watcher.changed_items(panel_file, items)
+    if changed:
+        write_items(elastic, changed)
+    watcher.record_items(panel_file, items)
+
+    return len(changed), len(items)
+
+
+def watch_panels(elastic_url, kibana_url, watch_dir, es_index=None, data_sources=None,
+                 add_vis_studies=False, index_fields=None, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE):
+    """
+    Import the panel files of a directory each time they change, until interrupted.
+
+    All the files are imported when starting. Then, the directory is
+    scanned every `interval` seconds, and the objects of each changed
+    file which differ from the ones of its previous version are
+    imported, using the same connection and the Elasticsearch version
+    read when starting. Objects of removed files are not deleted.
+
+    :param elastic_url: Elasticsearch URL
+    :param kibana_url: Kibana URL
+    :param watch_dir: directory with the panel files
+    :param es_index: name of the Kibana index
+    :param data_sources: data sources to be included
+    :param add_vis_studies: include visualizations for studies
+    :param index_fields: `IndexPatternFields` used to rebuild the fields of index patterns
+    :param interval: seconds between two scans of the directory
+    :param debounce: seconds a file must not change before importing it
+    """
+    if not os.path.isdir(watch_dir):
+        raise RuntimeError("%s is not a directory" % watch_dir)
+
+    if not es_index:
+        es_index = ".kibana"
+
+    if not index_fields:
+        index_fields = IndexPatternFields(elastic_url)
+
+    # In Kibana >= 6.1 the index could not exists
+    if not check_kibana_index(elastic_url, kibana_url, es_index):
+        raise RuntimeError("Kibana checks have failed")
+
+    elastic = ElasticSearch(elastic_url, es_index)
+    es_version = find_elasticsearch_version(elastic)
+
+    # Files already in the directory are imported without waiting
+    watcher = PanelWatcher(watch_dir, debounce=0)
+    logger.info("Watching %s. Press Ctrl+C to stop.", watch_dir)
+
+    try:
+        while True:
+            for panel_file in watcher.changed_files():
+                start = time.time()
+                try:
+                    nchanged, nitems = import_changed_items(elastic, watcher, panel_file, es_version,
+                                                            data_sources, add_vis_studies, index_fields)
+                except (requests.exceptions.RequestException, RuntimeError, ValueError,
+                        AttributeError, KeyError, TypeError) as error:
+                    # Errors of the cluster or of panels with a wrong format
+                    delay = watcher.record_failure(panel_file)
+                    logger.error("Can not import %s: %s. Retrying when it changes or in %ss.",
+                                 panel_file, error, delay)
+                    continue
+                if nitems:
+                    logger.info("%s: %s of %s objects imported in %.2fs", panel_file, nchanged, nitems,
+                                time.time() - start)
+            watcher.debounce = debounce
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching %s", watch_dir)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+from urllib.parse import urlsplit
+
+import requests
+
+from kidash.kidash import grimoire_adapter
+
+OVERVIEW_DASH_FILE = 'data/overview-with-index-patterns.json'
+
+PANEL_FIELDS = [("visualization", "visualizations"),
+                ("search", "searches"),
+                ("index-pattern", "index_patterns")]
+
+
+def read_overview():
+    """Return the contents of the overview panel"""
+
+    with open(OVERVIEW_DASH_FILE) as fdash:
+        return json.load(fdash)
+
+
+def panel_hits(panel):
+    """Return the items of a panel as Elasticsearch 6 hits"""
+
+    items = []
+    if 'dashboard' in panel:
+        items.append(("dashboard", panel['dashboard']))
+    for type_, field in PANEL_FIELDS:
+        items.extend([(type_, item) for item in panel.get(field, [])])
+
+    hits = []
+    for seq_no, (type_, item) in enumerate(items):
+        hits.append({"_id": type_ + ":" + item['id'], "_type": "doc",
+                     "_seq_no": seq_no, "_primary_term": 1, "_version": 1,
+                     "_source": {"type": type_, type_: item['value']}})
+
+    return hits
+
+
+class CountingAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter which records the requests sent through it.
+
+    Requests are sent with the given adapter (a new Grimoire adapter
+    by default). For each request, its method, path and the bytes
+    sent and received are recorded in `requests`.
+
+    :param adapter: adapter used to send the requests
+    """
+    def __init__(self, adapter=None):
+        super().__init__()
+        self.adapter = adapter or grimoire_adapter()
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        response = self.adapter.send(request, **kwargs)
+        self.requests.append((request.method, urlsplit(request.url).path, len(body), len(response.content)))
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+    def reset(self):
+        self.requests = []
+
+    @property
+    def bytes_sent(self):
+        return sum(request[2] for request in self.requests)
+
+    @property
+    def bytes_received(self):
+        return sum(request[3] for request in self.requests)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+"""End-to-end benchmarks of kidash against a local stand-in of Elasticsearch.
+
+Run them from the tests directory, saving the results of each commit
+and comparing them with the ones of a previous run:
+
+    python benchmark.py --output results-new.json --compare results-old.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import CountingAdapter
+from fakeserver import FakeElastic
+from kidash.kidash import (clear_caches,
+                           create_dashboard,
+                           export_dashboard,
+                           import_dashboard,
+                           list_dashboards,
+                           mount_adapter)
+from synthetic import generate_panels
+
+OPERATIONS = ["import", "export", "list", "create_dashboard"]
+SIZES = [10, 100, 1000]
+# Seconds added to each response
+LATENCIES = [0, 0.002, 0.01]
+DASH_ID = "git-dashboard-0"
+SEARCHES = 2
+# create_dashboard writes typed documents, which only Elasticsearch 5 supports
+ES_VERSION = "6.8.6"
+CREATE_DASHBOARD_ES_VERSION = "5.6.16"
+
+
+def build_panel(nobjects):
+    """Build a panel with a dashboard of `nobjects` objects: the dashboard, its index pattern, two searches
+    and the visualizations"""
+
+    nvis = max(nobjects - 1 - SEARCHES - 1, 1)
+    panels = generate_panels(visualizations=nvis, searches=SEARCHES, data_sources=["git"], seed=0)
+    return panels[DASH_ID + ".json"]
+
+
+def measure(operation, adapter):
+    """Run an operation once for the wall time and the requests, and once more for the peak of memory"""
+
+    clear_caches()
+    adapter.reset()
+    start = time.perf_counter()
+    operation()
+    seconds = time.perf_counter() - start
+    requests_sent = list(adapter.requests)
+
+    clear_caches()
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": seconds,
+            "requests": len(requests_sent),
+            "bytes_sent": sum(request[2] for request in requests_sent),
+            "bytes_received": sum(request[3] for request in requests_sent),
+            "peak_memory": peak}
+
+
+def run_benchmark(operation, nobjects, latency, workdir, repeat=1):
+    """Run an operation against a new stand-in cluster and return its measures.
+
+    The panel is imported before measuring any other operation.
+    With several repetitions, the median of the wall times is kept.
+    """
+    panel_file = os.path.join(workdir, "panel-%s.json" % nobjects)
+    if not os.path.exists(panel_file):
+        with open(panel_file, 'w') as f:
+            json.dump(build_panel(nobjects), f)
+
+    version = CREATE_DASHBOARD_ES_VERSION if operation == "create_dashboard" else ES_VERSION
+    export_file = os.path.join(workdir, "export.json")
+
+    with FakeElastic(version) as elastic, mount_adapter(CountingAdapter()) as adapter:
+        url = elastic.url
+
+        def run_operation():
+            if operation == "import":
+                import_dashboard(url, url, panel_file)
+            elif operation == "export":
+                if os.path.exists(export_file):
+                    os.remove(export_file)
+                export_dashboard(url, DASH_ID, export_file)
+            elif operation == "list":
+                with contextlib.redirect_stdout(io.StringIO()):
+                    list_dashboards(url)
+            elif operation == "create_dashboard":
+                create_dashboard(url, DASH_ID, "git_enriched", url)
+
+        if operation != "import":
+            import_dashboard(url, url, panel_file)
+
+        elastic.latency = latency
+        runs = [measure(run_operation, adapter) for _ in range(repeat)]
+
+    result = dict(runs[0], seconds=statistics.median(run['seconds'] for run in runs),
+                  peak_memory=max(run['peak_memory'] for run in runs))
+    return dict({"operation": operation, "objects": nobjects, "latency": latency}, **result)
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, previous):
+    """Print the change of the wall time and the requests of each benchmark since a previous run"""
+
+    def key(result):
+        return result['operation'], result['objects'], result['latency']
+
+    previous_results = {key(result): result for result in previous['results']}
+    print("Compared with %s (%s)" % (previous.get('commit'), previous.get('date')))
+    for result in results:
+        old = previous_results.get(key(result))
+        if not old:
+            continue
+        print("%-16s %5s objects %6.3fs latency: %8.3fs -> %8.3fs (%+.0f%%), %6s -> %6s requests" %
+              (result['operation'], result['objects'], result['latency'], old['seconds'], result['seconds'],
+               (result['seconds'] / old['seconds'] - 1) * 100 if old['seconds'] else 0,
+               old['requests'], result['requests']))
+
+
+def get_params():
+    parser = argparse.ArgumentParser(description="Benchmark kidash against a local stand-in of Elasticsearch")
+    parser.add_argument("--operations", nargs='+', choices=OPERATIONS, default=OPERATIONS)
+    parser.add_argument("--sizes", nargs='+', type=int, default=SIZES, help="objects of the dashboards")
+    parser.add_argument("--latencies", nargs='+', type=float, default=LATENCIES,
+                        help="seconds added to each response")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each benchmark")
+    parser.add_argument("--output", help="JSON file to save the results in")
+    parser.add_argument("--compare", help="JSON file with the results of a previous run")
+    return parser.parse_args()
+
+
+def main():
+    args = get_params()
+
+    workdir = tempfile.mkdtemp(prefix='kidash_bench_')
+    results = []
+    try:
+        for operation in args.operations:
+            for nobjects in args.sizes:
+                for latency in args.latencies:
+                    result = run_benchmark(operation, nobjects, latency, workdir, args.repeat)
+                    results.append(result)
+                    print("%-16s %5s objects %6.3fs latency: %8.3fs %6s requests %10s bytes %10s peak" %
+                          (operation, nobjects, latency, result['seconds'], result['requests'],
+                           result['bytes_sent'] + result['bytes_received'], result['peak_memory']))
+    finally:
+        shutil.rmtree(workdir)
+
+    report = {"commit": get_commit(),
+              "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+              "python": platform.python_version(),
+              "results": results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
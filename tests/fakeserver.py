@@ -0,0 +1,564 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import email.parser
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeHTTPServer:
+    """In-process HTTP server which stands in for a remote service in tests.
+
+    The server listens on a random local port. Each request is recorded
+    with its method, path and size, and dispatched to `dispatch`, which
+    returns the status and the payload (encoded as JSON) of the response.
+
+    Slow or unreliable services are simulated delaying every response
+    `latency` seconds, and answering a random share of the requests with
+    `error_status` or with 429 (Too Many Requests) instead of dispatching
+    them. The random generator is seeded, so failures are repeatable.
+
+    :param latency: seconds each response is delayed
+    :param error_rate: share of the requests answered with `error_status`
+    :param throttle_rate: share of the requests answered with 429
+    :param error_status: status of the failed requests
+    :param seed: seed of the random generator of failures
+    """
+    def __init__(self, latency=0.0, error_rate=0.0, throttle_rate=0.0, error_status=503, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.requests = []
+        self.lock = threading.RLock()
+        self.server = None
+        self.thread = None
+        self.url = None
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are sent in different writes, which would wait for delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                split = urlsplit(self.path)
+                params = {key: value[0] for key, value in parse_qs(split.query).items()}
+                with fake.lock:
+                    fake.requests.append((self.command, split.path, len(body)))
+                    failure = fake.random.random()
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if failure < fake.throttle_rate:
+                    status, payload = 429, {"error": {"type": "es_rejected_execution_exception"}, "status": 429}
+                elif failure < fake.throttle_rate + fake.error_rate:
+                    status, payload = fake.error_status, {"error": {"type": "unavailable"}, "status": fake.error_status}
+                else:
+                    with fake.lock:
+                        status, payload = fake.dispatch(self.command, split.path, params, self.headers, body)
+                self.reply(status, payload)
+
+            def reply(self, status, payload):
+                if isinstance(payload, bytes):
+                    data = payload
+                else:
+                    data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = handle_request
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        self.url = "http://127.0.0.1:%s" % self.server.server_address[1]
+
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def dispatch(self, method, path, params, headers, body):
+        return 404, {"error": "Not Found"}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def extract_references(type_, attributes):
+    """Move the ids of the objects used by a saved object to its references, as Kibana 7 does"""
+
+    attributes = dict(attributes)
+    references = []
+
+    if type_ == 'dashboard' and attributes.get('panelsJSON'):
+        panels = json.loads(attributes['panelsJSON'])
+        for i, panel in enumerate(panels):
+            if 'id' in panel:
+                name = "panel_%s" % i
+                references.append({"name": name, "type": panel.pop('type'), "id": panel.pop('id')})
+                panel['panelRefName'] = name
+        attributes['panelsJSON'] = json.dumps(panels)
+
+    if attributes.get('savedSearchId'):
+        references.append({"name": "search_0", "type": "search", "id": attributes.pop('savedSearchId')})
+        attributes['savedSearchRefName'] = "search_0"
+
+    meta = attributes.get('kibanaSavedObjectMeta', {})
+    if meta.get('searchSourceJSON'):
+        search_source = json.loads(meta['searchSourceJSON'])
+        if isinstance(search_source.get('index'), str):
+            name = "kibanaSavedObjectMeta.searchSourceJSON.index"
+            references.append({"name": name, "type": "index-pattern", "id": search_source.pop('index')})
+            search_source['indexRefName'] = name
+        attributes['kibanaSavedObjectMeta'] = dict(meta, searchSourceJSON=json.dumps(search_source))
+
+    return attributes, references
+
+
+class FakeKibana(FakeHTTPServer):
+    """Stand-in for the saved objects API of Kibana 7.
+
+    Saved objects are stored with their references extracted from their
+    attributes, as Kibana does, and exported with the objects they use.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.saved_objects = {}
+
+    def put_saved_object(self, type_, obj_id, attributes, references=None):
+        if references is None:
+            attributes, references = extract_references(type_, attributes)
+        self.saved_objects[(type_, obj_id)] = {"type": type_, "id": obj_id, "attributes": attributes,
+                                               "references": references}
+
+    def get_saved_object(self, type_, obj_id):
+        saved_object = self.saved_objects.get((type_, obj_id))
+        if not saved_object:
+            return {"type": type_, "id": obj_id,
+                    "error": {"statusCode": 404, "message": "Saved object [%s/%s] not found" % (type_, obj_id)}}
+        return saved_object
+
+    def dispatch(self, method, path, params, headers, body):
+        if not path.startswith("/api/saved_objects/"):
+            return 404, {"error": "Not Found"}
+        if method != 'POST':
+            return 405, {"error": "Method Not Allowed"}
+        if headers.get('kbn-xsrf') is None:
+            return 400, {"error": "Bad Request", "message": "Request must contain a kbn-xsrf header."}
+
+        endpoint = path[len("/api/saved_objects/"):]
+        overwrite = params.get('overwrite') == 'true'
+
+        if endpoint == '_bulk_create':
+            return 200, {"saved_objects": [self.bulk_create(obj, overwrite) for obj in json.loads(body)]}
+        elif endpoint == '_bulk_get':
+            return 200, {"saved_objects": [self.get_saved_object(ref['type'], ref['id']) for ref in json.loads(body)]}
+        elif endpoint == '_export':
+            return self.export(json.loads(body))
+        elif endpoint == '_import':
+            return self.import_objects(headers, body, overwrite)
+
+        return 404, {"error": "Not Found"}
+
+    def bulk_create(self, saved_object, overwrite):
+        key = (saved_object['type'], saved_object['id'])
+        if key in self.saved_objects and not overwrite:
+            return {"type": key[0], "id": key[1], "error": {"statusCode": 409, "message": "Conflict"}}
+        self.put_saved_object(key[0], key[1], saved_object['attributes'], saved_object.get('references'))
+        return self.saved_objects[key]
+
+    def export(self, params):
+        if params.get('objects'):
+            pending = [(obj['type'], obj['id']) for obj in params['objects']]
+        else:
+            pending = [key for key in self.saved_objects if key[0] in params.get('type', [])]
+
+        exported = []
+        while pending:
+            key = pending.pop(0)
+            if key in exported or key not in self.saved_objects:
+                continue
+            exported.append(key)
+            if params.get('includeReferencesDeep'):
+                pending.extend((ref['type'], ref['id']) for ref in self.saved_objects[key]['references'])
+
+        lines = [json.dumps(self.saved_objects[key]) for key in exported]
+        lines.append(json.dumps({"exportedCount": len(exported), "missingRefCount": 0, "missingReferences": []}))
+
+        return 200, "\n".join(lines).encode('utf-8')
+
+    def import_objects(self, headers, body, overwrite):
+        # Multipart form with the file
+        message = email.parser.BytesParser().parsebytes(b"Content-Type: " + headers['Content-Type'].encode() +
+                                                        b"\r\n\r\n" + body)
+        ndjson = b''.join(part.get_payload(decode=True) for part in message.get_payload()
+                          if part.get_param('name', header='content-disposition') == 'file')
+
+        errors = []
+        count = 0
+        for line in ndjson.decode('utf-8').splitlines():
+            saved_object = json.loads(line)
+            if 'type' not in saved_object:
+                continue
+            result = self.bulk_create(saved_object, overwrite)
+            if 'error' in result:
+                errors.append({"type": result['type'], "id": result['id'], "error": result['error']})
+            else:
+                count += 1
+
+        return 200, {"success": not errors, "successCount": count, "errors": errors}
+
+
+def get_field(source, field):
+    """Return the value of a field (with dots for inner fields) of a document, or None"""
+
+    if field.endswith('.keyword'):
+        field = field[:-len('.keyword')]
+    value = source
+    for name in field.split('.'):
+        if not isinstance(value, dict) or name not in value:
+            return None
+        value = value[name]
+    return value
+
+
+def match_query(doc_id, source, query):
+    """Check whether a document matches the subset of the query DSL used by kidash"""
+
+    def clauses(value):
+        return value if isinstance(value, list) else [value]
+
+    if not query or 'match_all' in query:
+        return True
+    if 'term' in query:
+        field, value = list(query['term'].items())[0]
+        value = value['value'] if isinstance(value, dict) else value
+        return get_field(source, field) == value
+    if 'terms' in query:
+        field, values = list(query['terms'].items())[0]
+        return get_field(source, field) in values
+    if 'ids' in query:
+        return doc_id in query['ids']['values']
+    if 'exists' in query:
+        return get_field(source, query['exists']['field']) is not None
+    if 'range' in query:
+        field, conditions = list(query['range'].items())[0]
+        value = get_field(source, field)
+        operators = {'gt': str.__gt__, 'gte': str.__ge__, 'lt': str.__lt__, 'lte': str.__le__}
+        return value is not None and all(operators[op](value, limit) for op, limit in conditions.items())
+    if 'bool' in query:
+        bool_query = query['bool']
+        should = clauses(bool_query.get('should', []))
+        return all(match_query(doc_id, source, clause)
+                   for key in ('must', 'filter') for clause in clauses(bool_query.get(key, []))) and \
+            not any(match_query(doc_id, source, clause) for clause in clauses(bool_query.get('must_not', []))) and \
+            (not should or any(match_query(doc_id, source, clause) for clause in should))
+
+    raise ValueError("Query not supported: %s" % query)
+
+
+def find_strict_field(mapping, source, dynamic=None, path=""):
+    """Return the first field of a document not allowed by a strict mapping, or None"""
+
+    dynamic = mapping.get('dynamic', dynamic)
+    properties = mapping.get('properties', {})
+    for name, value in source.items():
+        field = path + name
+        if name not in properties:
+            if dynamic == 'strict':
+                return field
+            continue
+        if isinstance(value, dict) and 'properties' in properties[name]:
+            inner = find_strict_field(properties[name], value, dynamic, field + ".")
+            if inner:
+                return inner
+
+    return None
+
+
+def merge_mapping(mapping, update):
+    for name, value in update.items():
+        if name == 'properties':
+            properties = mapping.setdefault('properties', {})
+            for field, field_mapping in value.items():
+                merge_mapping(properties.setdefault(field, {}), field_mapping)
+        else:
+            mapping[name] = value
+
+
+class FakeElastic(FakeHTTPServer):
+    """Stand-in for the Elasticsearch endpoints used by kidash, and the Kibana settings API.
+
+    It supports the root version, index GET/PUT/DELETE, document
+    GET/POST/PUT/DELETE, `_search` (with scroll), `_mget`, `_bulk`,
+    `_mapping` and `_field_caps`. Strict mappings reject documents
+    with unknown fields, as the Kibana index does for `release_date`.
+    As the same server serves `/api/kibana/settings`, its URL can be
+    used both as the Elasticsearch and the Kibana URL.
+
+    :param version: Elasticsearch version number returned by the root endpoint
+    """
+    def __init__(self, version="6.8.6", **kwargs):
+        super().__init__(**kwargs)
+        self.version = version
+        self.major = int(version.split('.')[0])
+        self.indices = {}
+        self.scrolls = {}
+        self.kibana_settings = {}
+        self.seq_no = 0
+
+    def create_index(self, index, mappings=None):
+        """Create an index. Typed mappings (`{"doc": {...}}`) are stored as the mapping of their type"""
+
+        mappings = mappings or {}
+        mapping_type = "doc"
+        if mappings and 'properties' not in mappings and 'dynamic' not in mappings:
+            mapping_type, mappings = list(mappings.items())[0]
+        self.indices[index] = {"mapping": mappings, "type": mapping_type, "docs": {}, "field_caps": {}}
+
+    def put_doc(self, index, doc_id, source, doc_type="doc"):
+        """Store a document, creating its index if needed. Return whether it is new"""
+
+        if index not in self.indices:
+            self.create_index(index)
+        docs = self.indices[index]["docs"]
+        self.seq_no += 1
+        version = docs[doc_id]["_version"] + 1 if doc_id in docs else 1
+        docs[doc_id] = {"_type": doc_type, "_source": source, "_version": version,
+                        "_seq_no": self.seq_no, "_primary_term": 1}
+        return version == 1
+
+    def get_doc(self, index, doc_id):
+        return self.indices.get(index, {}).get("docs", {}).get(doc_id)
+
+    def get_total(self, total):
+        return total if self.major < 7 else {"value": total, "relation": "eq"}
+
+    def get_mappings(self, index):
+        mapping = self.indices[index]["mapping"]
+        return {"mappings": mapping if self.major >= 7 else {self.indices[index]["type"]: mapping}}
+
+    def dispatch(self, method, path, params, headers, body):
+        names = [name for name in path.split('/') if name]
+        try:
+            body_json = json.loads(body) if body and not names[-1:] == ['_bulk'] else None
+        except ValueError:
+            return 400, {"error": {"type": "parse_exception"}, "status": 400}
+
+        if not names:
+            return 200, {"name": "fake", "version": {"number": self.version}}
+        if names[:3] == ['api', 'kibana', 'settings'] and len(names) == 4 and method == 'POST':
+            return self.set_kibana_setting(headers, names[3], body_json)
+        if names == ['_search', 'scroll']:
+            return self.scroll(method, body_json)
+        if names == ['_bulk'] and method == 'POST':
+            return self.bulk(None, body)
+        if names == ['_mget'] and method == 'POST':
+            return self.mget(None, body_json)
+
+        index, rest = names[0], names[1:]
+        if not rest:
+            return self.index_request(method, index, body_json)
+        if rest[0] == '_bulk' and method == 'POST':
+            return self.bulk(index, body)
+        if index not in self.indices and rest[0].startswith('_'):
+            return 404, {"error": {"type": "index_not_found_exception", "index": index}, "status": 404}
+        if rest[0] == '_search' or rest[-1:] == ['_search']:
+            return self.search(index, params, body_json)
+        if rest[0] == '_mget' and method == 'POST':
+            return self.mget(index, body_json)
+        if rest[0] == '_mapping':
+            if method == 'GET':
+                return 200, {index: self.get_mappings(index)}
+            merge_mapping(self.indices[index]["mapping"], body_json)
+            return 200, {"acknowledged": True}
+        if rest[0] == '_field_caps':
+            return 200, {"indices": [index], "fields": self.indices[index]["field_caps"]}
+        if len(rest) == 2:
+            return self.doc_request(method, index, rest[0], rest[1], body_json)
+
+        return 400, {"error": {"type": "illegal_argument_exception", "reason": "%s %s" % (method, path)}, "status": 400}
+
+    def index_request(self, method, index, body_json):
+        if method in ('GET', 'HEAD'):
+            if index not in self.indices:
+                return 404, {"error": {"type": "index_not_found_exception", "index": index}, "status": 404}
+            return 200, {index: self.get_mappings(index)}
+        if method == 'PUT':
+            if index in self.indices:
+                return 400, {"error": {"type": "resource_already_exists_exception", "index": index}, "status": 400}
+            self.create_index(index, (body_json or {}).get('mappings'))
+            return 200, {"acknowledged": True, "index": index}
+        if method == 'DELETE':
+            if self.indices.pop(index, None) is None:
+                return 404, {"error": {"type": "index_not_found_exception", "index": index}, "status": 404}
+            return 200, {"acknowledged": True}
+
+        return 405, {"error": "Method Not Allowed", "status": 405}
+
+    def doc_request(self, method, index, doc_type, doc_id, body_json):
+        if method == 'GET':
+            doc = self.get_doc(index, doc_id)
+            if not doc:
+                return 404, {"_index": index, "_type": doc_type, "_id": doc_id, "found": False}
+            return 200, {"_index": index, "_type": doc["_type"], "_id": doc_id, "_version": doc["_version"],
+                         "found": True, "_source": doc["_source"]}
+        if method in ('POST', 'PUT'):
+            error = self.check_mapping(index, body_json, doc_type)
+            if error:
+                return 400, {"error": error, "status": 400}
+            created = self.put_doc(index, doc_id, body_json, doc_type)
+            result = "created" if created else "updated"
+            return (201 if created else 200), {"_index": index, "_id": doc_id, "result": result}
+        if method == 'DELETE':
+            found = self.indices.get(index, {}).get("docs", {}).pop(doc_id, None)
+            result = "deleted" if found else "not_found"
+            return (200 if found else 404), {"_index": index, "_id": doc_id, "result": result}
+
+        return 405, {"error": "Method Not Allowed", "status": 405}
+
+    def check_mapping(self, index, source, doc_type="doc"):
+        # Before 6.0 each type of an index has its own mapping
+        if index not in self.indices or (self.major < 6 and doc_type != self.indices[index]["type"]):
+            return None
+        field = find_strict_field(self.indices[index]["mapping"], source)
+        if not field:
+            return None
+        name = field.split('.')[-1]
+        parent = field[:-len(name) - 1] if '.' in field else "doc"
+        return {"type": "strict_dynamic_mapping_exception",
+                "reason": "mapping set to strict, dynamic introduction of [%s] within [%s] is not allowed" % (name, parent)}
+
+    def get_hit(self, index, doc_id, doc, source=True, seq_no=False):
+        hit = {"_index": index, "_type": doc["_type"], "_id": doc_id}
+        if source is not False:
+            hit["_source"] = doc["_source"]
+        if seq_no:
+            hit.update({key: doc[key] for key in ("_version", "_seq_no", "_primary_term")})
+        return hit
+
+    def search(self, index, params, body_json):
+        body_json = body_json or {}
+        size = int(body_json.get('size', params.get('size', 10)))
+        hits = [self.get_hit(index, doc_id, doc, body_json.get('_source', True), body_json.get('seq_no_primary_term'))
+                for doc_id, doc in self.indices[index]["docs"].items()
+                if match_query(doc_id, doc["_source"], body_json.get('query'))]
+
+        response = {"took": 1, "timed_out": False, "hits": {"total": self.get_total(len(hits)), "hits": hits[:size]}}
+        if 'scroll' in params:
+            scroll_id = uuid.uuid4().hex
+            self.scrolls[scroll_id] = (hits[size:], size)
+            response["_scroll_id"] = scroll_id
+
+        return 200, response
+
+    def scroll(self, method, body_json):
+        if method == 'DELETE':
+            scroll_ids = body_json.get('scroll_id', [])
+            for scroll_id in scroll_ids if isinstance(scroll_ids, list) else [scroll_ids]:
+                self.scrolls.pop(scroll_id, None)
+            return 200, {"succeeded": True, "num_freed": len(scroll_ids)}
+
+        scroll_id = body_json['scroll_id']
+        if scroll_id not in self.scrolls:
+            return 404, {"error": {"type": "search_context_missing_exception"}, "status": 404}
+        pending, size = self.scrolls[scroll_id]
+        self.scrolls[scroll_id] = (pending[size:], size)
+        return 200, {"_scroll_id": scroll_id, "hits": {"total": self.get_total(len(pending)), "hits": pending[:size]}}
+
+    def mget(self, index, body_json):
+        docs = []
+        refs = body_json['docs'] if 'docs' in body_json else [{"_id": doc_id} for doc_id in body_json['ids']]
+        for ref in refs:
+            ref_index = ref.get('_index', index)
+            doc = self.get_doc(ref_index, ref['_id'])
+            if doc:
+                found = self.get_hit(ref_index, ref['_id'], doc, seq_no=True)
+                found["found"] = True
+                docs.append(found)
+            else:
+                docs.append({"_index": ref_index, "_id": ref['_id'], "found": False})
+
+        return 200, {"docs": docs}
+
+    def bulk(self, index, body):
+        lines = [line for line in body.decode('utf-8').split('\n') if line.strip()]
+        items = []
+        while lines:
+            (action, meta), = json.loads(lines.pop(0)).items()
+            action_index = meta.get('_index', index)
+            if action == 'delete':
+                found = self.indices.get(action_index, {}).get("docs", {}).pop(meta['_id'], None)
+                items.append({action: {"_index": action_index, "_id": meta['_id'], "status": 200 if found else 404,
+                                       "result": "deleted" if found else "not_found"}})
+                continue
+
+            source = json.loads(lines.pop(0))
+            if self.major >= 7 and meta.get('_type', "_doc") != "_doc":
+                # Indices have a single type since Elasticsearch 7
+                reason = "Rejecting mapping update to [%s] as the final mapping would have more than 1 type" % action_index
+                items.append({action: {"_index": action_index, "_id": meta['_id'], "status": 400,
+                                       "error": {"type": "illegal_argument_exception", "reason": reason}}})
+                continue
+            error = self.check_mapping(action_index, source, meta.get('_type', "doc"))
+            if not error and action == 'create' and self.get_doc(action_index, meta['_id']):
+                error = {"type": "version_conflict_engine_exception", "reason": "document already exists"}
+            if error:
+                status = 409 if error['type'] == "version_conflict_engine_exception" else 400
+                items.append({action: {"_index": action_index, "_id": meta['_id'], "status": status, "error": error}})
+                continue
+            created = self.put_doc(action_index, meta['_id'], source, meta.get('_type', "doc"))
+            items.append({action: {"_index": action_index, "_id": meta['_id'], "status": 201 if created else 200,
+                                   "result": "created" if created else "updated"}})
+
+        return 200, {"took": 1, "errors": any('error' in list(item.values())[0] for item in items), "items": items}
+
+    def set_kibana_setting(self, headers, name, body_json):
+        if headers.get('kbn-xsrf') is None:
+            return 400, {"error": "Bad Request", "message": "Request must contain a kbn-xsrf header."}
+        self.kibana_settings[name] = body_json['value']
+        # Kibana creates its index when it is missing
+        if '.kibana' not in self.indices:
+            self.create_index('.kibana')
+        return 200, {"settings": {key: {"userValue": value} for key, value in self.kibana_settings.items()}}
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+"""Microbenchmarks of the functions which transform the items when importing and exporting them.
+
+The inputs are built deterministically, so the results of different
+commits can be compared. Run them from the tests directory:
+
+    python microbenchmark.py --output micro-new.json --compare micro-old.json
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import timeit
+import tracemalloc
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from benchmark import get_commit
+from kidash.kidash import (STUDY_PATTERN,
+                           add_vis_style,
+                           clean_dashboard,
+                           fix_dashboard_heights,
+                           get_index_pattern_fields,
+                           get_index_pattern_from_meta,
+                           has_index_pattern_fields,
+                           is_index_pattern_from_data_sources,
+                           is_search_from_data_sources,
+                           is_vis_from_data_sources,
+                           new_release,
+                           strip_index_pattern_fields)
+
+DATA_SOURCES = ["askbot", "bugzilla", "confluence", "discourse", "dockerhub", "functest", "gerrit", "git",
+                "github", "gitlab", "googlehits", "groupsio", "hyperkitty", "jenkins", "jira", "mbox",
+                "mediawiki", "meetup", "slack", "twitter"]
+PANELS = 200
+FIELDS = 5000
+REPEAT = 5
+
+
+def build_dashboard(npanels, legacy=True):
+    """Build a dashboard with panels of all the data sources, some of them studies.
+
+    Legacy dashboards (Kibana < 6) define the heights of the panels with `size_y`.
+
+    :returns: a tuple with the dashboard and the titles of its visualizations by id
+    """
+    panels = []
+    viz_titles = {}
+    for i in range(npanels):
+        data_source = DATA_SOURCES[i % len(DATA_SOURCES)]
+        vis_id = "%s_vis_%s" % (data_source, i) if i % 10 else "%s%svis_%s" % (data_source, STUDY_PATTERN, i)
+        panel = {"id": vis_id, "type": "visualization", "panelIndex": i + 1, "title": "%s vis %s" % (data_source, i)}
+        if legacy:
+            panel.update({"col": (i % 2) * 6 + 1, "row": (i // 2) * 3 + 1, "size_x": 6, "size_y": 1 + i % 3})
+        else:
+            panel['gridData'] = {"x": (i % 2) * 24, "y": (i // 2) * 15, "w": 24, "h": 15, "i": str(i + 1)}
+        panels.append(panel)
+        viz_titles[vis_id] = "%s_evolutionary_%s" % (data_source, i)
+
+    dashboard = {"title": "Overview", "hits": 0, "description": "", "version": 1, "timeRestore": False,
+                 "optionsJSON": json.dumps({"darkTheme": False}), "panelsJSON": json.dumps(panels),
+                 "uiStateJSON": "{}", "kibanaSavedObjectMeta": {"searchSourceJSON": json.dumps({"filter": []})}}
+
+    return dashboard, viz_titles
+
+
+def build_index_pattern(nfields):
+    """Build an index pattern with `nfields` fields read from the indices and a few scripted ones"""
+
+    fields = [{"name": "field_%s" % i, "type": ["string", "number", "date", "boolean"][i % 4], "count": 0,
+               "scripted": False, "searchable": True, "aggregatable": bool(i % 2), "readFromDocValues": True}
+              for i in range(nfields)]
+    fields.extend({"name": "painless_%s" % i, "type": "number", "count": 0, "scripted": True,
+                   "script": "doc['field_%s'].value * 2" % i, "lang": "painless", "searchable": True,
+                   "aggregatable": True} for i in range(10))
+
+    return {"id": "git", "value": {"title": "git_enriched", "timeFieldName": "grimoire_creation_date",
+                                   "fields": json.dumps(fields)}}
+
+
+def build_field_caps(nfields):
+    """Build the field capabilities of an index with `nfields` fields"""
+
+    es_types = ["keyword", "long", "date", "boolean", "text"]
+    field_caps = {}
+    for i in range(nfields):
+        es_type = es_types[i % len(es_types)]
+        field_caps["field_%s" % i] = {es_type: {"type": es_type, "searchable": True,
+                                                "aggregatable": es_type != "text"}}
+    field_caps["_id"] = {"_id": {"type": "_id", "searchable": True, "aggregatable": True}}
+    return field_caps
+
+
+def build_metric_vis():
+    state = {"title": "git_commits", "type": "metric",
+             "params": {"addTooltip": True, "addLegend": False, "type": "gauge", "fontSize": 60, "handleNoResults": True},
+             "aggs": [{"id": "1", "enabled": True, "type": "count", "schema": "metric", "params": {}}],
+             "listeners": {}}
+    return {"title": "git_commits", "visState": json.dumps(state), "uiStateJSON": "{}", "version": 1}
+
+
+def build_search_meta(nfilters=20):
+    filters = [{"meta": {"index": "git_enriched", "negate": False, "disabled": False, "alias": None,
+                         "type": "phrase", "key": "author_org_name", "value": "org_%s" % i,
+                         "params": {"query": "org_%s" % i, "type": "phrase"}},
+                "query": {"match": {"author_org_name": {"query": "org_%s" % i, "type": "phrase"}}}}
+               for i in range(nfilters)]
+    search_source = {"index": "git_enriched", "highlightAll": True, "version": True,
+                     "query": {"query": "*", "language": "lucene"}, "filter": filters}
+    return {"searchSourceJSON": json.dumps(search_source)}
+
+
+def get_benchmarks():
+    """Return the name, the function and a function building the arguments of each benchmark.
+
+    Arguments are built again for each call when the function modifies them.
+    """
+    dashboard, viz_titles = build_dashboard(PANELS)
+    dashboard_kibana6, _ = build_dashboard(PANELS, legacy=False)
+    index_pattern = build_index_pattern(FIELDS)
+    field_caps = build_field_caps(FIELDS)
+    metric_vis = build_metric_vis()
+    search = {"title": "commits", "kibanaSavedObjectMeta": build_search_meta()}
+    vis = {"id": "twitter_tweets", "value": {"title": "twitter_tweets_evolutionary"}}
+    current = {"id": "Overview", "value": {"release_date": "2020-01-01T00:00:00"}}
+    to_import = {"id": "Overview", "value": {"release_date": "2021-06-15T10:30:00.000"}}
+    data_sources = DATA_SOURCES[-5:]
+
+    return [
+        ("clean_dashboard", clean_dashboard, lambda: (dashboard,)),
+        ("clean_dashboard_data_sources", clean_dashboard, lambda: (dashboard, data_sources, False, viz_titles)),
+        ("fix_dashboard_heights", fix_dashboard_heights, lambda: (dict(dashboard),)),
+        ("fix_dashboard_heights_kibana6", fix_dashboard_heights, lambda: (dict(dashboard_kibana6),)),
+        ("add_vis_style", add_vis_style, lambda: (dict(metric_vis),)),
+        ("get_index_pattern_from_meta", get_index_pattern_from_meta, lambda: (search['kibanaSavedObjectMeta'],)),
+        ("new_release", new_release, lambda: (current, to_import)),
+        ("is_search_from_data_sources", is_search_from_data_sources, lambda: (search, data_sources)),
+        ("is_vis_from_data_sources", is_vis_from_data_sources, lambda: (vis, data_sources)),
+        ("is_index_pattern_from_data_sources", is_index_pattern_from_data_sources,
+         lambda: (index_pattern, data_sources)),
+        ("has_index_pattern_fields", has_index_pattern_fields, lambda: (index_pattern['value'],)),
+        ("strip_index_pattern_fields", strip_index_pattern_fields, lambda: (index_pattern['value'],)),
+        ("get_index_pattern_fields", get_index_pattern_fields, lambda: (field_caps,)),
+    ]
+
+
+def run_microbenchmark(function, get_args, repeat=REPEAT, number=None):
+    """Measure the time of a function and the memory it allocates.
+
+    The function is called `number` times in each of the `repeat`
+    rounds (enough calls for a round of 0.2 seconds by default).
+
+    :returns: a dict with the minimum and median seconds per call, the
+        peak of memory allocated by a call and the blocks it retains
+    """
+    timer = timeit.Timer(lambda: function(*get_args()))
+    if not number:
+        number, _ = timer.autorange()
+    rounds = [seconds / number for seconds in timer.repeat(repeat=repeat, number=number)]
+
+    args = get_args()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_size, _ = tracemalloc.get_traced_memory()
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+
+    retained = after.compare_to(before, 'filename')
+
+    return {"calls": number,
+            "min_seconds": min(rounds),
+            "median_seconds": statistics.median(rounds),
+            "peak_bytes": peak - start_size,
+            "retained_blocks": sum(stat.count_diff for stat in retained if stat.count_diff > 0)}
+
+
+def get_params():
+    parser = argparse.ArgumentParser(description="Benchmark the functions which transform the items")
+    parser.add_argument("--functions", nargs='+', help="names of the benchmarks to run (all by default)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="rounds of calls of each function")
+    parser.add_argument("--output", help="JSON file to save the results in")
+    parser.add_argument("--compare", help="JSON file with the results of a previous run")
+    return parser.parse_args()
+
+
+def main():
+    args = get_params()
+
+    results = []
+    for name, function, get_args in get_benchmarks():
+        if args.functions and name not in args.functions:
+            continue
+        result = dict({"name": name}, **run_microbenchmark(function, get_args, args.repeat))
+        results.append(result)
+        print("%-36s %10.1fus min %10.1fus median %12s peak bytes %8s retained blocks" %
+              (name, result['min_seconds'] * 1e6, result['median_seconds'] * 1e6,
+               result['peak_bytes'], result['retained_blocks']))
+
+    report = {"commit": get_commit(),
+              "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+              "python": platform.python_version(),
+              "results": results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        previous_results = {result['name']: result for result in previous['results']}
+        print("Compared with %s (%s)" % (previous.get('commit'), previous.get('date')))
+        for result in results:
+            old = previous_results.get(result['name'])
+            if old:
+                print("%-36s %10.1fus -> %10.1fus (%+.0f%%)" %
+                      (result['name'], old['min_seconds'] * 1e6, result['min_seconds'] * 1e6,
+                       (result['min_seconds'] / old['min_seconds'] - 1) * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+"""Generator of synthetic GrimoireLab panels for load tests.
+
+Panel files are generated with the objects GrimoireLab dashboards
+use: visualizations (some of them studies) reading from saved
+searches or directly from index patterns of the data sources. All
+the references between objects are valid, and the same seed
+always generates the same files. The contents of the Kibana index
+for a version of Elasticsearch can be generated too, to restore
+them with `kidash --restore`:
+
+    python synthetic.py --dashboards 50 --visualizations 40 --fields 3000 \
+        --output-dir panels --kibana kibana-6.8.ndjson --target-version 6.8
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from kidash.kidash import STUDY_PATTERN, convert_panel_files
+
+DATA_SOURCES = ["git", "github", "gitlab", "gerrit", "jira", "mbox", "slack", "discourse"]
+# Fields present in the enriched indices of every data source
+COMMON_FIELDS = ["grimoire_creation_date", "metadata__timestamp", "metadata__updated_on", "metadata__enriched_on",
+                 "origin", "project", "project_1", "uuid", "author_name", "author_uuid", "author_id",
+                 "author_org_name", "author_domain", "author_bot", "author_gender", "author_user_name",
+                 "is_%s_%s"]
+FIELD_TYPES = [("string", 50), ("number", 25), ("date", 10), ("boolean", 10), ("geo_point", 5)]
+VIS_TYPES = ["metric", "line", "histogram", "table", "pie", "area", "markdown"]
+RELEASE_DATE = "2021-01-01T00:00:00"
+
+
+def generate_index_pattern(rng, data_source, nfields):
+    """Generate the index pattern of the enriched index of a data source with `nfields` fields"""
+
+    names = [name % (data_source, "item") if '%' in name else name for name in COMMON_FIELDS]
+    names.extend("%s_field_%s" % (data_source, i) for i in range(max(nfields - len(names), 0)))
+    types, weights = zip(*FIELD_TYPES)
+
+    fields = []
+    for name in sorted(names[:nfields]):
+        field_type = "date" if name.endswith(("_date", "_on", "timestamp")) else rng.choices(types, weights)[0]
+        fields.append({"name": name, "type": field_type, "count": 0, "scripted": False, "searchable": True,
+                       "aggregatable": field_type != "string" or rng.random() < 0.8, "readFromDocValues": True})
+    fields.append({"name": "painless_delay", "type": "number", "count": 0, "scripted": True,
+                   "script": "doc['metadata__updated_on'].value.millis - doc['grimoire_creation_date'].value.millis",
+                   "lang": "painless", "searchable": True, "aggregatable": True, "readFromDocValues": False})
+
+    return {"id": data_source,
+            "value": {"title": data_source, "timeFieldName": "grimoire_creation_date",
+                      "fields": json.dumps(fields), "fieldFormatMap": "{}", "release_date": RELEASE_DATE}}
+
+
+def generate_search(rng, data_source, index):
+    """Generate a saved search filtering the items of a data source"""
+
+    query = rng.choice(["*", "author_bot:false", "is_%s_item:1" % data_source])
+    search_source = {"index": data_source, "highlightAll": True, "version": True,
+                     "query": {"query": query, "language": "lucene"}, "filter": []}
+
+    return {"id": "Search:_%s_%s" % (data_source, index),
+            "value": {"title": "Search:_%s_%s" % (data_source, index), "description": "", "hits": 0,
+                      "columns": ["_source"], "sort": ["grimoire_creation_date", "desc"], "version": 1,
+                      "kibanaSavedObjectMeta": {"searchSourceJSON": json.dumps(search_source)}}}
+
+
+def generate_vis(rng, vis_id, data_source, search_id=None):
+    """Generate a visualization of a data source, reading from a saved search or from the index pattern"""
+
+    vis_type = rng.choice(VIS_TYPES)
+    params = {"addTooltip": True, "addLegend": vis_type != "metric"}
+    if vis_type == "metric":
+        params["fontSize"] = rng.choice([30, 40, 60])
+    aggs = [{"id": "1", "enabled": True, "type": "count", "schema": "metric", "params": {}}]
+    if vis_type not in ("metric", "markdown"):
+        aggs.append({"id": "2", "enabled": True, "type": "date_histogram", "schema": "segment",
+                     "params": {"field": "grimoire_creation_date", "interval": rng.choice(["w", "M", "y"]),
+                                "min_doc_count": 1, "extended_bounds": {}}})
+    vis_state = {"title": vis_id, "type": vis_type, "params": params, "aggs": aggs, "listeners": {}}
+
+    value = {"title": vis_id, "visState": json.dumps(vis_state), "uiStateJSON": "{}", "description": "",
+             "version": 1}
+    if search_id:
+        value["savedSearchId"] = search_id
+        search_source = {"filter": []}
+    else:
+        search_source = {"index": data_source, "query": {"query": "*", "language": "lucene"}, "filter": []}
+    value["kibanaSavedObjectMeta"] = {"searchSourceJSON": json.dumps(search_source)}
+
+    return {"id": vis_id, "value": value}
+
+
+def generate_panels(dashboards=1, visualizations=20, searches=2, studies=0, data_sources=None,
+                    fields=100, seed=0):
+    """Generate panels of GrimoireLab dashboards.
+
+    Dashboards are assigned to the data sources in turn. Each data
+    source has an index pattern and `searches` saved searches, which
+    are read by one of each three visualizations of its dashboards.
+    Each panel includes the objects used by its dashboard.
+
+    :param dashboards: number of dashboards
+    :param visualizations: visualizations of each dashboard, excluding studies
+    :param searches: saved searches of each data source
+    :param studies: visualizations of studies (with `_study_` in their ids) of each dashboard
+    :param data_sources: names of the data sources
+    :param fields: fields of each index pattern
+    :param seed: seed of the random generator
+    :returns: a dict with the panels by the name of their files
+    """
+    rng = random.Random(seed)
+    data_sources = data_sources or DATA_SOURCES[:1]
+
+    index_patterns = {data_source: generate_index_pattern(rng, data_source, fields) for data_source in data_sources}
+    saved_searches = {data_source: [generate_search(rng, data_source, i) for i in range(searches)]
+                      for data_source in data_sources}
+
+    panels = {}
+    for i in range(dashboards):
+        data_source = data_sources[i % len(data_sources)]
+        dash_id = "%s-dashboard-%s" % (data_source, i)
+        ds_searches = saved_searches[data_source]
+
+        vis_items = []
+        for j in range(visualizations):
+            search = ds_searches[(j // 3) % len(ds_searches)] if ds_searches and j % 3 == 0 else None
+            vis_id = "%s_%s_%s" % (data_source, i, j)
+            vis_items.append(generate_vis(rng, vis_id, data_source, search['id'] if search else None))
+        for j in range(studies):
+            vis_id = "%s%s%s_%s" % (data_source, STUDY_PATTERN, i, j)
+            vis_items.append(generate_vis(rng, vis_id, data_source))
+
+        grid = []
+        for j, vis in enumerate(vis_items):
+            width = rng.choice([12, 16, 24])
+            grid.append({"id": vis['id'], "type": "visualization", "panelIndex": str(j + 1), "embeddableConfig": {},
+                         "gridData": {"x": (j % 2) * 24, "y": (j // 2) * 15, "w": width, "h": 15, "i": str(j + 1)}})
+
+        used_searches = {vis['value']['savedSearchId'] for vis in vis_items if 'savedSearchId' in vis['value']}
+        dashboard = {"id": dash_id,
+                     "value": {"title": "%s dashboard %s" % (data_source.capitalize(), i), "hits": 0,
+                               "description": "", "version": 1, "timeRestore": False,
+                               "optionsJSON": json.dumps({"darkTheme": False, "useMargins": True}),
+                               "panelsJSON": json.dumps(grid), "uiStateJSON": "{}", "release_date": RELEASE_DATE,
+                               "kibanaSavedObjectMeta": {"searchSourceJSON": json.dumps(
+                                   {"query": {"query": "*", "language": "lucene"}, "filter": []})}}}
+
+        panels[dash_id + ".json"] = {
+            "dashboard": dashboard,
+            "visualizations": vis_items,
+            "searches": [search for search in ds_searches if search['id'] in used_searches],
+            "index_patterns": [index_patterns[data_source]]
+        }
+
+    return panels
+
+
+def write_panels(panels, output_dir):
+    """Write each panel to a file of a directory and return the paths of the files"""
+
+    os.makedirs(output_dir, exist_ok=True)
+    panel_files = []
+    for file_name, panel in sorted(panels.items()):
+        panel_file = os.path.join(output_dir, file_name)
+        with open(panel_file, 'w') as f:
+            json.dump(panel, f, indent=4, sort_keys=True)
+        panel_files.append(panel_file)
+
+    return panel_files
+
+
+def get_params():
+    parser = argparse.ArgumentParser(description="Generate synthetic GrimoireLab panels")
+    parser.add_argument("--dashboards", type=int, default=1, help="number of dashboards")
+    parser.add_argument("--visualizations", type=int, default=20, help="visualizations of each dashboard")
+    parser.add_argument("--searches", type=int, default=2, help="saved searches of each data source")
+    parser.add_argument("--studies", type=int, default=0, help="visualizations of studies of each dashboard")
+    parser.add_argument("--data-sources", dest="data_sources", nargs='+', default=DATA_SOURCES[:1],
+                        help="data sources of the dashboards")
+    parser.add_argument("--fields", type=int, default=100, help="fields of each index pattern")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+    parser.add_argument("--output-dir", dest="output_dir", required=True, help="directory for the panel files")
+    parser.add_argument("--kibana", dest="kibana_file",
+                        help="file to store the contents of the Kibana index, as `kidash --backup` does")
+    parser.add_argument("--target-version", dest="target_version", default="6.8",
+                        help="Elasticsearch version of the contents of the Kibana index")
+    return parser.parse_args()
+
+
+def main():
+    args = get_params()
+
+    panels = generate_panels(args.dashboards, args.visualizations, args.searches, args.studies,
+                             args.data_sources, args.fields, args.seed)
+    panel_files = write_panels(panels, args.output_dir)
+    print("%s panel files written in %s" % (len(panel_files), args.output_dir))
+
+    if args.kibana_file:
+        ndocs = convert_panel_files(panel_files, args.kibana_file, args.target_version, add_vis_studies=True)
+        print("%s documents of the Kibana index written in %s" % (ndocs, args.kibana_file))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(message)s')
+    main()
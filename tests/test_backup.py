@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2019 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+import json
+import logging
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import requests
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from kidash.kidash import BACKUP_HEADER, backup_kibana, restore_kibana
+
+OVERVIEW_DASH_FILE = 'data/overview-with-index-patterns.json'
+
+SOURCE_URL = "http://source.example.com:9200"
+TARGET_URL = "http://target.example.com:9200"
+
+KIBANA_MAPPINGS = {"doc": {"dynamic": "strict", "properties": {"type": {"type": "keyword"}}}}
+
+
+def overview_docs():
+    """Return the items of the overview panel as documents of an Elasticsearch 6 index"""
+
+    with open(OVERVIEW_DASH_FILE) as fdash:
+        overview = json.load(fdash)
+
+    items = [("dashboard", overview['dashboard'])]
+    for type_, field in [("visualization", "visualizations"), ("search", "searches"),
+                         ("index-pattern", "index_patterns")]:
+        items.extend([(type_, item) for item in overview[field]])
+
+    return {type_ + ":" + item['id']: {"type": type_, type_: item['value']} for type_, item in items}
+
+
+def json_response(url, body, status_code=200):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response._content = json.dumps(body).encode('utf-8')
+    return response
+
+
+class FakeSession:
+    """Stand-in of the HTTP session keeping the Kibana index of an Elasticsearch 6 cluster"""
+
+    def __init__(self, elastic_url, docs=None):
+        self.elastic_url = elastic_url
+        self.index_url = elastic_url + "/.kibana"
+        self.mappings = KIBANA_MAPPINGS if docs is not None else None
+        self.docs = dict(docs or {})
+        self.bulks = []
+
+    def get(self, url, **kwargs):
+        if url == self.elastic_url:
+            return json_response(url, {"version": {"number": "6.8.6"}})
+        if self.mappings is None:
+            return json_response(url, {"error": "index_not_found_exception"}, 404)
+        # The index and its mappings
+        return json_response(url, {".kibana": {"mappings": self.mappings}})
+
+    def put(self, url, data=None, **kwargs):
+        self.mappings = json.loads(data)['mappings'] if data else {}
+        return json_response(url, {"acknowledged": True})
+
+    def post(self, url, data=None, **kwargs):
+        if url.startswith(self.index_url + "/_search"):
+            hits = [{"_id": doc_id, "_type": "doc", "_source": source} for doc_id, source in self.docs.items()]
+            return json_response(url, {"_scroll_id": "scroll", "hits": {"hits": hits}})
+
+        lines = data.decode('utf-8').splitlines()
+        self.bulks.append(len(lines) // 2)
+        items = []
+        for action, source in zip(lines[::2], lines[1::2]):
+            meta = json.loads(action)['index']
+            self.docs[meta['_id']] = json.loads(source)
+            items.append({"index": {"_id": meta['_id'], "status": 201}})
+        return json_response(url, {"errors": False, "items": items})
+
+    def delete(self, url, **kwargs):
+        return json_response(url, {"succeeded": True})
+
+
+class TestBackup(unittest.TestCase):
+    """Tests for the backup and restore of the Kibana index"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        self.backup_file = os.path.join(self.tmpdir, "kibana.ndjson")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_with(self, session, func, *args):
+        with unittest.mock.patch('kidash.kidash.requests_ses', session), \
+                unittest.mock.patch('kidash.kidash.grimoire_con', return_value=session):
+            return func(*args)
+
+    def test_backup_restore(self):
+        """Test whether a backup of the Kibana index is restored in a cluster without it"""
+
+        docs = overview_docs()
+        source = FakeSession(SOURCE_URL, docs)
+        target = FakeSession(TARGET_URL)
+
+        ndocs = self.run_with(source, backup_kibana, SOURCE_URL, self.backup_file)
+        self.assertEqual(ndocs, len(docs))
+
+        with open(self.backup_file) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), len(docs) + 1)
+        header = json.loads(lines[0])[BACKUP_HEADER]
+        self.assertEqual(header['index'], ".kibana")
+        self.assertDictEqual(header['mappings'], KIBANA_MAPPINGS)
+
+        ndocs = self.run_with(target, restore_kibana, TARGET_URL, TARGET_URL, self.backup_file)
+        self.assertEqual(ndocs, len(docs))
+        self.assertDictEqual(target.mappings, KIBANA_MAPPINGS)
+        self.assertDictEqual(target.docs, docs)
+
+        # The backup file is not overwritten
+        with self.assertRaises(RuntimeError):
+            self.run_with(source, backup_kibana, SOURCE_URL, self.backup_file)
+
+    def test_restore_chunks(self):
+        """Test whether the documents are restored in bulk requests of a limited size"""
+
+        docs = overview_docs()
+        source = FakeSession(SOURCE_URL, docs)
+        target = FakeSession(TARGET_URL)
+
+        self.run_with(source, backup_kibana, SOURCE_URL, self.backup_file)
+
+        with unittest.mock.patch('kidash.kidash.BULK_CHUNK_SIZE', 5):
+            self.run_with(target, restore_kibana, TARGET_URL, TARGET_URL, self.backup_file)
+
+        self.assertListEqual(target.bulks, [5, 5, 5, 5, 1])
+        self.assertDictEqual(target.docs, docs)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(buffer=True, warnings='ignore')
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from benchmark import OPERATIONS, build_panel, run_benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """Tests for the end-to-end benchmarks"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_build_panel(self):
+        """Test whether panels have the given number of objects, all of them in the dashboard"""
+
+        panel = build_panel(100)
+        nobjects = 1 + len(panel['visualizations']) + len(panel['searches']) + len(panel['index_patterns'])
+        self.assertEqual(nobjects, 100)
+
+        panels = json.loads(panel['dashboard']['value']['panelsJSON'])
+        self.assertEqual([vis['id'] for vis in panel['visualizations']], [panel['id'] for panel in panels])
+        self.assertEqual(len({vis['id'] for vis in panel['visualizations']}), len(panels))
+
+    def test_run_benchmark(self):
+        """Test whether the measures of each operation are returned"""
+
+        for operation in OPERATIONS:
+            result = run_benchmark(operation, 10, 0, self.tmpdir)
+            self.assertEqual((result['operation'], result['objects'], result['latency']), (operation, 10, 0))
+            self.assertGreater(result['requests'], 0)
+            self.assertGreater(result['bytes_received'], 0)
+            self.assertGreater(result['peak_memory'], 0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import contextlib
+import io
+import logging
+import sys
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import CountingAdapter
+from benchmark import build_panel
+from fakeserver import FakeElastic
+from kidash.kidash import (clear_caches,
+                           fetch_dashboard,
+                           import_panel,
+                           list_dashboards,
+                           mount_adapter)
+from kidash.plan import READ_ENDPOINTS
+
+# Objects of the dashboards. The budgets must not depend on them.
+SIZES = [10, 200]
+
+# Requests of each operation, reading the version and checking the Kibana index
+IMPORT_BUDGET = 6
+EXPORT_BUDGET = 6
+STRICT_IMPORT_BUDGET = 5
+INDEX_PATTERNS_BUDGET = 3
+LIST_BUDGET = 3
+
+
+def get_writes(requests):
+    return [(method, path) for method, path, _, _ in requests
+            if method not in ('GET', 'HEAD') and path.rstrip('/').rsplit('/', 1)[-1] not in READ_ENDPOINTS]
+
+
+class TestRequestBudgets(unittest.TestCase):
+    """Tests for the number of requests of each operation, which must not grow with the objects"""
+
+    def setUp(self):
+        self.elastic = FakeElastic()
+        self.url = self.elastic.start()
+        self.adapter = CountingAdapter()
+        self.mount = mount_adapter(self.adapter)
+        self.mount.__enter__()
+
+    def tearDown(self):
+        self.mount.__exit__(None, None, None)
+        self.elastic.stop()
+        clear_caches()
+
+    def count_requests(self, operation, *args, **kwargs):
+        """Run an operation without cached versions nor indices and return its requests"""
+
+        clear_caches()
+        self.adapter.reset()
+        operation(*args, **kwargs)
+        return list(self.adapter.requests)
+
+    def test_import(self):
+        """Test whether panels are imported in a constant number of requests"""
+
+        for nobjects in SIZES:
+            panel = build_panel(nobjects)
+            requests = self.count_requests(import_panel, self.url, self.url, panel, "panel")
+            self.assertLessEqual(len(requests), IMPORT_BUDGET, nobjects)
+
+            panel = {"index_patterns": panel['index_patterns']}
+            requests = self.count_requests(import_panel, self.url, self.url, panel, "panel")
+            self.assertLessEqual(len(requests), INDEX_PATTERNS_BUDGET, nobjects)
+
+    def test_export(self):
+        """Test whether dashboards are exported in a constant number of requests"""
+
+        for nobjects in SIZES:
+            panel = build_panel(nobjects)
+            import_panel(self.url, self.url, panel, "panel")
+
+            requests = self.count_requests(fetch_dashboard, self.url, panel['dashboard']['id'])
+            self.assertLessEqual(len(requests), EXPORT_BUDGET, nobjects)
+            self.assertEqual(get_writes(requests), [])
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                requests = self.count_requests(list_dashboards, self.url)
+            self.assertLessEqual(len(requests), LIST_BUDGET, nobjects)
+
+    def test_strict_import(self):
+        """Test whether a strict import of unchanged panels writes nothing"""
+
+        for nobjects in SIZES:
+            panel = build_panel(nobjects)
+            panel['dashboard']['value']['release_date'] = "2020-01-01T00:00:00"
+            import_panel(self.url, self.url, panel, "panel")
+
+            requests = self.count_requests(import_panel, self.url, self.url, panel, "panel", strict=True)
+            self.assertLessEqual(len(requests), STRICT_IMPORT_BUDGET, nobjects)
+            self.assertEqual(get_writes(requests), [])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import OVERVIEW_DASH_FILE
+from fakeserver import FakeElastic
+from kidash.cassette import REDACTED, record_requests, replay_requests
+from kidash.kidash import clear_caches, export_dashboard, import_dashboard, requests_ses
+
+RELEASE_DATE_RE = re.compile(r'"release_date": "[^"]*"')
+
+
+class TestCassette(unittest.TestCase):
+    """Tests for recording and replaying the requests to Elasticsearch"""
+
+    def setUp(self):
+        clear_caches()
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        self.cassette_file = os.path.join(self.tmpdir, "cassette.ndjson")
+
+    def tearDown(self):
+        clear_caches()
+        shutil.rmtree(self.tmpdir)
+
+    def read_cassette(self):
+        with open(self.cassette_file) as f:
+            return [json.loads(line) for line in f]
+
+    def test_record_replay(self):
+        """Test whether an export is replayed without Elasticsearch, getting the same file"""
+
+        recorded_file = os.path.join(self.tmpdir, "recorded.json")
+        replayed_file = os.path.join(self.tmpdir, "replayed.json")
+
+        with FakeElastic() as elastic:
+            import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+            clear_caches()
+            with record_requests(self.cassette_file) as adapter:
+                export_dashboard(elastic.url, "Overview", recorded_file)
+            url = elastic.url
+            nrequests = len(elastic.requests)
+
+        interactions = self.read_cassette()
+        self.assertEqual(len(interactions), adapter.interactions)
+        self.assertEqual(interactions[0]['request']['method'], "GET")
+        self.assertEqual(interactions[0]['response']['status'], 200)
+
+        clear_caches()
+        with replay_requests(self.cassette_file, latency_scale=0) as adapter:
+            export_dashboard(url, "Overview", replayed_file)
+            self.assertEqual(adapter.interactions, len(interactions))
+            # Requests not recorded fail
+            with self.assertRaisesRegex(RuntimeError, "No response recorded"):
+                requests_ses.get(url + "/_cat/indices")
+        self.assertEqual(nrequests, len(elastic.requests))
+
+        # Only the release dates, set when exporting, differ
+        with open(recorded_file) as recorded, open(replayed_file) as replayed:
+            self.assertEqual(RELEASE_DATE_RE.sub("", recorded.read()), RELEASE_DATE_RE.sub("", replayed.read()))
+
+        # The connection is restored and the replay reported when the run fails
+        adapter = requests_ses.get_adapter(url)
+        with self.assertLogs('kidash.cassette', level='INFO') as logs:
+            with self.assertRaises(RuntimeError):
+                with replay_requests(self.cassette_file, latency_scale=0):
+                    raise RuntimeError("Run failed")
+        self.assertIs(requests_ses.get_adapter(url), adapter)
+        self.assertRegex(logs.output[-1], r"0 requests replayed from .*, %s not sent" % len(interactions))
+
+    def test_redact(self):
+        """Test whether credentials and the given fields are not recorded"""
+
+        with FakeElastic() as elastic:
+            url = elastic.url.replace("://", "://admin:secret@")
+            with record_requests(self.cassette_file, redact_fields=["title"]):
+                import_dashboard(url, url, OVERVIEW_DASH_FILE)
+
+        cassette = json.dumps(self.read_cassette())
+        self.assertNotIn("secret", cassette)
+        self.assertNotIn("Overview\"", cassette)
+
+        bulk = [interaction for interaction in self.read_cassette() if '_bulk' in interaction['request']['url']][0]
+        self.assertEqual(bulk['request']['headers']['Authorization'], REDACTED)
+        self.assertIn('"title": "%s"' % REDACTED, bulk['request']['body'])
+
+        # Replayed requests with credentials are matched too
+        clear_caches()
+        with replay_requests(self.cassette_file, latency_scale=0) as adapter:
+            import_dashboard(url, url, OVERVIEW_DASH_FILE)
+        self.assertEqual(adapter.interactions, len(self.read_cassette()))
+
+    def test_latency(self):
+        """Test whether the recorded latencies are scaled on replay"""
+
+        with FakeElastic(latency=0.05) as elastic:
+            with record_requests(self.cassette_file):
+                requests_ses.get(elastic.url)
+            url = elastic.url
+
+        self.assertGreaterEqual(self.read_cassette()[0]['seconds'], 0.05)
+
+        for scale, minimum, maximum in [(1, 0.05, 1), (2, 0.1, 1), (0, 0, 0.04)]:
+            with replay_requests(self.cassette_file, latency_scale=scale):
+                start = time.time()
+                self.assertEqual(requests_ses.get(url).json()['version']['number'], "6.8.6")
+                seconds = time.time() - start
+            self.assertGreaterEqual(seconds, minimum)
+            self.assertLess(seconds, maximum)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import OVERVIEW_DASH_FILE, read_overview
+from kidash.kidash import (BACKUP_HEADER,
+                           SIGILS_INDEX,
+                           check_converted_version,
+                           convert_panel_files,
+                           parse_es_version)
+
+
+class TestConvert(unittest.TestCase):
+    """Tests for the offline conversion of panels"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_converted(self, output_file):
+        with open(output_file) as f:
+            lines = [json.loads(line) for line in f]
+        return lines[0][BACKUP_HEADER], lines[1:]
+
+    def test_parse_es_version(self):
+        """Test whether versions are parsed"""
+
+        self.assertEqual(parse_es_version("6.8.6"), (6, 8))
+        self.assertEqual(parse_es_version("5.6"), (5, 6))
+        with self.assertRaises(ValueError):
+            parse_es_version("six")
+
+    def test_check_converted_version(self):
+        """Test whether documents are only imported in compatible versions"""
+
+        check_converted_version("6.8", (7, 10))
+        check_converted_version("6.1", (6, 7))
+        check_converted_version("5.6", (5, 1))
+        with self.assertRaises(RuntimeError):
+            check_converted_version("6.8", (6, 1))
+        with self.assertRaises(RuntimeError):
+            check_converted_version("5.6", (6, 8))
+
+    def test_convert(self):
+        """Test whether panels are converted to the documents of a version"""
+
+        output_file = os.path.join(self.tmpdir, "overview.ndjson")
+        ndocs = convert_panel_files([OVERVIEW_DASH_FILE], output_file, "6.8.6")
+
+        header, docs = self.read_converted(output_file)
+        self.assertEqual(ndocs, len(docs))
+        self.assertEqual(header['version'], "6.8")
+        self.assertEqual(header['converted'], ["overview-with-index-patterns.json"])
+        self.assertFalse(header['release_date_mapping'])
+
+        dashboard = docs[0]
+        self.assertEqual(dashboard['_id'], "dashboard:Overview")
+        self.assertEqual(dashboard['_type'], "doc")
+        self.assertEqual(dashboard['_source']['type'], "dashboard")
+        self.assertIn("dashboard", dashboard['_source'])
+
+        with self.assertRaises(RuntimeError):
+            convert_panel_files([OVERVIEW_DASH_FILE], output_file, "6.8.6")
+
+    def test_convert_release_date(self):
+        """Test whether release dates are moved to the Sigils index"""
+
+        overview = read_overview()
+        overview['dashboard']['value']['release_date'] = "2019-10-01T10:00:00"
+        panel_file = os.path.join(self.tmpdir, "overview.json")
+        with open(panel_file, 'w') as f:
+            json.dump(overview, f)
+
+        output_file = os.path.join(self.tmpdir, "overview-6.8.ndjson")
+        convert_panel_files([panel_file], output_file, "6.8")
+        _, docs = self.read_converted(output_file)
+
+        self.assertDictEqual(docs[0], {"_index": SIGILS_INDEX, "_id": "dashboard:Overview", "_type": "doc",
+                                       "_source": {"item_id": "Overview", "item_type": "dashboard",
+                                                   "release_date": "2019-10-01T10:00:00"}})
+        self.assertNotIn("release_date", docs[1]['_source']['dashboard'])
+
+        output_file = os.path.join(self.tmpdir, "overview-6.1.ndjson")
+        convert_panel_files([panel_file], output_file, "6.1")
+        header, docs = self.read_converted(output_file)
+
+        self.assertTrue(header['release_date_mapping'])
+        self.assertEqual(docs[0]['_source']['dashboard']['release_date'], "2019-10-01T10:00:00")
+
+    def test_convert_es5(self):
+        """Test whether documents for Elasticsearch 5 keep the ids and types"""
+
+        output_file = os.path.join(self.tmpdir, "overview.ndjson")
+        convert_panel_files([OVERVIEW_DASH_FILE], output_file, "5.6")
+        _, docs = self.read_converted(output_file)
+
+        self.assertEqual(docs[0]['_id'], "Overview")
+        self.assertEqual(docs[0]['_type'], "dashboard")
+        self.assertNotIn("type", docs[0]['_source'])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import OVERVIEW_DASH_FILE, read_overview
+from fakeserver import FakeElastic
+from kidash.diff import (MISSING,
+                         compare_item_json,
+                         diff_panel_file,
+                         diff_panel_files,
+                         normalize_item_json,
+                         normalize_saved_object)
+from kidash.kidash import clear_caches, import_dashboard
+
+
+class TestDiff(unittest.TestCase):
+    """Tests for the comparison of items"""
+
+    def test_normalize_item_json(self):
+        """Test whether nested JSON strings are parsed"""
+
+        panels = [{"id": "git_commits", "size_y": 1}]
+        item = {"title": "Git", "panelsJSON": json.dumps(panels),
+                "kibanaSavedObjectMeta": {"searchSourceJSON": json.dumps({"index": "git"})},
+                "description": "[not JSON"}
+
+        expected = {"title": "Git", "panelsJSON": panels,
+                    "kibanaSavedObjectMeta": {"searchSourceJSON": {"index": "git"}},
+                    "description": "[not JSON"}
+        self.assertDictEqual(normalize_item_json(item), expected)
+
+    def test_compare_item_json(self):
+        """Test whether the differences between items are found by field"""
+
+        current = normalize_item_json({"title": "Git", "hits": 0,
+                                       "panelsJSON": json.dumps([{"id": "a", "size_y": 1}])})
+        new = normalize_item_json({"title": "Git",
+                                   "panelsJSON": json.dumps([{"id": "a", "size_y": 2}, {"id": "b"}])})
+
+        diffs = compare_item_json(current, new)
+        self.assertListEqual(diffs, [("hits", 0, MISSING),
+                                     ("panelsJSON[0].size_y", 1, 2),
+                                     ("panelsJSON[1]", MISSING, {"id": "b"})])
+
+        self.assertListEqual(compare_item_json(current, current), [])
+
+    def test_normalize_saved_object(self):
+        """Test whether the fields managed by Kibana and the order of the index pattern fields are ignored"""
+
+        fields = [{"name": "author_name", "type": "string"}, {"name": "grimoire_creation_date", "type": "date"}]
+        source = {"type": "index-pattern", "updated_at": "2020-01-01T00:00:00.000Z",
+                  "references": [], "migrationVersion": {"index-pattern": "6.5.0"},
+                  "index-pattern": {"title": "git", "fields": json.dumps(fields[::-1])}}
+
+        expected = {"type": "index-pattern", "index-pattern": {"title": "git", "fields": fields}}
+        self.assertDictEqual(normalize_saved_object("index-pattern", source), expected)
+
+        # Before Elasticsearch 6 the source is the object
+        self.assertDictEqual(normalize_saved_object("index-pattern", {"title": "git", "fields": json.dumps(fields[::-1])}),
+                             {"title": "git", "fields": fields})
+
+
+class TestDiffPanelFile(unittest.TestCase):
+    """Tests for the comparison of panel files with the items stored in Kibana"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+
+    def tearDown(self):
+        clear_caches()
+        shutil.rmtree(self.tmpdir)
+
+    def test_diff_panel_file(self):
+        """Test whether the added, changed and unchanged items of a panel are found"""
+
+        overview = read_overview()
+        nitems = 1 + len(overview['visualizations']) + len(overview['searches']) + len(overview['index_patterns'])
+
+        for version in ["5.6.16", "6.8.6", "7.10.2"]:
+            with FakeElastic(version) as elastic:
+                result = diff_panel_file(elastic.url, OVERVIEW_DASH_FILE)
+                self.assertEqual(len(result['added']), nitems)
+                self.assertDictEqual(result['changed'], {})
+
+                # The missing Kibana index is not created
+                self.assertNotIn('.kibana', elastic.indices)
+                self.assertNotIn('PUT', [request[0] for request in elastic.requests])
+
+                import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+                result = diff_panel_file(elastic.url, OVERVIEW_DASH_FILE)
+                self.assertListEqual(result['added'], [])
+                self.assertDictEqual(result['changed'], {})
+                self.assertEqual(len(result['unchanged']), nitems)
+            clear_caches()
+
+    def test_kibana_fields(self):
+        """Test whether the fields updated by Kibana are not reported as differences"""
+
+        with FakeElastic("7.10.2") as elastic:
+            import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+            docs = elastic.indices['.kibana']['docs']
+
+            for doc in docs.values():
+                doc['_source']['updated_at'] = "2020-01-01T00:00:00.000Z"
+                doc['_source']['references'] = []
+                doc['_source']['migrationVersion'] = {doc['_source']['type']: "7.10.0"}
+            index_pattern = docs['index-pattern:git']['_source']['index-pattern']
+            index_pattern['fields'] = json.dumps(json.loads(index_pattern['fields'])[::-1])
+
+            result = diff_panel_file(elastic.url, OVERVIEW_DASH_FILE)
+            self.assertDictEqual(result['changed'], {})
+
+            # Other changes are reported
+            docs['visualization:git_main_numbers']['_source']['visualization']['title'] = "Commits"
+            del docs['search:Search:_pull_request:false']
+            result = diff_panel_file(elastic.url, OVERVIEW_DASH_FILE)
+            self.assertListEqual(result['added'], ["search:Search:_pull_request:false"])
+            self.assertListEqual(list(result['changed']), ["visualization:git_main_numbers"])
+            self.assertListEqual(result['changed']["visualization:git_main_numbers"],
+                                 [("visualization.title", "Commits", "git_main_numbers")])
+
+    def test_diff_panel_files(self):
+        """Test whether the differences of several panel files are printed"""
+
+        overview = read_overview()
+        overview['visualizations'][0]['value']['title'] = "Commits"
+        panel_file = os.path.join(self.tmpdir, "overview.json")
+        with open(panel_file, 'w') as f:
+            json.dump(overview, f)
+
+        with FakeElastic() as elastic:
+            import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                results = diff_panel_files(elastic.url, [OVERVIEW_DASH_FILE, panel_file])
+
+        self.assertListEqual(list(results), [OVERVIEW_DASH_FILE, panel_file])
+        self.assertDictEqual(results[OVERVIEW_DASH_FILE]['changed'], {})
+        self.assertListEqual(list(results[panel_file]['changed']), ["visualization:git_main_numbers"])
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "%s: 0 added, 0 changed, 21 unchanged" % OVERVIEW_DASH_FILE)
+        self.assertEqual(lines[1], "%s: 0 added, 1 changed, 20 unchanged" % panel_file)
+        self.assertListEqual(lines[2:], ["  ~ visualization:git_main_numbers",
+                                         '      visualization.title: "git_main_numbers" -> "Commits"'])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(buffer=True, warnings='ignore')
@@ -30,7 +30,16 @@ import unittest
 # due to setuptools behaviour
 sys.path.insert(0, '..')
 
-from kidash.kidash import export_dashboard_files
+from base import read_overview
+from fakeserver import FakeElastic
+from kidash.kidash import (EXPORT_STATE_FILE,
+                           clear_caches,
+                           export_changed_dashboards,
+                           export_dashboard_files,
+                           get_item_from_hit,
+                           import_dashboard,
+                           read_export_state,
+                           write_export_state)
 
 OVERVIEW_DASH_FILE = 'data/overview-with-index-patterns.json'
 
@@ -57,6 +66,109 @@ class TestReport(unittest.TestCase):
 
         shutil.rmtree(tmpdir)
 
+    def test_export_state(self):
+        """Test whether the state of an incremental export is stored and read"""
+
+        tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        state_file = os.path.join(tmpdir, "state.json")
+
+        state = read_export_state(state_file)
+        self.assertDictEqual(state, {"watermark": None, "digests": {}, "dashboards": {}})
+
+        state['watermark'] = "2019-10-01T10:00:00.000Z"
+        state['dashboards']['overview'] = ["visualization:git_main_numbers"]
+        write_export_state(state, state_file)
+
+        self.assertDictEqual(read_export_state(state_file), state)
+        self.assertListEqual(os.listdir(tmpdir), ["state.json"])
+
+        shutil.rmtree(tmpdir)
+
+    def test_export_changed_dashboards(self):
+        """Test whether only the changed dashboards are exported and the deleted ones are removed"""
+
+        tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        export_dir = os.path.join(tmpdir, "panels")
+
+        overview = read_overview()
+        panel_file = os.path.join(tmpdir, "overview.json")
+        with open(panel_file, 'w') as f:
+            json.dump(overview, f)
+        # A second dashboard with the same visualizations
+        overview['dashboard']['id'] = "Overview2"
+        panel_file2 = os.path.join(tmpdir, "overview2.json")
+        with open(panel_file2, 'w') as f:
+            json.dump(overview, f)
+
+        with FakeElastic() as elastic:
+            import_dashboard(elastic.url, elastic.url, panel_file)
+            import_dashboard(elastic.url, elastic.url, panel_file2)
+            docs = elastic.indices['.kibana']['docs']
+            for doc in docs.values():
+                doc['_source']['updated_at'] = "2020-01-01T00:00:00.000Z"
+
+            self.assertListEqual(export_changed_dashboards(elastic.url, export_dir), ["Overview", "Overview2"])
+            self.assertSetEqual(set(os.listdir(export_dir)), {"Overview.json", "Overview2.json", EXPORT_STATE_FILE})
+            state = read_export_state(os.path.join(export_dir, EXPORT_STATE_FILE))
+            self.assertEqual(state['watermark'], "2020-01-01T00:00:00.000Z")
+            self.assertSetEqual(set(state['dashboards']), {"Overview", "Overview2"})
+
+            # Nothing changed
+            self.assertListEqual(export_changed_dashboards(elastic.url, export_dir), [])
+
+            # A change in a visualization exports the dashboards which include it
+            vis = docs['visualization:git_main_numbers']['_source']
+            vis['visualization']['title'] = "Commits"
+            vis['updated_at'] = "2020-02-01T00:00:00.000Z"
+            self.assertListEqual(export_changed_dashboards(elastic.url, export_dir), ["Overview", "Overview2"])
+            with open(os.path.join(export_dir, "Overview.json")) as f:
+                exported = json.load(f)
+            self.assertIn("Commits", [vis['value']['title'] for vis in exported['visualizations']])
+
+            # A deleted dashboard is removed from the state and its file is deleted
+            del docs['dashboard:Overview2']
+            self.assertListEqual(export_changed_dashboards(elastic.url, export_dir), [])
+            self.assertSetEqual(set(os.listdir(export_dir)), {"Overview.json", EXPORT_STATE_FILE})
+            state = read_export_state(os.path.join(export_dir, EXPORT_STATE_FILE))
+            self.assertListEqual(list(state['dashboards']), ["Overview"])
+            self.assertNotIn("dashboard:Overview2", state['digests'])
+            self.assertEqual(state['watermark'], "2020-02-01T00:00:00.000Z")
+
+        clear_caches()
+        shutil.rmtree(tmpdir)
+
+    def test_export_missing_index(self):
+        """Test whether the export of changed dashboards fails without creating a missing Kibana index"""
+
+        tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        export_dir = os.path.join(tmpdir, "panels")
+
+        with FakeElastic() as elastic:
+            with self.assertRaisesRegex(RuntimeError, "Kibana index .kibana not found"):
+                export_changed_dashboards(elastic.url, export_dir)
+            self.assertNotIn('.kibana', elastic.indices)
+            self.assertNotIn('PUT', [request[0] for request in elastic.requests])
+
+        clear_caches()
+        shutil.rmtree(tmpdir)
+
+    def test_get_item_from_hit(self):
+        """Test whether the saved objects are extracted from the hits of any Elasticsearch version"""
+
+        hit = {"_id": "visualization:git_main_numbers", "_type": "doc",
+               "_source": {"type": "visualization", "visualization": {"title": "git_main_numbers"}}}
+        type_, item_id, item_json = get_item_from_hit(hit)
+        self.assertEqual(type_, "visualization")
+        self.assertEqual(item_id, "git_main_numbers")
+        self.assertDictEqual(item_json, {"title": "git_main_numbers"})
+
+        hit = {"_id": "git_main_numbers", "_type": "visualization",
+               "_source": {"title": "git_main_numbers"}}
+        type_, item_id, item_json = get_item_from_hit(hit)
+        self.assertEqual(type_, "visualization")
+        self.assertEqual(item_id, "git_main_numbers")
+        self.assertDictEqual(item_json, {"title": "git_main_numbers"})
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
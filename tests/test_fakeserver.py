@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import requests
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+import kidash.kidash
+from base import OVERVIEW_DASH_FILE, PANEL_FIELDS, read_overview
+from fakeserver import FakeElastic
+from kidash.kidash import (BACKUP_HEADER,
+                           SIGILS_INDEX,
+                           ElasticSearch,
+                           backup_kibana,
+                           clear_caches,
+                           export_dashboard,
+                           find_item_json,
+                           get_release_from_sigils_index,
+                           import_dashboard,
+                           restore_kibana,
+                           search_dashboards)
+
+RELEASE_DATE = "2020-01-01T00:00:00"
+
+
+class TestFakeElastic(unittest.TestCase):
+    """Tests for the I/O paths of kidash against a local stand-in of Elasticsearch"""
+
+    def setUp(self):
+        clear_caches()
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+
+    def tearDown(self):
+        clear_caches()
+        shutil.rmtree(self.tmpdir)
+
+    def write_release_panel(self):
+        overview = read_overview()
+        overview['dashboard']['value']['release_date'] = RELEASE_DATE
+        panel_file = os.path.join(self.tmpdir, "overview.json")
+        with open(panel_file, 'w') as f:
+            json.dump(overview, f)
+        return panel_file
+
+    def test_import_export(self):
+        """Test whether an imported dashboard is exported back"""
+
+        overview = read_overview()
+
+        for version in ["6.8.6", "7.10.2"]:
+            export_file = os.path.join(self.tmpdir, "export-%s.json" % version)
+            with FakeElastic(version) as elastic:
+                import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+
+                # The Kibana index is created by Kibana when setting the default index pattern
+                self.assertIn(('POST', '/api/kibana/settings/defaultIndex'),
+                              [request[:2] for request in elastic.requests])
+                self.assertEqual(len(elastic.indices['.kibana']['docs']), 21)
+                self.assertEqual([dash['_id'] for dash in search_dashboards(elastic.url)], ["dashboard:Overview"])
+
+                export_dashboard(elastic.url, "Overview", export_file)
+                with open(export_file) as f:
+                    exported = json.load(f)
+                # Heights and styles are fixed when importing the objects
+                for _, field in PANEL_FIELDS:
+                    self.assertEqual(sorted(item['id'] for item in exported[field]),
+                                     sorted(item['id'] for item in overview[field]))
+                self.assertEqual(exported['dashboard']['value']['title'], overview['dashboard']['value']['title'])
+            clear_caches()
+
+    def test_items_elasticsearch_5(self):
+        """Test whether the items of Elasticsearch 5 clusters, not nested under their type, are read"""
+
+        overview = read_overview()
+
+        with FakeElastic("5.6.16") as elastic:
+            import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+            self.assertEqual(elastic.indices['.kibana']['docs']['Overview']['_type'], "dashboard")
+
+            kibana = ElasticSearch(elastic.url, ".kibana")
+            vis = overview['visualizations'][0]
+            self.assertDictEqual(find_item_json(kibana, "visualization", vis['id']), vis['value'])
+            self.assertDictEqual(find_item_json(kibana, "visualization", "unknown"), {})
+
+            export_file = os.path.join(self.tmpdir, "export-5.json")
+            export_dashboard(elastic.url, "Overview", export_file)
+            with open(export_file) as f:
+                exported = json.load(f)
+            self.assertEqual(exported['dashboard']['value']['title'], overview['dashboard']['value']['title'])
+            self.assertEqual(len(exported['visualizations']), len(overview['visualizations']))
+
+    def test_release_date(self):
+        """Test whether release dates are added to the strict mapping of the Kibana index or to the sigils index"""
+
+        panel_file = self.write_release_panel()
+
+        with FakeElastic("6.5.4") as elastic:
+            import_dashboard(elastic.url, elastic.url, panel_file)
+            self.assertEqual([request[:2] for request in elastic.requests if '_mapping' in request[1]],
+                             [('PUT', '/.kibana/_mapping/doc')])
+            dashboard = elastic.indices['.kibana']['docs']['dashboard:Overview']['_source']
+            self.assertEqual(dashboard['dashboard']['release_date'], RELEASE_DATE)
+            self.assertNotIn(SIGILS_INDEX, elastic.indices)
+
+        clear_caches()
+        with FakeElastic("6.8.6") as elastic:
+            import_dashboard(elastic.url, elastic.url, panel_file)
+            self.assertFalse([request for request in elastic.requests if '_mapping' in request[1]])
+            self.assertEqual(get_release_from_sigils_index(elastic.url, "Overview", "dashboard"),
+                             RELEASE_DATE)
+
+    def test_backup_restore(self):
+        """Test whether a backup of the Kibana index is restored in an empty cluster of the same version"""
+
+        for version in ["5.6.16", "6.8.6", "7.10.2"]:
+            backup_file = os.path.join(self.tmpdir, "backup-%s.ndjson" % version)
+            with FakeElastic(version) as elastic:
+                import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+                docs = elastic.indices['.kibana']['docs']
+                mappings = elastic.get_mappings('.kibana')['mappings']
+                self.assertEqual(backup_kibana(elastic.url, backup_file), 21)
+
+            with open(backup_file) as f:
+                header = json.loads(f.readline())[BACKUP_HEADER]
+            self.assertEqual(header['index'], ".kibana")
+            self.assertEqual(header['version'], ".".join(version.split(".")[:2]))
+            self.assertEqual(header['mappings'], mappings)
+
+            clear_caches()
+            with FakeElastic(version) as elastic:
+                self.assertEqual(restore_kibana(elastic.url, elastic.url, backup_file), 21)
+                restored = elastic.indices['.kibana']['docs']
+                self.assertEqual(sorted(restored), sorted(docs))
+                for doc_id, doc in docs.items():
+                    self.assertEqual(restored[doc_id]['_type'], doc['_type'])
+                    self.assertEqual(restored[doc_id]['_source'], doc['_source'])
+            clear_caches()
+
+    def test_backup_missing_index(self):
+        """Test whether the backup of a missing Kibana index fails without creating it"""
+
+        backup_file = os.path.join(self.tmpdir, "backup.ndjson")
+        with FakeElastic() as elastic:
+            with self.assertRaisesRegex(RuntimeError, "Kibana index .kibana not found"):
+                backup_kibana(elastic.url, backup_file)
+            self.assertNotIn('.kibana', elastic.indices)
+            self.assertNotIn('PUT', [request[0] for request in elastic.requests])
+        self.assertFalse(os.path.exists(backup_file))
+
+    def test_restore_other_version(self):
+        """Test whether backups are not restored in clusters with another layout of documents"""
+
+        for backup_version, version in [("5.6.16", "7.10.2"), ("6.8.6", "7.10.2"),
+                                        ("5.6.16", "6.8.6"), ("7.10.2", "6.8.6")]:
+            backup_file = os.path.join(self.tmpdir, "backup-%s.ndjson" % backup_version)
+            if not os.path.exists(backup_file):
+                with FakeElastic(backup_version) as elastic:
+                    import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+                    backup_kibana(elastic.url, backup_file)
+                clear_caches()
+
+            with FakeElastic(version) as elastic:
+                with self.assertRaisesRegex(RuntimeError, "can not be restored"):
+                    restore_kibana(elastic.url, elastic.url, backup_file)
+                # Nothing is changed in the cluster
+                self.assertEqual(elastic.indices, {})
+                self.assertEqual({request[0] for request in elastic.requests}, {'GET'})
+            clear_caches()
+
+        # Minor versions with the same layout are compatible
+        with FakeElastic("6.5.4") as elastic:
+            self.assertEqual(restore_kibana(elastic.url, elastic.url, os.path.join(self.tmpdir, "backup-6.8.6.ndjson")),
+                             21)
+
+    def test_restore_bytes(self):
+        """Test whether the size of the bulk requests of a restore is limited in bytes, not in characters"""
+
+        backup_file = os.path.join(self.tmpdir, "backup.ndjson")
+        with open(backup_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({BACKUP_HEADER: {"index": ".kibana", "version": "6.8"}}) + "\n")
+            for i in range(4):
+                source = {"type": "visualization", "visualization": {"title": "Análisis " + "ñ" * 100}}
+                f.write(json.dumps({"_id": "visualization:vis%s" % i, "_type": "doc", "_source": source},
+                                   ensure_ascii=False) + "\n")
+
+        with open(backup_file, encoding='utf-8') as f:
+            line = f.readlines()[1].strip()
+        bulk_max_bytes = kidash.kidash.BULK_MAX_BYTES
+        # Each line reaches the limit when counting bytes, but not when counting characters
+        kidash.kidash.BULK_MAX_BYTES = len(line) + 1
+        self.assertGreater(len(line.encode('utf-8')), kidash.kidash.BULK_MAX_BYTES)
+        try:
+            with FakeElastic() as elastic:
+                self.assertEqual(restore_kibana(elastic.url, elastic.url, backup_file), 4)
+                bulks = [request for request in elastic.requests if request[1].endswith('/_bulk')]
+                self.assertEqual(len(bulks), 4)
+                title = elastic.indices['.kibana']['docs']['visualization:vis0']['_source']['visualization']['title']
+                self.assertEqual(title, "Análisis " + "ñ" * 100)
+        finally:
+            kidash.kidash.BULK_MAX_BYTES = bulk_max_bytes
+
+    def test_injected_failures(self):
+        """Test whether latency, errors and throttling are injected in the responses"""
+
+        with FakeElastic(latency=0.05) as elastic:
+            start = time.time()
+            self.assertEqual(requests.get(elastic.url).json()['version']['number'], "6.8.6")
+            self.assertGreaterEqual(time.time() - start, 0.05)
+
+        with FakeElastic(error_rate=1, error_status=500) as elastic:
+            self.assertEqual(requests.get(elastic.url).status_code, 500)
+            self.assertEqual(requests.get(elastic.url + "/.kibana").status_code, 500)
+
+        # Throttled requests are retried
+        with FakeElastic(throttle_rate=0.1, seed=1) as elastic:
+            import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+            self.assertEqual(len(elastic.indices['.kibana']['docs']), 21)
+
+        with FakeElastic(throttle_rate=0.1, seed=1) as elastic:
+            statuses = [requests.get(elastic.url).status_code for _ in range(50)]
+            self.assertEqual(set(statuses), {200, 429})
+            self.assertEqual(len(elastic.requests), 50)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import read_overview
+from kidash.kidash import (IndexPatternFields,
+                           get_index_pattern_fields,
+                           has_index_pattern_fields,
+                           strip_index_pattern_fields)
+
+FIELD_CAPS = {
+    "_id": {"_id": {"type": "_id", "searchable": True, "aggregatable": True}},
+    "_seq_no": {"_seq_no": {"type": "_seq_no", "searchable": True, "aggregatable": True}},
+    "author": {"object": {"type": "object", "searchable": False, "aggregatable": False}},
+    "author_name": {"keyword": {"type": "keyword", "searchable": True, "aggregatable": True}},
+    "lines": {"long": {"type": "long", "searchable": True, "aggregatable": True},
+              "integer": {"type": "integer", "searchable": True, "aggregatable": True}},
+    "message": {"text": {"type": "text", "searchable": True, "aggregatable": False}},
+    "repo": {"keyword": {"type": "keyword", "searchable": True, "aggregatable": True},
+             "long": {"type": "long", "searchable": True, "aggregatable": True}}
+}
+
+SCRIPTED_FIELD = {"name": "painless_inverted_lines_removed_git", "type": "number", "count": 0,
+                  "scripted": True, "script": "return doc['lines_removed'].value * -1",
+                  "lang": "painless", "searchable": True, "aggregatable": True}
+
+
+class TestIndexPatternFields(unittest.TestCase):
+    """Tests for the rebuild of the fields of index patterns"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+
+        git = read_overview()['index_patterns'][0]['value']
+        fields = json.loads(git['fields']) + [SCRIPTED_FIELD]
+        git['fields'] = json.dumps(fields)
+        self.git = git
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_strip_fields(self):
+        """Test whether only the scripted fields are kept"""
+
+        stripped = strip_index_pattern_fields(self.git)
+
+        self.assertTrue(has_index_pattern_fields(self.git))
+        self.assertFalse(has_index_pattern_fields(stripped))
+        self.assertListEqual(json.loads(stripped['fields']), [SCRIPTED_FIELD])
+        self.assertEqual(stripped['title'], self.git['title'])
+        self.assertGreater(len(json.loads(self.git['fields'])), 1)
+
+    def test_get_index_pattern_fields(self):
+        """Test whether field capabilities are converted to Kibana fields"""
+
+        fields = {field['name']: field for field in get_index_pattern_fields(FIELD_CAPS)}
+
+        self.assertListEqual(sorted(fields),
+                             ['_id', '_score', '_source', 'author_name', 'lines', 'message', 'repo'])
+        self.assertEqual(fields['_id']['type'], 'string')
+        self.assertFalse(fields['_id']['readFromDocValues'])
+        self.assertEqual(fields['author_name']['type'], 'string')
+        self.assertTrue(fields['author_name']['readFromDocValues'])
+        self.assertEqual(fields['lines']['type'], 'number')
+        self.assertEqual(fields['message']['type'], 'string')
+        self.assertFalse(fields['message']['aggregatable'])
+        self.assertFalse(fields['message']['readFromDocValues'])
+        self.assertEqual(fields['repo']['type'], 'conflict')
+        self.assertEqual(fields['_source']['type'], '_source')
+        self.assertEqual(fields['_score']['type'], 'number')
+
+    def test_rebuild_from_file(self):
+        """Test whether fields are rebuilt offline from a fields file"""
+
+        fields_file = os.path.join(self.tmpdir, "fields.json")
+        with open(fields_file, 'w') as f:
+            json.dump({"git": FIELD_CAPS}, f)
+
+        index_fields = IndexPatternFields(fields_file=fields_file)
+        rebuilt = index_fields.rebuild(strip_index_pattern_fields(self.git))
+
+        fields = json.loads(rebuilt['fields'])
+        self.assertEqual(len(fields), 8)
+        self.assertDictEqual(fields[-1], SCRIPTED_FIELD)
+        self.assertEqual(rebuilt['timeFieldName'], self.git['timeFieldName'])
+
+        # Unknown index patterns are not modified
+        mbox = strip_index_pattern_fields(read_overview()['index_patterns'][1]['value'])
+        self.assertIs(index_fields.rebuild(mbox), mbox)
+
+        index_fields.fields_file = os.path.join(self.tmpdir, "saved.json")
+        index_fields.save()
+        with open(index_fields.fields_file) as f:
+            self.assertDictEqual(json.load(f), {"git": FIELD_CAPS})
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from kidash.cassette import record_requests
+from kidash.graph import build_dependency_graph, delete_dashboards, fetch_dependency_graph, get_item_references
+from kidash.kidash import SIGILS_INDEX, clear_caches, import_dashboard
+
+from base import panel_hits, read_overview
+from fakeserver import FakeElastic
+
+
+class TestDependencyGraph(unittest.TestCase):
+    """Tests for the dependency graph of saved objects"""
+
+    def test_get_item_references(self):
+        """Test whether the references of each type of item are found"""
+
+        panels = [{"id": "git_commits", "type": "visualization"},
+                  {"id": "git_search", "type": "search"}]
+        dashboard = {"panelsJSON": json.dumps(panels)}
+        self.assertSetEqual(get_item_references("dashboard", dashboard),
+                            {"visualization:git_commits", "search:git_search"})
+
+        search_source = {"index": "git", "filter": [{"meta": {"index": "git_aoc"}}]}
+        vis = {"savedSearchId": "git_search",
+               "kibanaSavedObjectMeta": {"searchSourceJSON": json.dumps(search_source)}}
+        self.assertSetEqual(get_item_references("visualization", vis),
+                            {"search:git_search", "index-pattern:git", "index-pattern:git_aoc"})
+
+        references = [{"name": "kibanaSavedObjectMeta.searchSourceJSON.index",
+                       "type": "index-pattern", "id": "mbox"}]
+        search = {"kibanaSavedObjectMeta": {"searchSourceJSON": "{}"}}
+        self.assertSetEqual(get_item_references("search", search, references), {"index-pattern:mbox"})
+
+    def test_graph(self):
+        """Test whether dependents, dependencies and orphans are computed"""
+
+        overview = read_overview()
+        hits = panel_hits(overview)
+
+        orphan_vis = {"title": "git_orphan",
+                      "kibanaSavedObjectMeta": {"searchSourceJSON": json.dumps({"index": "git"})}}
+        hits.append({"_id": "visualization:git_orphan", "_type": "doc",
+                     "_source": {"type": "visualization", "visualization": orphan_vis}})
+
+        graph = build_dependency_graph(hits)
+
+        dependents = graph.dependents("index-pattern:mbox")
+        self.assertIn("dashboard:Overview", dependents)
+        self.assertIn("visualization:mbox_main_numbers", dependents)
+        self.assertNotIn("visualization:git_main_numbers", dependents)
+
+        dependents = graph.dependents("index-pattern:git")
+        self.assertIn("visualization:git_orphan", dependents)
+
+        dependencies = graph.dependencies("dashboard:Overview")
+        for index_pattern in overview['index_patterns']:
+            self.assertIn("index-pattern:" + index_pattern['id'], dependencies)
+        for vis in overview['visualizations']:
+            self.assertIn("visualization:" + vis['id'], dependencies)
+        self.assertNotIn("visualization:git_orphan", dependencies)
+
+        self.assertSetEqual(graph.orphans(), {"visualization:git_orphan"})
+        self.assertSetEqual(graph.missing(), set())
+
+    def test_removable(self):
+        """Test whether the objects only used by the removed items are found"""
+
+        overview = read_overview()
+        hits = panel_hits(overview)
+
+        # Another dashboard sharing a visualization with the overview
+        panels = [{"id": "mbox_main_numbers", "type": "visualization"}]
+        hits.append({"_id": "dashboard:Mbox", "_type": "doc",
+                     "_source": {"type": "dashboard",
+                                 "dashboard": {"title": "Mbox", "panelsJSON": json.dumps(panels)}}})
+        # Kibana settings with the default index pattern
+        hits.append({"_id": "config:6.8.6", "_type": "doc",
+                     "_source": {"type": "config", "config": {"defaultIndex": "git"}}})
+
+        graph = build_dependency_graph(hits)
+        removed = graph.removable({"dashboard:Overview"})
+
+        self.assertIn("dashboard:Overview", removed)
+        self.assertIn("visualization:git_main_numbers", removed)
+        self.assertIn("search:Search:_pull_request:true", removed)
+        self.assertIn("index-pattern:github_issues", removed)
+        self.assertNotIn("dashboard:Mbox", removed)
+        self.assertNotIn("visualization:mbox_main_numbers", removed)
+        self.assertNotIn("index-pattern:mbox", removed)
+        self.assertNotIn("index-pattern:git", removed)
+
+    def test_missing_index(self):
+        """Test whether the graph of a missing Kibana index is empty and the index is not created"""
+
+        with FakeElastic() as elastic:
+            graph = fetch_dependency_graph(elastic.url)
+            self.assertSetEqual(graph.items, set())
+            self.assertNotIn('.kibana', elastic.indices)
+            self.assertNotIn('PUT', [request[0] for request in elastic.requests])
+        clear_caches()
+
+
+class TestDeleteDashboards(unittest.TestCase):
+    """Tests for the deletion of dashboards and the objects only used by them"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+
+        overview = read_overview()
+        overview['dashboard']['value']['release_date'] = "2020-01-01T00:00:00"
+        self.panel_file = os.path.join(self.tmpdir, "overview.json")
+        with open(self.panel_file, 'w') as f:
+            json.dump(overview, f)
+
+        # Another dashboard sharing a visualization with the overview
+        mbox = {"dashboard": {"id": "Mbox",
+                              "value": {"title": "Mbox", "release_date": "2020-01-01T00:00:00",
+                                        "panelsJSON": json.dumps([{"id": "mbox_main_numbers",
+                                                                   "type": "visualization"}])}},
+                "visualizations": [vis for vis in overview['visualizations'] if vis['id'] == "mbox_main_numbers"],
+                "index_patterns": [ip for ip in overview['index_patterns'] if ip['id'] == "mbox"]}
+        self.mbox_file = os.path.join(self.tmpdir, "mbox.json")
+        with open(self.mbox_file, 'w') as f:
+            json.dump(mbox, f)
+
+    def tearDown(self):
+        clear_caches()
+        shutil.rmtree(self.tmpdir)
+
+    def test_dry_run(self):
+        """Test whether the objects are listed but not deleted in a dry run"""
+
+        with FakeElastic() as elastic:
+            import_dashboard(elastic.url, elastic.url, self.panel_file)
+            import_dashboard(elastic.url, elastic.url, self.mbox_file)
+            docs = dict(elastic.indices['.kibana']['docs'])
+            del elastic.requests[:]
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                removed = delete_dashboards(elastic.url, ["Over*"], dry_run=True)
+
+            self.assertListEqual(output.getvalue().splitlines(), removed)
+            self.assertIn("dashboard:Overview", removed)
+            self.assertIn("visualization:git_main_numbers", removed)
+            self.assertNotIn("visualization:mbox_main_numbers", removed)
+            self.assertNotIn("dashboard:Mbox", removed)
+            self.assertDictEqual(elastic.indices['.kibana']['docs'], docs)
+            self.assertListEqual([request for request in elastic.requests if request[1].endswith('/_bulk')], [])
+
+    def test_delete_dashboards(self):
+        """Test whether dashboards are deleted with the objects only used by them and their release dates"""
+
+        for version in ["6.8.6", "7.10.2"]:
+            cassette_file = os.path.join(self.tmpdir, "requests-%s.ndjson" % version)
+            with FakeElastic(version) as elastic:
+                import_dashboard(elastic.url, elastic.url, self.panel_file)
+                import_dashboard(elastic.url, elastic.url, self.mbox_file)
+                sigils = elastic.indices[SIGILS_INDEX]['docs']
+                self.assertIn("dashboard:Overview", sigils)
+
+                with record_requests(cassette_file):
+                    removed = delete_dashboards(elastic.url, ["dashboard:Overview"])
+
+                docs = elastic.indices['.kibana']['docs']
+                for key in removed:
+                    self.assertNotIn(key, docs)
+                self.assertIn("dashboard:Mbox", docs)
+                self.assertIn("visualization:mbox_main_numbers", docs)
+                self.assertIn("index-pattern:mbox", docs)
+                self.assertNotIn("dashboard:Overview", sigils)
+                self.assertIn("dashboard:Mbox", sigils)
+
+                self.assertListEqual(delete_dashboards(elastic.url, ["Overview"]), [])
+
+            with open(cassette_file) as f:
+                bulks = [json.loads(line)['request'] for line in f if '/_bulk' in json.loads(line)['request']['url']]
+            actions = [json.loads(line)['delete'] for bulk in bulks for line in bulk['body'].splitlines()]
+            self.assertEqual(len(actions), len(removed) + 1 + len([key for key in removed
+                                                                   if key.startswith("index-pattern:")]))
+            for action in actions:
+                if version.startswith("7."):
+                    self.assertNotIn("_type", action)
+                else:
+                    self.assertEqual(action["_type"], "doc")
+            clear_caches()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(buffer=True, warnings='ignore')
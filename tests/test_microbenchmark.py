@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import sys
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from microbenchmark import (FIELDS,
+                            PANELS,
+                            build_dashboard,
+                            build_index_pattern,
+                            get_benchmarks,
+                            run_microbenchmark)
+
+
+class TestMicrobenchmark(unittest.TestCase):
+    """Tests for the microbenchmarks of the transform functions"""
+
+    def test_inputs(self):
+        """Test whether the inputs are deterministic and have the given sizes"""
+
+        dashboard, viz_titles = build_dashboard(PANELS)
+        self.assertEqual(len(json.loads(dashboard['panelsJSON'])), PANELS)
+        self.assertEqual(len(viz_titles), PANELS)
+        self.assertEqual(build_dashboard(PANELS), (dashboard, viz_titles))
+
+        index_pattern = build_index_pattern(FIELDS)
+        fields = json.loads(index_pattern['value']['fields'])
+        self.assertEqual(len([field for field in fields if not field['scripted']]), FIELDS)
+
+    def test_run_microbenchmark(self):
+        """Test whether all the functions are measured"""
+
+        for name, function, get_args in get_benchmarks():
+            result = run_microbenchmark(function, get_args, repeat=1, number=1)
+            self.assertEqual(result['calls'], 1, name)
+            self.assertGreater(result['min_seconds'], 0, name)
+            self.assertGreater(result['peak_bytes'], 0, name)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from kidash.kidash import clear_caches, fetch_dashboard, import_dashboard, search_dashboards
+from kidash.mirror import KibanaMirror, sync_mirror
+
+from base import OVERVIEW_DASH_FILE, panel_hits, read_overview
+from fakeserver import FakeElastic
+
+
+class TestKibanaMirror(unittest.TestCase):
+    """Tests for the KibanaMirror class"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        self.mirror_file = os.path.join(self.tmpdir, "mirror.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_not_found(self):
+        """Test whether an error is raised when the mirror does not exist"""
+
+        with self.assertRaises(RuntimeError):
+            KibanaMirror(self.mirror_file)
+
+    def test_store(self):
+        """Test whether the items are stored and read from the mirror"""
+
+        overview = read_overview()
+        hits = panel_hits(overview)
+
+        mirror = KibanaMirror(self.mirror_file, create=True)
+        for hit in hits:
+            mirror.store(hit)
+        mirror.commit()
+        mirror.close()
+
+        mirror = KibanaMirror(self.mirror_file)
+        self.assertEqual(len(list(mirror.items())), len(hits))
+        self.assertEqual(len(list(mirror.items("visualization"))), len(overview['visualizations']))
+        self.assertEqual(mirror.versions()["dashboard:Overview"], (0, 1, 1))
+
+        vis = overview['visualizations'][0]
+        self.assertDictEqual(mirror.find_item_json("visualization", vis['id']), vis['value'])
+        self.assertDictEqual(mirror.find_item_json("visualization", "visualization:" + vis['id']), vis['value'])
+        self.assertDictEqual(mirror.find_item_json("visualization", "unknown"), {})
+
+        mirror.delete("visualization:" + vis['id'])
+        self.assertDictEqual(mirror.find_item_json("visualization", vis['id']), {})
+        mirror.close()
+
+    def test_fetch_dashboard(self):
+        """Test whether dashboards are fetched and listed from the mirror"""
+
+        overview = read_overview()
+        hits = panel_hits(overview)
+
+        mirror = KibanaMirror(self.mirror_file, create=True)
+        for hit in hits:
+            mirror.store(hit)
+
+        dashboards = search_dashboards(None, mirror=mirror)
+        self.assertListEqual(dashboards, [{"_id": "dashboard:Overview", "title": "Overview"}])
+
+        kibana = fetch_dashboard(None, "Overview", mirror=mirror)
+        self.assertDictEqual(kibana['dashboard'], overview['dashboard'])
+        self.assertEqual(len(kibana['visualizations']), len(overview['visualizations']))
+        self.assertSetEqual({ip['id'] for ip in kibana['index_patterns']},
+                            {ip['id'] for ip in overview['index_patterns']})
+        mirror.close()
+
+    def test_sync_mirror(self):
+        """Test whether the mirror is synced in full the first time and incrementally the next ones"""
+
+        for version in ["6.8.6", "7.10.2"]:
+            mirror_file = os.path.join(self.tmpdir, "mirror-%s.db" % version)
+
+            with FakeElastic(version) as elastic:
+                import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+                docs = elastic.indices['.kibana']['docs']
+
+                # First sync: the whole index is read
+                self.assertTupleEqual(sync_mirror(elastic.url, mirror_file), (21, 0))
+                mirror = KibanaMirror(mirror_file)
+                self.assertEqual(mirror.get_meta('index'), ".kibana")
+                self.assertEqual(mirror.get_meta('version'), ".".join(version.split(".")[:2]))
+                self.assertDictEqual(mirror.versions(),
+                                     {doc_id: (doc['_seq_no'], doc['_primary_term'], doc['_version'])
+                                      for doc_id, doc in docs.items()})
+                mirror.close()
+
+                # Nothing changed: only the metadata of the documents is read
+                del elastic.requests[:]
+                self.assertTupleEqual(sync_mirror(elastic.url, mirror_file), (0, 0))
+                self.assertNotIn('/.kibana/_mget', [request[1] for request in elastic.requests])
+
+                # An updated document is retrieved with a multi-get request
+                vis = dict(docs['visualization:git_main_numbers']['_source'])
+                vis['visualization'] = dict(vis['visualization'], title="Commits")
+                elastic.put_doc('.kibana', 'visualization:git_main_numbers', vis)
+                del elastic.requests[:]
+                self.assertTupleEqual(sync_mirror(elastic.url, mirror_file), (1, 0))
+                self.assertEqual([request[1] for request in elastic.requests].count('/.kibana/_mget'), 1)
+                mirror = KibanaMirror(mirror_file)
+                self.assertEqual(mirror.find_item_json("visualization", "git_main_numbers")['title'], "Commits")
+                self.assertEqual(mirror.versions()['visualization:git_main_numbers'][2], 2)
+                mirror.close()
+
+                # A deleted document is removed from the mirror
+                del docs['visualization:git_main_numbers']
+                self.assertTupleEqual(sync_mirror(elastic.url, mirror_file), (0, 1))
+                mirror = KibanaMirror(mirror_file)
+                self.assertDictEqual(mirror.find_item_json("visualization", "git_main_numbers"), {})
+                self.assertEqual(len(list(mirror.items())), 20)
+                mirror.close()
+
+                # The mirror can not be synced with another index
+                with self.assertRaises(RuntimeError):
+                    sync_mirror(elastic.url, mirror_file, ".kibana_2")
+            clear_caches()
+
+    def test_sync_missing_index(self):
+        """Test whether a mirror of a missing Kibana index is not synced nor created"""
+
+        with FakeElastic() as elastic:
+            with self.assertRaisesRegex(RuntimeError, "Kibana index .kibana not found"):
+                sync_mirror(elastic.url, self.mirror_file)
+            self.assertNotIn('.kibana', elastic.indices)
+            self.assertNotIn('PUT', [request[0] for request in elastic.requests])
+        self.assertFalse(os.path.exists(self.mirror_file))
+        clear_caches()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(buffer=True, warnings='ignore')
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import OVERVIEW_DASH_FILE, read_overview
+from kidash.kidash import prepare_panel_items
+from kidash.panels import create_bundle, is_bundle, read_bundle, read_panels, read_stdin_panels
+
+
+class TestBundle(unittest.TestCase):
+    """Tests for the bundles of panels"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        self.bundle_file = os.path.join(self.tmpdir, "panels.kidash")
+
+        overview = read_overview()
+        self.ip_file = os.path.join(self.tmpdir, "index-patterns.json")
+        with open(self.ip_file, 'w') as f:
+            json.dump({"index_patterns": overview['index_patterns']}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_create_bundle(self):
+        """Test whether panels are stored in a bundle and read back"""
+
+        nobjects = create_bundle([OVERVIEW_DASH_FILE, self.ip_file], self.bundle_file)
+        self.assertEqual(nobjects, 24)
+        self.assertTrue(is_bundle(self.bundle_file))
+        self.assertFalse(is_bundle(OVERVIEW_DASH_FILE))
+        self.assertFalse(is_bundle(os.path.join(self.tmpdir, "not-found")))
+
+        panels = list(read_bundle(self.bundle_file))
+        self.assertListEqual([name for name, _ in panels],
+                             ["overview-with-index-patterns.json", "index-patterns.json"])
+        self.assertDictEqual(panels[0][1], read_overview())
+        self.assertListEqual(list(panels[1][1]), ["index_patterns"])
+
+        with self.assertRaises(RuntimeError):
+            create_bundle([OVERVIEW_DASH_FILE], self.bundle_file)
+
+    def test_read_data_sources(self):
+        """Test whether only the objects for the data sources are read"""
+
+        create_bundle([OVERVIEW_DASH_FILE, self.ip_file], self.bundle_file)
+        panels = dict(read_bundle(self.bundle_file, data_sources=['mbox']))
+
+        overview = panels["overview-with-index-patterns.json"]
+        self.assertListEqual([ip['id'] for ip in overview['index_patterns']], ['mbox'])
+        self.assertListEqual([ip['id'] for ip in panels["index-patterns.json"]['index_patterns']], ['mbox'])
+
+        # Visualizations not read keep only their titles
+        for vis in overview['visualizations']:
+            if vis['value']['title'].startswith('mbox'):
+                self.assertIn('visState', vis['value'])
+            else:
+                self.assertDictEqual(vis['value'], {"title": vis['value']['title']})
+
+        # The import of the objects read is the same as the one of the panel file
+        expected = list(prepare_panel_items(read_overview(), (6, 8), ['mbox']))
+        self.assertListEqual(list(prepare_panel_items(overview, (6, 8), ['mbox'])), expected)
+
+    def test_read_panels(self):
+        """Test whether panel files and bundles are read"""
+
+        create_bundle([OVERVIEW_DASH_FILE], self.bundle_file)
+
+        self.assertListEqual(list(read_panels(OVERVIEW_DASH_FILE)), [(OVERVIEW_DASH_FILE, read_overview())])
+        self.assertListEqual(list(read_panels(self.bundle_file)),
+                             [("overview-with-index-patterns.json", read_overview())])
+
+        with self.assertRaises(RuntimeError):
+            list(read_panels(os.path.join(self.tmpdir, "not-found.json")))
+
+
+class TestArchives(unittest.TestCase):
+    """Tests for the archives of panels"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def create_tar(self, mode):
+        tar_file = io.BytesIO()
+        with tarfile.open(fileobj=tar_file, mode=mode) as tar:
+            tar.add(OVERVIEW_DASH_FILE, arcname="panels/overview.json")
+            tar.add(OVERVIEW_DASH_FILE, arcname="panels/README.md")
+        return tar_file.getvalue()
+
+    def test_read_tar(self):
+        """Test whether the panels of compressed tar archives are read"""
+
+        archive = os.path.join(self.tmpdir, "panels.tar.gz")
+        with open(archive, 'wb') as f:
+            f.write(self.create_tar('w:gz'))
+
+        panels = list(read_panels(archive))
+        self.assertListEqual(panels, [(archive + ":panels/overview.json", read_overview())])
+
+    def test_read_zip(self):
+        """Test whether the panels of zip archives are read"""
+
+        archive = os.path.join(self.tmpdir, "panels.zip")
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.write(OVERVIEW_DASH_FILE, "panels/overview.json")
+            zip_file.writestr("panels/", "")
+
+        panels = list(read_panels(archive))
+        self.assertListEqual(panels, [(archive + ":panels/overview.json", read_overview())])
+
+    def test_read_stdin(self):
+        """Test whether panel files and tar archives are read from stdin"""
+
+        with open(OVERVIEW_DASH_FILE, 'rb') as f:
+            stdin = io.BufferedReader(io.BytesIO(b"\n  " + f.read()))
+        self.assertListEqual(list(read_stdin_panels(stdin)), [("-", read_overview())])
+
+        stdin = io.BufferedReader(io.BytesIO(self.create_tar('w:gz')))
+        self.assertListEqual(list(read_stdin_panels(stdin)), [("-:panels/overview.json", read_overview())])
+
+        stdin = io.BufferedReader(io.BytesIO(b"PK\x03\x04"))
+        with self.assertRaises(RuntimeError):
+            list(read_stdin_panels(stdin))
+
+        stdin = io.BufferedReader(io.BytesIO(b"not a panel"))
+        with self.assertRaises(RuntimeError):
+            list(read_stdin_panels(stdin))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import contextlib
+import io
+import json
+import logging
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+import requests
+
+from base import OVERVIEW_DASH_FILE, read_overview
+from fakeserver import FakeElastic
+from kidash.kidash import clear_caches
+from kidash.plan import DryRunAdapter
+
+KIDASH_CLI = os.path.join('..', 'kidash', 'bin', 'kidash.py')
+
+
+class ReadAdapter(requests.adapters.BaseAdapter):
+    """Adapter which records the requests and returns empty responses"""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append((request.method, request.url))
+        response = requests.models.Response()
+        response.status_code = 200
+        response._content = b'{}'
+        return response
+
+    def close(self):
+        pass
+
+
+class TestDryRunAdapter(unittest.TestCase):
+    """Tests for the dry run adapter"""
+
+    def setUp(self):
+        self.session = requests.Session()
+        self.read_adapter = ReadAdapter()
+        self.adapter = DryRunAdapter(self.read_adapter)
+        self.session.mount('http://', self.adapter)
+
+    def test_reads(self):
+        """Test whether read requests are sent"""
+
+        self.session.get('http://localhost:9200/.kibana')
+        self.session.post('http://localhost:9200/.kibana/_search?scroll=5m', data='{}')
+        self.session.post('http://localhost:9200/_search/scroll', data='{}')
+        self.session.post('http://localhost:9200/.kibana/_mget', data='{"docs": []}')
+
+        self.assertEqual(len(self.read_adapter.sent), 4)
+        self.assertEqual(self.adapter.reads, 4)
+        self.assertEqual(self.adapter.writes, 0)
+        self.assertEqual(self.adapter.bytes_sent, 0)
+
+    def test_writes(self):
+        """Test whether write requests are counted but not sent"""
+
+        data = json.dumps({"type": "dashboard", "dashboard": {"title": "Git"}})
+        res = self.session.post('http://localhost:9200/.kibana/doc/dashboard:git', data=data)
+        res.raise_for_status()
+        res = self.session.put('http://localhost:9200/.kibana')
+        res.raise_for_status()
+
+        self.assertEqual(self.read_adapter.sent, [])
+        self.assertEqual(self.adapter.writes, 2)
+        self.assertEqual(self.adapter.bytes_sent, len(data))
+
+    def test_bulk(self):
+        """Test whether bulk requests get a successful result for each action"""
+
+        actions = [{"index": {"_id": "dashboard:git"}}, {"title": "Git"},
+                   {"delete": {"_id": "visualization:git_commits"}}]
+        data = "\n".join(json.dumps(action) for action in actions) + "\n"
+        res = self.session.post('http://localhost:9200/.kibana/_bulk', data=data)
+
+        result = res.json()
+        self.assertFalse(result['errors'])
+        self.assertEqual([list(item) for item in result['items']], [['index'], ['delete']])
+        self.assertEqual(result['items'][0]['index']['_id'], "dashboard:git")
+        self.assertEqual(self.read_adapter.sent, [])
+
+    def test_bulk_sources(self):
+        """Test whether the sources of the bulk actions are not read as actions"""
+
+        actions = [{"index": {"_id": "dashboard:git"}}, {"delete": "not an action"},
+                   {"update": {"_id": "visualization:git_commits"}}, {"doc": {"index": {"_id": "git"}}},
+                   {"delete": {"_id": "search:git"}},
+                   {"create": {"_id": "index-pattern:git"}}, {"index": {"title": "git"}}]
+        data = "\n".join(json.dumps(action) for action in actions) + "\n"
+        res = self.session.post('http://localhost:9200/.kibana/_bulk', data=data)
+
+        items = res.json()['items']
+        self.assertEqual([(list(item)[0], list(item.values())[0]['_id']) for item in items],
+                         [("index", "dashboard:git"), ("update", "visualization:git_commits"),
+                          ("delete", "search:git"), ("create", "index-pattern:git")])
+
+
+class TestPlan(unittest.TestCase):
+    """Tests for the plan of an import from the command line"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+
+    def tearDown(self):
+        clear_caches()
+        shutil.rmtree(self.tmpdir)
+
+    def test_plan(self):
+        """Test whether the cost of an import is printed and nothing is written"""
+
+        overview = read_overview()
+        nobjects = 1 + len(overview['visualizations']) + len(overview['searches']) + len(overview['index_patterns'])
+        cli = runpy.run_path(KIDASH_CLI, run_name="kidash_cli")
+
+        with FakeElastic() as elastic:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                exit_code = cli['run_request'](["-e", elastic.url, "--import", OVERVIEW_DASH_FILE, "--plan"])
+
+            self.assertEqual(exit_code, 0)
+            self.assertDictEqual(elastic.indices, {})
+            self.assertDictEqual(elastic.kibana_settings, {})
+            self.assertLessEqual({request[0] for request in elastic.requests}, {'GET', 'POST'})
+            for method, path, _ in elastic.requests:
+                if method == 'POST':
+                    self.assertTrue(path.endswith(('_search', '_mget', '_field_caps')), path)
+
+        lines = output.getvalue().splitlines()
+        self.assertRegex(lines[0], r"^%s: %s objects, \d+ bytes, \d+ requests \(\d+ writes\)$" %
+                         (OVERVIEW_DASH_FILE, nobjects))
+        self.assertRegex(lines[1], r"^  largest object: \S+ \(\d+ bytes\)$")
+        self.assertRegex(lines[2], r"^Total: %s objects, " % nobjects)
+
+    def test_plan_stats_journal(self):
+        """Test whether planned objects are not counted as imported and the journal is not touched"""
+
+        overview = read_overview()
+        nobjects = 1 + len(overview['visualizations']) + len(overview['searches']) + len(overview['index_patterns'])
+        cli = runpy.run_path(KIDASH_CLI, run_name="kidash_cli")
+
+        stats_file = os.path.join(self.tmpdir, "stats.json")
+        journal_file = os.path.join(self.tmpdir, "journal")
+        with open(journal_file, 'w') as f:
+            f.write('{"target": "t", "panel": "p", "item": "dashboard:Overview"}\n')
+
+        with FakeElastic() as elastic:
+            with contextlib.redirect_stdout(io.StringIO()):
+                exit_code = cli['run_request'](["-e", elastic.url, "--import", OVERVIEW_DASH_FILE, "--plan",
+                                                "--stats", stats_file, "--journal", journal_file])
+            self.assertEqual(exit_code, 0)
+
+        with open(stats_file) as f:
+            objects = json.load(f)['objects']
+        self.assertEqual(objects['planned'], nobjects)
+        self.assertEqual(objects['imported'], 0)
+
+        with open(journal_file) as f:
+            self.assertEqual(f.read(), '{"target": "t", "panel": "p", "item": "dashboard:Overview"}\n')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main(buffer=True, warnings='ignore')
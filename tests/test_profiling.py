@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+import os
+import pstats
+import runpy
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import OVERVIEW_DASH_FILE
+from fakeserver import FakeElastic
+from kidash.kidash import (PROFILERS,
+                           STATS_COLLECTORS,
+                           clear_caches,
+                           export_dashboard,
+                           import_dashboard,
+                           run_phase)
+from kidash.profiling import CPU_PROFILE_FILE, MEMORY_SNAPSHOT_FILE, SUMMARY_FILE, profile_run
+
+
+def get_profiled_functions(profile_file):
+    return {function for _, _, function in pstats.Stats(profile_file).stats}
+
+
+class TestProfiling(unittest.TestCase):
+    """Tests for the CPU and memory profiles of the runs"""
+
+    def setUp(self):
+        clear_caches()
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        self.profile_dir = os.path.join(self.tmpdir, "profile")
+
+    def tearDown(self):
+        clear_caches()
+        shutil.rmtree(self.tmpdir)
+
+    def test_profile_run(self):
+        """Test whether the CPU profile and the memory snapshot of a run are saved and can be loaded"""
+
+        with FakeElastic() as elastic:
+            with profile_run(self.profile_dir) as profiler:
+                # Profilers are not stats collectors
+                self.assertEqual(PROFILERS, [profiler])
+                self.assertEqual(STATS_COLLECTORS, [])
+                import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+                self.assertTrue(tracemalloc.is_tracing())
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(PROFILERS, [])
+        self.assertTrue(profiler.snapshot_phase.startswith("end of "))
+
+        self.assertEqual(profiler.calls, 1)
+        self.assertGreater(profiler.peak, 0)
+        self.assertEqual(sorted(os.listdir(self.profile_dir)),
+                         sorted([CPU_PROFILE_FILE, MEMORY_SNAPSHOT_FILE, SUMMARY_FILE]))
+
+        functions = get_profiled_functions(os.path.join(self.profile_dir, CPU_PROFILE_FILE))
+        self.assertIn("import_panel", functions)
+        self.assertIn("feed_dashboard", functions)
+
+        snapshot = tracemalloc.Snapshot.load(os.path.join(self.profile_dir, MEMORY_SNAPSHOT_FILE))
+        self.assertGreater(sum(stat.size for stat in snapshot.statistics('filename')), 0)
+
+        with open(os.path.join(self.profile_dir, SUMMARY_FILE)) as f:
+            summary = f.read()
+        self.assertTrue(summary.startswith("Profile of the run: 1 calls"))
+        self.assertIn("Top allocation sites:\n#1: ", summary)
+        self.assertIn("Top functions by cumulative time:", summary)
+
+    def test_phase_snapshots(self):
+        """Test whether the memory is snapshotted at the end of the phases with more memory in use"""
+
+        with profile_run(self.profile_dir) as profiler:
+            with run_phase("transform"):
+                items = [str(i) for i in range(100000)]
+            del items
+            with run_phase("write"):
+                pass
+        self.assertEqual(profiler.snapshot_phase, "end of phase transform")
+
+    def test_profile_function(self):
+        """Test whether the profile is limited to the calls to a function"""
+
+        export_file = os.path.join(self.tmpdir, "export.json")
+
+        with FakeElastic() as elastic:
+            with profile_run(self.profile_dir, "fetch_dashboard") as profiler:
+                self.assertEqual(PROFILERS, [profiler])
+                import_dashboard(elastic.url, elastic.url, OVERVIEW_DASH_FILE)
+                self.assertEqual(profiler.calls, 0)
+                self.assertFalse(tracemalloc.is_tracing())
+
+                export_dashboard(elastic.url, "Overview", export_file)
+                self.assertEqual(profiler.calls, 1)
+            self.assertEqual(PROFILERS, [])
+
+        functions = get_profiled_functions(os.path.join(self.profile_dir, CPU_PROFILE_FILE))
+        self.assertIn("find_items_json", functions)
+        self.assertNotIn("feed_dashboard", functions)
+        self.assertNotIn("export_dashboard_files", functions)
+
+        with self.assertRaisesRegex(ValueError, "import_panel can not be profiled"):
+            with profile_run(self.profile_dir, "import_panel"):
+                pass
+
+    def test_threads(self):
+        """Test whether runs with jobs or targets in other threads are not profiled"""
+
+        cli = runpy.run_path(os.path.join('..', 'kidash', 'bin', 'kidash.py'), run_name="kidash_cli")
+
+        for argv in [["--manifest", "jobs.json"], ["--import", OVERVIEW_DASH_FILE, "--targets", "http://localhost:9200"]]:
+            with self.assertRaises(SystemExit):
+                cli['get_params'](argv + ["--profile", self.profile_dir])
+        self.assertEqual(cli['get_params'](["--manifest", "jobs.json"]).profile_dir, None)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
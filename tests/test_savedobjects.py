@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import read_overview
+from fakeserver import FakeElastic, FakeKibana
+from kidash.kidash import SIGILS_INDEX, clear_caches
+from kidash.savedobjects import (KibanaSavedObjects,
+                                 backup_saved_objects,
+                                 export_dashboard_saved_objects,
+                                 get_panel_saved_objects,
+                                 import_panel_saved_objects,
+                                 restore_saved_objects)
+
+
+def panel_ids(panel):
+    ids = {('dashboard', panel['dashboard']['id'])}
+    for type_, field in [('visualization', 'visualizations'), ('search', 'searches'),
+                         ('index-pattern', 'index_patterns')]:
+        ids.update((type_, item['id']) for item in panel.get(field, []))
+    return ids
+
+
+def parse_search_source(attributes):
+    """Parse the search source of an object, which is serialized again when references are injected"""
+
+    attributes = dict(attributes)
+    meta = attributes.get('kibanaSavedObjectMeta')
+    if meta and meta.get('searchSourceJSON'):
+        attributes['kibanaSavedObjectMeta'] = dict(meta, searchSourceJSON=json.loads(meta['searchSourceJSON']))
+    return attributes
+
+
+class TestKibanaSavedObjects(unittest.TestCase):
+    """Tests for the backend using the saved objects API of Kibana"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        self.kibana = FakeKibana()
+        self.saved_objects = KibanaSavedObjects(self.kibana.start() + "/")
+
+    def tearDown(self):
+        self.kibana.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_import_export(self):
+        """Test whether panels are imported and exported with a single request"""
+
+        overview = read_overview()
+
+        nimported = import_panel_saved_objects(self.saved_objects, overview, "overview.json")
+        self.assertEqual(nimported, len(panel_ids(overview)))
+        self.assertEqual(set(self.kibana.saved_objects), panel_ids(overview))
+        self.assertEqual([request[:2] for request in self.kibana.requests],
+                         [('POST', '/api/saved_objects/_bulk_create')])
+
+        # Kibana stores the objects used by the dashboard as references
+        dashboard = self.kibana.saved_objects[('dashboard', 'Overview')]
+        self.assertEqual(len(dashboard['references']), len(json.loads(overview['dashboard']['value']['panelsJSON'])))
+
+        export_file = os.path.join(self.tmpdir, "overview.json")
+        export_dashboard_saved_objects(self.saved_objects, "Overview", export_file)
+        self.assertEqual([request[:2] for request in self.kibana.requests[1:]],
+                         [('POST', '/api/saved_objects/_export')])
+
+        with open(export_file) as f:
+            exported = json.load(f)
+        self.assertEqual(panel_ids(exported), panel_ids(overview))
+        self.assertIn('release_date', exported['dashboard']['value'])
+
+        # References are moved back to the objects
+        prepared = {(saved_object['type'], saved_object['id']): saved_object['attributes']
+                    for saved_object, _ in get_panel_saved_objects(overview)}
+        for field, type_ in [('visualizations', 'visualization'), ('searches', 'search')]:
+            for item in exported[field]:
+                self.assertEqual(parse_search_source(item['value']),
+                                 parse_search_source(prepared[(type_, item['id'])]))
+        exported_panels = json.loads(exported['dashboard']['value']['panelsJSON'])
+        prepared_panels = json.loads(prepared[('dashboard', 'Overview')]['panelsJSON'])
+        self.assertEqual(exported_panels, prepared_panels)
+
+    def test_find_item_json(self):
+        """Test whether items are read with their references inside them"""
+
+        import_panel_saved_objects(self.saved_objects, read_overview(), "overview.json")
+
+        dash_json = self.saved_objects.find_item_json("dashboard", "dashboard:Overview")
+        panels = json.loads(dash_json['panelsJSON'])
+        self.assertTrue(all('id' in panel and 'panelRefName' not in panel for panel in panels))
+        self.assertEqual(self.saved_objects.find_item_json("dashboard", "missing"), {})
+
+    def test_strict(self):
+        """Test whether dashboards are not imported when a newer one is stored"""
+
+        overview = read_overview()
+        overview['dashboard']['value']['release_date'] = "2020-01-01T00:00:00"
+        self.kibana.put_saved_object('dashboard', 'Overview', {"title": "Overview", "release_date": "2021-01-01"})
+
+        self.assertEqual(import_panel_saved_objects(self.saved_objects, overview, "overview.json", strict=True), 0)
+        self.assertEqual([request[:2] for request in self.kibana.requests],
+                         [('POST', '/api/saved_objects/_bulk_get')])
+
+        overview['dashboard']['value']['release_date'] = "2022-01-01T00:00:00"
+        self.assertEqual(import_panel_saved_objects(self.saved_objects, overview, "overview.json", strict=True),
+                         len(panel_ids(overview)))
+
+    def test_strict_sigils(self):
+        """Test whether the release dates stored only in the Sigils index are checked"""
+
+        overview = read_overview()
+        overview['dashboard']['value']['release_date'] = "2021-01-01T00:00:00"
+
+        with FakeElastic("7.10.2") as elastic:
+            try:
+                import_panel_saved_objects(self.saved_objects, overview, "overview.json", elastic.url)
+                # Kibana >= 7.10 does not keep the release dates in the attributes
+                self.assertNotIn('release_date', self.kibana.saved_objects[('dashboard', 'Overview')]['attributes'])
+                self.assertIn('dashboard:Overview', elastic.indices[SIGILS_INDEX]['docs'])
+
+                overview['dashboard']['value']['release_date'] = "2020-01-01T00:00:00"
+                self.assertEqual(import_panel_saved_objects(self.saved_objects, overview, "overview.json",
+                                                            elastic.url, strict=True), 0)
+
+                overview['dashboard']['value']['release_date'] = "2022-01-01T00:00:00"
+                self.assertEqual(import_panel_saved_objects(self.saved_objects, overview, "overview.json",
+                                                            elastic.url, strict=True), len(panel_ids(overview)))
+            finally:
+                clear_caches()
+
+    def test_backup_restore(self):
+        """Test whether all the saved objects are restored from a backup"""
+
+        import_panel_saved_objects(self.saved_objects, read_overview(), "overview.json")
+
+        backup_file = os.path.join(self.tmpdir, "kibana.ndjson")
+        backup_saved_objects(self.saved_objects, backup_file)
+        with self.assertRaises(RuntimeError):
+            backup_saved_objects(self.saved_objects, backup_file)
+
+        with FakeKibana() as kibana:
+            nrestored = restore_saved_objects(KibanaSavedObjects(kibana.url), backup_file)
+            self.assertEqual(nrestored, len(self.kibana.saved_objects))
+            self.assertEqual(kibana.saved_objects, self.kibana.saved_objects)
+            self.assertEqual([request[:2] for request in kibana.requests], [('POST', '/api/saved_objects/_import')])
+
+    def test_conflicts(self):
+        """Test whether errors creating objects are reported"""
+
+        self.kibana.put_saved_object('dashboard', 'Overview', {"title": "Overview"})
+        saved_object = {"type": "dashboard", "id": "Overview", "attributes": {"title": "Overview"}}
+
+        with self.assertRaises(RuntimeError):
+            self.saved_objects.bulk_create([saved_object], overwrite=False)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from fakeserver import FakeElastic
+from kidash.kidash import (STUDY_PATTERN,
+                           clear_caches,
+                           convert_panel_files,
+                           get_index_pattern_from_meta,
+                           restore_kibana)
+from synthetic import generate_panels, write_panels
+
+
+class TestSynthetic(unittest.TestCase):
+    """Tests for the generator of synthetic panels"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+
+    def tearDown(self):
+        clear_caches()
+        shutil.rmtree(self.tmpdir)
+
+    def test_generate_panels(self):
+        """Test whether the panels have the requested objects and valid references"""
+
+        panels = generate_panels(dashboards=4, visualizations=12, searches=3, studies=2,
+                                 data_sources=["git", "jira"], fields=500, seed=1)
+        self.assertEqual(len(panels), 4)
+        self.assertEqual(panels, generate_panels(4, 12, 3, 2, ["git", "jira"], 500, seed=1))
+        self.assertNotEqual(panels, generate_panels(4, 12, 3, 2, ["git", "jira"], 500, seed=2))
+
+        for panel in panels.values():
+            vis_ids = [vis['id'] for vis in panel['visualizations']]
+            search_ids = {search['id'] for search in panel['searches']}
+            index_pattern_ids = {index_pattern['id'] for index_pattern in panel['index_patterns']}
+
+            self.assertEqual(len(vis_ids), 14)
+            self.assertEqual(len([vis_id for vis_id in vis_ids if STUDY_PATTERN in vis_id]), 2)
+            self.assertEqual(len(search_ids), 3)
+            self.assertEqual(len(json.loads(panel['index_patterns'][0]['value']['fields'])), 501)
+
+            dash_panels = json.loads(panel['dashboard']['value']['panelsJSON'])
+            self.assertEqual([dash_panel['id'] for dash_panel in dash_panels], vis_ids)
+            for vis in panel['visualizations']:
+                if 'savedSearchId' in vis['value']:
+                    self.assertIn(vis['value']['savedSearchId'], search_ids)
+                else:
+                    self.assertIn(get_index_pattern_from_meta(vis['value']['kibanaSavedObjectMeta']), index_pattern_ids)
+            for search in panel['searches']:
+                self.assertIn(get_index_pattern_from_meta(search['value']['kibanaSavedObjectMeta']), index_pattern_ids)
+
+    def test_kibana_contents(self):
+        """Test whether the generated contents of the Kibana index are restored"""
+
+        panels = generate_panels(dashboards=3, visualizations=5, studies=1, data_sources=["git", "github"])
+        panel_files = write_panels(panels, os.path.join(self.tmpdir, "panels"))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmpdir, "panels"))),
+                         ["git-dashboard-0.json", "git-dashboard-2.json", "github-dashboard-1.json"])
+
+        kibana_file = os.path.join(self.tmpdir, "kibana.ndjson")
+        convert_panel_files(panel_files, kibana_file, "6.8", add_vis_studies=True)
+
+        with FakeElastic() as elastic:
+            restore_kibana(elastic.url, elastic.url, kibana_file)
+            # Dashboards, visualizations, searches and index patterns
+            self.assertEqual(len(elastic.indices['.kibana']['docs']), 3 + 3 * 6 + 4 + 2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) GrimoireLab Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+# Hack to make sure that tests import the right packages
+# due to setuptools behaviour
+sys.path.insert(0, '..')
+
+from base import read_overview
+from fakeserver import FakeElastic
+from kidash.kidash import clear_caches, prepare_panel_items
+from kidash.watch import MAX_RETRY_DELAY, RETRY_DELAY, PanelWatcher, watch_panels
+
+
+class TestPanelWatcher(unittest.TestCase):
+    """Tests for the changes of the panel files of a directory"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='kidash_')
+        os.mkdir(os.path.join(self.tmpdir, "git"))
+        self.panel_file = os.path.join(self.tmpdir, "git", "overview.json")
+        self.write_panel(read_overview())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_panel(self, panel, mtime=1000):
+        with open(self.panel_file, 'w') as f:
+            json.dump(panel, f)
+        os.utime(self.panel_file, (mtime, mtime))
+
+    def test_changed_files(self):
+        """Test whether files are reported once they do not change during the debounce time"""
+
+        with open(os.path.join(self.tmpdir, "README.md"), 'w') as f:
+            f.write("Not a panel")
+
+        watcher = PanelWatcher(self.tmpdir, debounce=1)
+        self.assertEqual(watcher.changed_files(now=0), [])
+        self.assertEqual(watcher.changed_files(now=1), [self.panel_file])
+        self.assertEqual(watcher.changed_files(now=2), [])
+
+        # Saved twice while debouncing
+        self.write_panel(read_overview(), mtime=2000)
+        self.assertEqual(watcher.changed_files(now=3), [])
+        self.write_panel(read_overview(), mtime=3000)
+        self.assertEqual(watcher.changed_files(now=3.5), [])
+        self.assertEqual(watcher.changed_files(now=4), [])
+        self.assertEqual(watcher.changed_files(now=4.5), [self.panel_file])
+
+        # Removed and created again
+        os.remove(self.panel_file)
+        self.assertEqual(watcher.changed_files(now=5), [])
+        self.write_panel(read_overview(), mtime=3000)
+        self.assertEqual(watcher.changed_files(now=6), [])
+        self.assertEqual(watcher.changed_files(now=7), [self.panel_file])
+
+    def test_failed_files(self):
+        """Test whether failed files are reported again when they change or once the retry delay has passed"""
+
+        watcher = PanelWatcher(self.tmpdir, debounce=1)
+        watcher.changed_files(now=0)
+        self.assertEqual(watcher.changed_files(now=1), [self.panel_file])
+
+        # Not reported on each scan, but after a delay which doubles on each failure
+        self.assertEqual(watcher.record_failure(self.panel_file, now=1), RETRY_DELAY)
+        self.assertEqual(watcher.changed_files(now=2), [])
+        self.assertEqual(watcher.changed_files(now=1 + RETRY_DELAY), [self.panel_file])
+        self.assertEqual(watcher.changed_files(now=2 + RETRY_DELAY), [])
+        self.assertEqual(watcher.record_failure(self.panel_file, now=2 + RETRY_DELAY), 2 * RETRY_DELAY)
+        self.assertEqual(watcher.changed_files(now=1 + 3 * RETRY_DELAY), [])
+        self.assertEqual(watcher.changed_files(now=2 + 3 * RETRY_DELAY), [self.panel_file])
+        for _ in range(10):
+            delay = watcher.record_failure(self.panel_file, now=100)
+        self.assertEqual(delay, MAX_RETRY_DELAY)
+
+        # A new version is reported once it is stable
+        self.write_panel(read_overview(), mtime=2000)
+        self.assertEqual(watcher.changed_files(now=101), [])
+        self.assertEqual(watcher.changed_files(now=102), [self.panel_file])
+        self.assertEqual(watcher.record_failure(self.panel_file, now=102), RETRY_DELAY)
+
+        # Imported files are not retried
+        watcher.record_items(self.panel_file, [])
+        self.assertEqual(watcher.changed_files(now=102 + MAX_RETRY_DELAY), [])
+
+    def test_changed_items(self):
+        """Test whether only the items changed since the last import are returned"""
+
+        overview = read_overview()
+        watcher = PanelWatcher(self.tmpdir)
+
+        items = list(prepare_panel_items(overview, (6, 8)))
+        self.assertEqual(watcher.changed_items(self.panel_file, items), items)
+        watcher.record_items(self.panel_file, items)
+        self.assertEqual(watcher.changed_items(self.panel_file, items), [])
+
+        overview['visualizations'][0]['value']['title'] = "Edited"
+        items = list(prepare_panel_items(overview, (6, 8)))
+        changed = watcher.changed_items(self.panel_file, items)
+        self.assertEqual([item[1] for item in changed], ["visualization:" + overview['visualizations'][0]['id']])
+
+        # Forgotten files are imported again
+        watcher.forget(self.panel_file)
+        self.assertEqual(watcher.changed_items(self.panel_file, items), items)
+
+    def test_wrong_panels(self):
+        """Test whether panels with a wrong shape are reported without stopping the rest of imports"""
+
+        wrong_panels = {"no-value.json": {"dashboard": {"id": "Wrong"}},
+                        "no-list.json": {"dashboard": {"id": "Wrong", "value": {"title": "Wrong", "panelsJSON": "[]"}},
+                                         "visualizations": {"id": "git_main_numbers"}}}
+        for name, panel in wrong_panels.items():
+            with open(os.path.join(self.tmpdir, name), 'w') as f:
+                json.dump(panel, f)
+
+        # The watch stops after the first scan
+        with FakeElastic() as elastic, unittest.mock.patch('kidash.watch.time.sleep', side_effect=KeyboardInterrupt):
+            with self.assertLogs('kidash.watch', level='ERROR') as logs:
+                watch_panels(elastic.url, elastic.url, self.tmpdir)
+            self.assertEqual(len(elastic.indices['.kibana']['docs']), 21)
+        clear_caches()
+
+        self.assertEqual(len(logs.output), len(wrong_panels))
+        for name in wrong_panels:
+            self.assertIn(name, "\n".join(logs.output))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    unittest.main(warnings='ignore')